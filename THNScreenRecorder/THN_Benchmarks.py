@@ -0,0 +1,1095 @@
+#!/usr/bin/python3
+"""This module benchmarks the recording pipeline using synthetic frames.
+
+The benchmarks use the 'synthetic' capture backend so they can be run on a
+machine without a display, results are printed as a table to the console.
+
+Typical usage:
+
+    Compare the capture cost and size of each frame cache mode:
+
+    python -m THNScreenRecorder.THN_Benchmarks cache --seconds 10
+
+    Compare the frame pacing of capturing on a thread and in a process:
+
+    python -m THNScreenRecorder.THN_Benchmarks capture --seconds 10
+
+    Compare the PIL and numpy compositing of output frames:
+
+    python -m THNScreenRecorder.THN_Benchmarks composite
+
+    Compare the encode time and file size of the output codecs:
+
+    python -m THNScreenRecorder.THN_Benchmarks codecs --frames 30
+
+    Compare the speed and quality of each resize quality on sample captures:
+
+    python -m THNScreenRecorder.THN_Benchmarks resize --capture-sizes 2560x1440
+
+    Compare converting a clip with the thread pool and the process pool:
+
+    python -m THNScreenRecorder.THN_Benchmarks processing --seconds 10
+
+    Compare writing striped and tiled TIFFs for a short and a long clip:
+
+    python -m THNScreenRecorder.THN_Benchmarks tiling --clip-seconds 1 10
+
+    Compare the wait after stopping when frames are processed afterwards,
+    during pauses or while recording:
+
+    python -m THNScreenRecorder.THN_Benchmarks streaming --seconds 10
+
+    Measure the memory allocated for each frame by the capture and convert:
+
+    python -m THNScreenRecorder.THN_Benchmarks memory --width 2560 --height 1440
+"""
+
+import io
+import os
+import sys
+import time
+import shutil
+import argparse
+import tempfile
+import threading
+import tracemalloc
+
+import cv2
+import psutil
+import numpy as np
+from PIL import Image, ImageDraw, ImageFont
+from tifffile import imread
+from PySide6.QtCore import Qt, QPoint, QThreadPool
+
+from THNScreenRecorder.THN_ImageCapture import ImageCapture
+from THNScreenRecorder.THN_CaptureProcess import (CaptureProcess,
+                                                  start_standby_process)
+from THNScreenRecorder.THN_FrameCache import FrameCacheReader
+from THNScreenRecorder.THN_CaptureBackends import SyntheticBackend
+from THNScreenRecorder.THN_OverlayCache import create_overlay
+from THNScreenRecorder.THN_ImageProcessing import (THREADS, PROCESSES,
+                                                   PIPELINE, TILED_AUTO,
+                                                   TILED_ON, TILED_OFF,
+                                                   ImageProcessor,
+                                                   get_canvas, composite_frame,
+                                                   transform_frame)
+from THNScreenRecorder.THN_FrameArena import get_thread_arena
+from THNScreenRecorder.THN_OutputCodecs import (DEFAULT_CODEC, PngCodec,
+                                                create_output_codec)
+from THNScreenRecorder.THN_ScalingPlan import (RESIZE_QUALITIES, ScalingPlan,
+                                               get_output_resolution)
+from THNScreenRecorder.THN_FileManagement import (IMAGE_RES, create_folder,
+                                                  get_scaled_size)
+
+# Number of seconds the process capture mode waits for its standby process.
+STANDBY_WAIT = 3.
+
+# Output codecs compared by the codecs benchmark, in the format (codec,
+# compression, level, predictor).
+BENCHMARK_CODECS = [
+    ('tiff', 'none', None, False),
+    ('tiff', 'lzw', None, False),
+    ('tiff', 'lzw', None, True),
+    ('tiff', 'deflate', None, False),
+    ('tiff', 'deflate', 1, False),
+    ('tiff', 'deflate', 1, True),
+    ('tiff', 'zstd', 1, False),
+    ('tiff', 'zstd', 3, True),
+    ('png', None, 1, False),
+    ('png', None, 3, False),
+]
+
+# Capture sizes compared by the resize benchmark, a mild, a medium, an ultra
+# wide and an exactly halved reduction to the default output resolution.
+RESIZE_CAPTURE_SIZES = ['2048x1152', '2560x1440', '3440x1440', '3840x2160']
+
+# Number of times larger than the capture the sample screens are drawn, the
+# capture and the reference are both shrunk from the same drawing.
+SAMPLE_SUPERSAMPLING = 3
+
+# Number of seconds between samples of the resident memory of the process.
+RSS_INTERVAL = 0.01
+
+# Frame cache modes compared by the cache benchmark.
+CACHE_MODES = {
+    'raw': {'compression': 'none', 'ring_size_mb': 0},
+    'zlib': {'compression': 'zlib', 'level': 1, 'ring_size_mb': 0},
+    'zlib-delta': {'compression': 'zlib', 'level': 1, 'delta': True,
+                   'ring_size_mb': 0},
+    'ring': {'compression': 'none', 'ring_size_mb': 1024},
+}
+
+
+def print_table(title, rows):
+    """Prints a list of result Dicts as a table.
+
+    Args:
+        title: String printed above the table.
+        rows: List of Dicts which all share the same keys.
+    """
+
+    print(f'\n{title}')
+    if not rows:
+        return
+    columns = list(rows[0].keys())
+    cells = [[f'{row[c]:.2f}' if isinstance(row[c], float) else str(row[c])
+              for c in columns] for row in rows]
+    widths = [max(len(c), *(len(r[i]) for r in cells))
+              for i, c in enumerate(columns)]
+    print('  '.join(c.ljust(w) for c, w in zip(columns, widths)))
+    for r in cells:
+        print('  '.join(v.ljust(w) for v, w in zip(r, widths)))
+
+
+def record_synthetic_clip(folder, seconds, size=(1400, 900), fps=15,
+                          **capture_settings):
+    """Records synthetic frames to a frame cache for a number of seconds.
+
+    Args:
+        folder: String for the cache folder the frames are written to.
+        seconds: Float for how long to record for.
+        size: Tuple for the (width, height) of the captured region.
+        fps: Integer for the capture frame rate.
+        **capture_settings: Extra keyword arguments passed to ImageCapture.
+
+    Returns:
+        Dict of the capture rate, CPU time and bytes written, and the
+        ImageCapture used. Its frame ring should be released once the frames
+        have been read.
+    """
+
+    create_folder(folder)
+    capture = ImageCapture(size[0], size[1], QPoint(0, 0), 'benchmark', fps,
+                           backend='synthetic', cache_folder=folder,
+                           **capture_settings)
+    thread = threading.Thread(target=capture.run)
+
+    cpu_start = time.process_time()
+    thread.start()
+    time.sleep(seconds)
+    capture.stop_capture()
+    thread.join()
+    cpu_time = time.process_time() - cpu_start
+
+    clock_stats = capture.clock.stats()
+    frames = max(capture.frame_cache.frames_written, 1)
+    bytes_written = capture.frame_cache.bytes_written
+    return {'frames': capture.frame_cache.frames_written,
+            'capture_fps': clock_stats['achieved_fps'],
+            'dropped': (clock_stats['dropped_frames']
+                        + capture.writer.frames_dropped),
+            'cpu_ms/frame': cpu_time * 1000 / frames,
+            'cpu_%': cpu_time * 100 / seconds,
+            'in_ring': capture.frame_cache.ring_frames,
+            'MB_written': bytes_written / 1024 ** 2,
+            'KB/frame': bytes_written / 1024 / frames}, capture
+
+
+def read_clip(folder):
+    """Reads back every frame of a frame cache.
+
+    Args:
+        folder: String for the cache folder to read.
+
+    Returns:
+        Float for the number of milliseconds taken to read each frame.
+    """
+
+    reader = FrameCacheReader(folder)
+    start = time.perf_counter()
+    for frame in reader:
+        # Touch every pixel so mapped pages are actually read.
+        frame.max()
+    duration = time.perf_counter() - start
+    frames = max(len(reader), 1)
+    reader.close()
+    return duration * 1000 / frames
+
+
+def benchmark_cache_modes(seconds=10., size=(1400, 900), fps=15, root=None):
+    """Compares the capture cost of each of the frame cache modes.
+
+    Args:
+        seconds: Float for how long each mode records for.
+        size: Tuple for the (width, height) of the captured region.
+        fps: Integer for the capture frame rate.
+        root: String for the folder the caches are written to, a temporary
+            folder is used and removed afterwards if not set.
+
+    Returns:
+        List of result Dicts, one for each mode.
+    """
+
+    temp_root = root is None
+    root = root or tempfile.mkdtemp(prefix='thn_benchmark_')
+    results = []
+    try:
+        for mode, settings in CACHE_MODES.items():
+            folder = os.path.join(root, mode)
+            result = {'mode': mode}
+            capture_result, capture = record_synthetic_clip(
+                folder, seconds, size, fps, **settings)
+            result.update(capture_result)
+            result['read_ms/frame'] = read_clip(folder)
+            capture.release_frame_ring()
+            results.append(result)
+    finally:
+        if temp_root:
+            shutil.rmtree(root, ignore_errors=True)
+    return results
+
+
+def hold_gil(stop):
+    """Keeps the GIL busy with pure Python work until 'stop' is set."""
+
+    while not stop.is_set():
+        sum(i * i for i in range(10000))
+
+
+def benchmark_capture_modes(seconds=10., size=(1400, 900), fps=15, root=None):
+    """Compares the frame pacing of the thread and process capture modes.
+
+    Each mode is recorded on its own and again while another thread of the
+    UI process holds the GIL, as UI repaints or processing would.
+
+    Args:
+        seconds: Float for how long each mode records for.
+        size: Tuple for the (width, height) of the captured region.
+        fps: Integer for the capture frame rate.
+        root: String for the folder the caches are written to, a temporary
+            folder is used and removed afterwards if not set.
+
+    Returns:
+        List of result Dicts, one for each mode and load.
+    """
+
+    temp_root = root is None
+    root = root or tempfile.mkdtemp(prefix='thn_benchmark_')
+    results = []
+    try:
+        for mode, capture_class in (('thread', ImageCapture),
+                                    ('process', CaptureProcess)):
+            for gil_load in (False, True):
+                folder = os.path.join(root, f'{mode}_{gil_load}')
+                create_folder(folder)
+                if capture_class is CaptureProcess:
+                    # Give the standby process time to load, as it would
+                    # have in the UI before the record button is pressed.
+                    start_standby_process()
+                    time.sleep(STANDBY_WAIT)
+                capture = capture_class(size[0], size[1], QPoint(0, 0),
+                                        'benchmark', fps, backend='synthetic',
+                                        cache_folder=folder)
+                stop_load = threading.Event()
+                load_thread = threading.Thread(target=hold_gil,
+                                               args=(stop_load,))
+                if gil_load:
+                    load_thread.start()
+                capture_thread = threading.Thread(target=capture.run)
+                capture_thread.start()
+                time.sleep(seconds)
+                capture.stop_capture()
+                capture_thread.join()
+                stop_load.set()
+                if gil_load:
+                    load_thread.join()
+                capture.release_frame_ring()
+
+                stats = capture.capture_stats()
+                results.append({'mode': mode,
+                                'gil_load': gil_load,
+                                'frames': stats['frames'],
+                                'capture_fps': stats['achieved_fps'],
+                                'late': stats['late_frames'],
+                                'dropped': (stats['dropped_frames']
+                                            + stats['queue_dropped']),
+                                'mean_late_ms': stats['mean_lateness_ms'],
+                                'jitter_ms': stats['jitter_ms'],
+                                'max_late_ms': stats['max_lateness_ms']})
+    finally:
+        if temp_root:
+            shutil.rmtree(root, ignore_errors=True)
+    return results
+
+
+def create_test_swatches(resolution=IMAGE_RES, width=80):
+    """Creates an overlay of semi transparent swatches down each side.
+
+    Args:
+        resolution: Tuple for the (width, height) of the output frame.
+        width: Integer for the width of each column of swatches.
+
+    Returns:
+        PIL image object in RGBA mode.
+    """
+
+    swatches = np.zeros((resolution[1], resolution[0], 4), dtype=np.uint8)
+    num_swatches = 8
+    swatch_height = resolution[1] // num_swatches
+    for i in range(num_swatches):
+        value = i * 255 // (num_swatches - 1)
+        rows = slice(i * swatch_height, (i + 1) * swatch_height)
+        for columns in (slice(0, width), slice(-width, None)):
+            swatches[rows, columns] = (value, value, value, 200)
+    return Image.fromarray(swatches, 'RGBA')
+
+
+def composite_with_pil(image, swatches):
+    """Composites an output frame the way it was done before using PIL.
+
+    Args:
+        image: Numpy array of the RGB frame, no larger than the output frame.
+        swatches: PIL image object of the overlay.
+
+    Returns:
+        Numpy array of the output frame.
+    """
+
+    output_frame = Image.new('RGB', (IMAGE_RES[0], IMAGE_RES[1]))
+    image_resized = Image.fromarray(np.ascontiguousarray(image))
+    new_w, new_h = image_resized.size
+    offset = ((IMAGE_RES[0] - new_w) // 2, (IMAGE_RES[1] - new_h) // 2)
+    output_frame.paste(image_resized, offset)
+    output_frame.paste(swatches, (0, 0), mask=swatches)
+    return np.asarray(output_frame)
+
+
+def benchmark_compositing(frames=100, size=(1400, 900)):
+    """Compares compositing output frames with PIL and with numpy.
+
+    Args:
+        frames: Integer for the number of frames composited by each path.
+        size: Tuple for the (width, height) of the captured frames.
+
+    Returns:
+        List of result Dicts, one for each path.
+    """
+
+    backend = SyntheticBackend((0, 0, size[0], size[1]))
+    backend.open()
+    images = [cv2.cvtColor(backend.grab(), cv2.COLOR_BGRA2RGB)
+              for _ in range(min(frames, 30))]
+    backend.close()
+    # Both paths composite frames that have already been resized to fit.
+    new_size = get_scaled_size(*size)
+    if new_size != size:
+        images = [cv2.resize(image, new_size, interpolation=cv2.INTER_AREA)
+                  for image in images]
+    swatches = create_test_swatches()
+    overlay = create_overlay(swatches)
+
+    def composite_numpy(image):
+        return composite_frame(image, get_canvas(), overlay)
+
+    paths = {'pil': lambda image: composite_with_pil(image, swatches),
+             'numpy': composite_numpy}
+
+    # Check the two paths agree before timing them.
+    reference = composite_with_pil(images[0], swatches).astype(np.int16)
+    max_difference = int(np.abs(composite_numpy(images[0]) - reference).max())
+
+    results = []
+    for name, composite in paths.items():
+        start = time.perf_counter()
+        for i in range(frames):
+            composite(images[i % len(images)])
+        duration = time.perf_counter() - start
+        results.append({'path': name,
+                        'frames/s': frames / duration,
+                        'ms/frame': duration * 1000 / frames,
+                        'max_difference': max_difference})
+    return results
+
+
+def create_output_frames(frames=30, size=(1400, 900)):
+    """Creates output frames the same way a recording is converted.
+
+    Args:
+        frames: Integer for the number of frames to create.
+        size: Tuple for the (width, height) of the captured frames.
+
+    Returns:
+        List of numpy arrays of the RGB output frames with swatches.
+    """
+
+    overlay = create_overlay(create_test_swatches())
+    backend = SyntheticBackend((0, 0, size[0], size[1]))
+    backend.open()
+    output_frames = [transform_frame(num, backend.grab(), overlay).copy()
+                     for num in range(frames)]
+    backend.close()
+    return output_frames
+
+
+def decode_output(codec, data):
+    """Decodes an image file encoded by an output codec.
+
+    Args:
+        codec: OutputCodec the image was encoded with.
+        data: Bytes of the encoded image file.
+
+    Returns:
+        Numpy array of the RGB image.
+    """
+
+    if isinstance(codec, PngCodec):
+        image = cv2.imdecode(np.frombuffer(data, dtype=np.uint8),
+                             cv2.IMREAD_COLOR)
+        return cv2.cvtColor(image, cv2.COLOR_BGR2RGB)
+    return imread(io.BytesIO(data))
+
+
+def benchmark_codecs(frames=30, size=(1400, 900)):
+    """Compares the encode time and size of each of the output codecs.
+
+    Every codec encodes the same output frames, created from synthetic
+    captures with the swatches overlaid, and each file is decoded again to
+    check the codec is lossless.
+
+    Args:
+        frames: Integer for the number of frames encoded by each codec.
+        size: Tuple for the (width, height) of the captured frames.
+
+    Returns:
+        List of result Dicts, one for each codec.
+    """
+
+    output_frames = create_output_frames(frames, size)
+    raw_bytes = output_frames[0].nbytes
+    results = []
+    for name, compression, level, predictor in BENCHMARK_CODECS:
+        codec = create_output_codec(name, compression, level, predictor)
+        label = codec.label()
+        if codec is DEFAULT_CODEC and label != 'tiff-deflate':
+            # The codec wasn't available and fell back to the default.
+            continue
+        # The first encode loads any codec libraries before timing.
+        codec.encode(output_frames[0])
+        total_bytes = 0
+        start = time.perf_counter()
+        encoded = []
+        for output_frame in output_frames:
+            data = codec.encode(output_frame, 'benchmark')
+            total_bytes += len(data)
+            encoded.append(data)
+        duration = time.perf_counter() - start
+        lossless = all(np.array_equal(decode_output(codec, data), frame)
+                       for data, frame in zip(encoded, output_frames))
+        results.append({'codec': label,
+                        'ms/frame': duration * 1000 / frames,
+                        'KB/frame': total_bytes / 1024 / frames,
+                        'ratio': raw_bytes * frames / total_bytes,
+                        'lossless': lossless})
+    return results
+
+
+def create_sample_screen(size, supersampling=SAMPLE_SUPERSAMPLING):
+    """Draws a screen like a viewport with a panel of text beside it.
+
+    The screen is drawn larger than it's captured so it can be shrunk to any
+    size with area filtering, which matches how a screen of that size would
+    have drawn it.
+
+    Args:
+        size: Tuple for the (width, height) of the capture.
+        supersampling: Integer for how many times larger the screen is drawn.
+
+    Returns:
+        Numpy array of the RGB screen.
+    """
+
+    width, height = size[0] * supersampling, size[1] * supersampling
+    rng = np.random.default_rng(0)
+    screen = np.empty((height, width, 3), dtype=np.uint8)
+    # Gradients with fine noise stand in for a render in the viewport.
+    screen[..., 0] = np.linspace(0, 150, width, dtype=np.float32)
+    screen[..., 1] = np.linspace(0, 150, height, dtype=np.float32)[:, None]
+    screen[..., 2] = 90
+    screen += rng.integers(0, 24, screen.shape, dtype=np.uint8)
+
+    image = Image.fromarray(screen)
+    draw = ImageDraw.Draw(image)
+    font = ImageFont.load_default(12 * supersampling)
+    line_width = supersampling
+    for row, top in enumerate(range(0, height, 22 * supersampling)):
+        draw.text((10 * supersampling, top),
+                  f'Outliner  shot_{row:03d}_lookdev_v012  exposure +1.5',
+                  fill=(235, 235, 235), font=font)
+    # A wireframe grid and a circle fill the viewport on the right.
+    for left in range(width // 2, width, 7 * supersampling):
+        draw.line((left, 0, left, height), fill=(15, 15, 15), width=line_width)
+    for top in range(0, height, 9 * supersampling):
+        draw.line((width // 2, top, width, top), fill=(250, 250, 250),
+                  width=line_width)
+    draw.ellipse((width // 4, height // 4, width // 2, height * 3 // 4),
+                 outline=(255, 200, 40), width=line_width * 2)
+    return np.asarray(image)
+
+
+def measure_ssim(image, reference):
+    """Returns the mean structural similarity of two images.
+
+    Uses the usual 11x11 Gaussian window with a sigma of 1.5 over every
+    channel, 1.0 means the images are the same.
+
+    Args:
+        image: Numpy array of the image being measured.
+        reference: Numpy array of the image it's compared to.
+
+    Returns:
+        Float for the mean SSIM.
+    """
+
+    image = image.astype(np.float32)
+    reference = reference.astype(np.float32)
+    c1, c2 = (0.01 * 255) ** 2, (0.03 * 255) ** 2
+
+    def blur(values):
+        return cv2.GaussianBlur(values, (11, 11), 1.5)
+
+    mean_i, mean_r = blur(image), blur(reference)
+    var_i = blur(image * image) - mean_i * mean_i
+    var_r = blur(reference * reference) - mean_r * mean_r
+    covariance = blur(image * reference) - mean_i * mean_r
+    ssim = (((2 * mean_i * mean_r + c1) * (2 * covariance + c2))
+            / ((mean_i * mean_i + mean_r * mean_r + c1) * (var_i + var_r + c2)))
+    return float(ssim.mean())
+
+
+def measure_psnr(image, reference):
+    """Returns the peak signal to noise ratio of an image in decibels."""
+
+    error = np.mean((image.astype(np.float64) - reference) ** 2)
+    if not error:
+        return float('inf')
+    return float(10 * np.log10(255 ** 2 / error))
+
+
+def benchmark_resize(capture_sizes=RESIZE_CAPTURE_SIZES, frames=20,
+                     resolution=IMAGE_RES):
+    """Compares the speed and quality of each resize quality.
+
+    Each sample screen is shrunk to the capture size and to the output size
+    from the same large drawing. The captured screen is then scaled to the
+    output size by every resize quality and compared to the output size
+    drawing, as well as by the Lanczos filter used before the quality could
+    be chosen.
+
+    Args:
+        capture_sizes: List of Strings for each capture size to compare, in
+            the format 'WIDTHxHEIGHT'.
+        frames: Integer for the number of frames timed for each quality.
+        resolution: Tuple for the (width, height) of the output frames.
+
+    Returns:
+        List of result Dicts, one for each capture size and quality.
+    """
+
+    results = []
+    for capture_size in capture_sizes:
+        size = get_output_resolution(capture_size, None)
+        if size is None:
+            continue
+        screen = create_sample_screen(size)
+        capture = cv2.resize(screen, size, interpolation=cv2.INTER_AREA)
+        plans = {quality: ScalingPlan(*size, resolution, quality)
+                 for quality in RESIZE_QUALITIES}
+        if not plans[RESIZE_QUALITIES[0]].resize:
+            continue
+        output_size = plans[RESIZE_QUALITIES[0]].size
+        reference = cv2.resize(screen, output_size,
+                               interpolation=cv2.INTER_AREA).astype(np.float64)
+        del screen
+
+        def lanczos(image):
+            return cv2.resize(image, output_size,
+                              interpolation=cv2.INTER_LANCZOS4)
+
+        paths = [(quality, plan.describe(), plan.scale_frame)
+                 for quality, plan in plans.items()]
+        paths.append(('before', 'lanczos only', lanczos))
+        for quality, filters, scale in paths:
+            output = scale(capture)
+            start = time.perf_counter()
+            for _ in range(frames):
+                scale(capture)
+            elapsed = time.perf_counter() - start
+            results.append({
+                'capture': capture_size,
+                'quality': quality,
+                'filters': filters,
+                'ms/frame': elapsed / frames * 1000,
+                'PSNR dB': measure_psnr(output, reference),
+                'SSIM': f'{measure_ssim(output, reference):.4f}',
+            })
+    return results
+
+
+def process_clip(folder, output, swatch_file=None, **processor_settings):
+    """Converts a frame cache to an image sequence with ImageProcessor.
+
+    Args:
+        folder: String for the frame cache folder to convert.
+        output: String for the folder the image sequence is written to.
+        swatch_file: String to the full file path of the swatch image.
+        **processor_settings: Extra keyword arguments passed to
+            ImageProcessor.
+
+    Returns:
+        Dict of the time taken and the rate frames were converted at, and the
+        ImageProcessor used.
+    """
+
+    create_folder(output)
+    frames = FrameCacheReader(folder)
+    processor = ImageProcessor(0, frames, os.path.join(output, 'benchmark'),
+                               'benchmark', swatch_file, **processor_settings)
+    progress_updates = []
+    processor.signals.progress.connect(progress_updates.append)
+
+    cpu_start = time.process_time()
+    start = time.perf_counter()
+    # The processor blocks until every frame has been converted.
+    processor.run()
+    duration = time.perf_counter() - start
+    cpu_time = time.process_time() - cpu_start
+    frames.close()
+
+    result = {'frames': processor.num_frames,
+              'seconds': duration,
+              'frames/s': processor.num_frames / duration,
+              'ui_cpu_%': cpu_time * 100 / duration,
+              'progress_updates': len(progress_updates)}
+    return result, processor
+
+
+def benchmark_processing(seconds=10., size=(1400, 900), fps=15, root=None,
+                         pool_sizes=(None,)):
+    """Compares converting a synthetic clip with threads and processes.
+
+    Args:
+        seconds: Float for the length of the synthetic clip.
+        size: Tuple for the (width, height) of the captured region.
+        fps: Integer for the capture frame rate.
+        root: String for the folder the files are written to, a temporary
+            folder is used and removed afterwards if not set.
+        pool_sizes: List of the number of worker processes to compare, None
+            uses the number of CPU cores.
+
+    Returns:
+        List of result Dicts, one for each backend, and a List of the
+        statistics of each stage of the pipeline.
+    """
+
+    temp_root = root is None
+    root = root or tempfile.mkdtemp(prefix='thn_benchmark_')
+    results = []
+    try:
+        # Every frame is stored so the backends convert the same frames.
+        folder = os.path.join(root, 'cache')
+        _, capture = record_synthetic_clip(folder, seconds, size, fps,
+                                           skip_duplicates=False)
+        swatch_file = os.path.join(root, 'swatches.tga')
+        create_test_swatches().save(swatch_file)
+
+        runs = ([(THREADS, None)] + [(PROCESSES, n) for n in pool_sizes]
+                + [(PIPELINE, n) for n in pool_sizes])
+        stage_stats = []
+        for i, (backend, pool_size) in enumerate(runs):
+            output = os.path.join(root, f'output_{i}')
+            workers = pool_size or os.cpu_count()
+            if backend == THREADS:
+                workers = QThreadPool.globalInstance().maxThreadCount()
+            result = {'backend': backend, 'workers': workers}
+            clip_result, processor = process_clip(folder, output, swatch_file,
+                                                  backend=backend,
+                                                  pool_size=pool_size)
+            result.update(clip_result)
+            results.append(result)
+            if processor.pipeline is not None:
+                stage_stats.extend({'cpu_threads': workers, **stage}
+                                   for stage in processor.pipeline.stats())
+            shutil.rmtree(output, ignore_errors=True)
+        capture.release_frame_ring()
+    finally:
+        if temp_root:
+            shutil.rmtree(root, ignore_errors=True)
+    return results, stage_stats
+
+
+def benchmark_tiling(clip_seconds=(1., 10.), size=(1400, 900), fps=15,
+                     root=None, backend=THREADS):
+    """Compares converting clips to striped and tiled TIFFs.
+
+    Each clip is converted with tiling off, forced on and chosen
+    automatically from the number of frames encoded at once and the number
+    of CPU cores.
+
+    Args:
+        clip_seconds: List of the lengths in seconds of the clips to convert.
+        size: Tuple for the (width, height) of the captured region.
+        fps: Integer for the capture frame rate.
+        root: String for the folder the files are written to, a temporary
+            folder is used and removed afterwards if not set.
+        backend: String for the ImageProcessor backend.
+
+    Returns:
+        List of result Dicts, one for each clip and tiling mode.
+    """
+
+    temp_root = root is None
+    root = root or tempfile.mkdtemp(prefix='thn_benchmark_')
+    results = []
+    try:
+        swatch_file = os.path.join(root, 'swatches.tga')
+        create_test_swatches().save(swatch_file)
+        for i, seconds in enumerate(clip_seconds):
+            folder = os.path.join(root, f'cache_{i}')
+            _, capture = record_synthetic_clip(folder, seconds, size, fps)
+            for mode in (TILED_OFF, TILED_ON, TILED_AUTO):
+                output = os.path.join(root, f'output_{i}_{mode}')
+                clip_result, processor = process_clip(
+                    folder, output, swatch_file, backend=backend,
+                    tiled_output=mode)
+                results.append({'clip_s': seconds, 'tiling': mode,
+                                'codec': processor.codec.label(),
+                                'frames': clip_result['frames'],
+                                'seconds': clip_result['seconds'],
+                                'frames/s': clip_result['frames/s']})
+                shutil.rmtree(output, ignore_errors=True)
+            capture.release_frame_ring()
+    finally:
+        if temp_root:
+            shutil.rmtree(root, ignore_errors=True)
+    return results
+
+
+def stream_synthetic_clip(folder, output, seconds, size, fps, swatch_file,
+                          backend=THREADS, pause_only=False):
+    """Records a synthetic clip while a streaming ImageProcessor converts it.
+
+    The recording is paused for the middle third of the clip, a processor
+    that only converts frames during pauses does all of its work there.
+
+    Args:
+        folder: String for the cache folder the frames are written to.
+        output: String for the folder the image sequence is written to.
+        seconds: Float for how long to record for, including the pause.
+        size: Tuple for the (width, height) of the captured region.
+        fps: Integer for the capture frame rate.
+        swatch_file: String to the full file path of the swatch image.
+        backend: String for the ImageProcessor backend.
+        pause_only: Boolean for if frames are only converted during pauses.
+
+    Returns:
+        Dict of the capture rate, the frames converted during each part of
+        the recording and the time taken once the recording was stopped.
+    """
+
+    create_folder(folder)
+    create_folder(output)
+    capture = ImageCapture(size[0], size[1], QPoint(0, 0), 'benchmark', fps,
+                           backend='synthetic', cache_folder=folder)
+    cache_opened = threading.Event()
+    # There is no event loop to deliver a queued signal to.
+    capture.signals.cache_opened.connect(lambda _: cache_opened.set(),
+                                         Qt.DirectConnection)
+    capture_thread = threading.Thread(target=capture.run)
+    capture_thread.start()
+    cache_opened.wait()
+
+    frames = FrameCacheReader(folder)
+    processor = ImageProcessor(0, frames, os.path.join(output, 'benchmark'),
+                               'benchmark', swatch_file, backend=backend,
+                               streaming=True, pause_only=pause_only)
+    process_thread = threading.Thread(target=processor.run)
+    process_thread.start()
+
+    time.sleep(seconds / 3)
+    capture.capturing_paused = True
+    processor.set_capture_paused(True)
+    paused_at = processor.counter.frames
+    time.sleep(seconds / 3)
+    processor.set_capture_paused(False)
+    capture.capturing_paused = False
+    resumed_at = processor.counter.frames
+    time.sleep(seconds / 3)
+    stopped_at = processor.counter.frames
+    capture.stop_capture()
+    capture_thread.join()
+    processor.recording_finished()
+    process_thread.join()
+    after_stop = time.perf_counter() - processor.stopped_at
+    frames.close()
+    capture.release_frame_ring()
+
+    clock_stats = capture.clock.stats()
+    return {'frames': processor.num_frames,
+            'capture_fps': clock_stats['achieved_fps'],
+            'late': clock_stats['late_frames'],
+            'dropped': (clock_stats['dropped_frames']
+                        + capture.writer.frames_dropped),
+            'in_ring': capture.frame_cache.ring_frames,
+            'converted_recording': paused_at + stopped_at - resumed_at,
+            'converted_paused': resumed_at - paused_at,
+            'seconds_after_stop': after_stop}
+
+
+def benchmark_streaming(seconds=10., size=(1400, 900), fps=15, root=None,
+                        backend=THREADS):
+    """Compares processing a clip after recording with processing it live.
+
+    Each recording is paused for the middle third of the clip.
+
+    Args:
+        seconds: Float for the length of the synthetic recording.
+        size: Tuple for the (width, height) of the captured region.
+        fps: Integer for the capture frame rate.
+        root: String for the folder the files are written to, a temporary
+            folder is used and removed afterwards if not set.
+        backend: String for the ImageProcessor backend used for every run.
+
+    Returns:
+        List of result Dicts, one for each mode.
+    """
+
+    temp_root = root is None
+    root = root or tempfile.mkdtemp(prefix='thn_benchmark_')
+    results = []
+    try:
+        swatch_file = os.path.join(root, 'swatches.tga')
+        create_test_swatches().save(swatch_file)
+
+        # Batch processing only starts once the recording has stopped, the
+        # pause is left out as the clip is the same length either way.
+        folder = os.path.join(root, 'cache_batch')
+        capture_result, capture = record_synthetic_clip(folder,
+                                                        seconds * 2 / 3, size,
+                                                        fps)
+        clip_result, _ = process_clip(folder, os.path.join(root, 'output_0'),
+                                      swatch_file, backend=backend)
+        capture.release_frame_ring()
+        results.append({'mode': 'after recording',
+                        'frames': clip_result['frames'],
+                        'capture_fps': capture_result['capture_fps'],
+                        'late': '-',
+                        'dropped': capture_result['dropped'],
+                        'in_ring': capture_result['in_ring'],
+                        'converted_recording': 0,
+                        'converted_paused': 0,
+                        'seconds_after_stop': clip_result['seconds']})
+
+        # Streaming processes the cache while the capture is writing to it.
+        for i, (mode, pause_only) in enumerate([('during pauses', True),
+                                                ('streaming', False)]):
+            result = stream_synthetic_clip(
+                os.path.join(root, f'cache_{mode}'),
+                os.path.join(root, f'output_{i + 1}'), seconds, size, fps,
+                swatch_file, backend, pause_only)
+            results.append({'mode': mode, **result})
+    finally:
+        if temp_root:
+            shutil.rmtree(root, ignore_errors=True)
+    return results
+
+
+def measure_memory(function, *args, **kwargs):
+    """Runs a function while tracing its memory use.
+
+    Args:
+        function: Callable to measure.
+        *args: Arguments passed to the function.
+        **kwargs: Keyword arguments passed to the function.
+
+    Returns:
+        Tuple of the function's result, the peak megabytes traced by
+        tracemalloc and the peak growth in megabytes of the resident memory
+        of the process sampled with psutil.
+    """
+
+    process = psutil.Process()
+    start_rss = process.memory_info().rss
+    peak_rss = [start_rss]
+    stop = threading.Event()
+
+    def sample_rss():
+        while not stop.wait(RSS_INTERVAL):
+            peak_rss[0] = max(peak_rss[0], process.memory_info().rss)
+
+    sampler = threading.Thread(target=sample_rss, daemon=True)
+    sampler.start()
+    tracemalloc.start()
+    try:
+        result = function(*args, **kwargs)
+        peak_traced = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+        stop.set()
+        sampler.join()
+    return (result, peak_traced / 1024 ** 2,
+            (peak_rss[0] - start_rss) / 1024 ** 2)
+
+
+def transform_frames(images, overlay, channel_order, frames):
+    """Transforms frames while measuring the memory allocated by each.
+
+    Args:
+        images: List of numpy arrays of captured frames.
+        overlay: List of overlay strips created by 'create_overlay'.
+        channel_order: String for the order of the colour channels of the
+            frames, 'RGB' or 'BGRA'.
+        frames: Integer for the number of frames transformed.
+
+    Returns:
+        Float for the mean number of megabytes allocated while transforming a
+        frame, tracemalloc must be tracing.
+    """
+
+    total = 0
+    for num in range(frames):
+        tracemalloc.reset_peak()
+        start = tracemalloc.get_traced_memory()[0]
+        transform_frame(num, images[num % len(images)], overlay, channel_order)
+        allocated = tracemalloc.get_traced_memory()[1] - start
+        total += allocated
+    return total / frames / 1024 ** 2
+
+
+def benchmark_memory(seconds=10., size=(1400, 900), fps=15, root=None,
+                     frames=100):
+    """Measures the memory allocated by the capture and convert loops.
+
+    The capture records to the frame cache on disk so the frame ring's shared
+    memory isn't counted in the resident memory. The transform is measured
+    for frames captured as BGRA and for frames converted to RGB at capture.
+
+    Args:
+        seconds: Float for how long the capture records for.
+        size: Tuple for the (width, height) of the captured region.
+        fps: Integer for the capture frame rate.
+        root: String for the folder the cache is written to, a temporary
+            folder is used and removed afterwards if not set.
+        frames: Integer for the number of frames transformed.
+
+    Returns:
+        List of result Dicts, one for each loop measured.
+    """
+
+    temp_root = root is None
+    root = root or tempfile.mkdtemp(prefix='thn_benchmark_')
+    results = []
+    try:
+        (capture_result, capture), traced, rss = measure_memory(
+            record_synthetic_clip, os.path.join(root, 'memory'), seconds,
+            size, fps, skip_duplicates=False, ring_size_mb=0)
+        # Frames overlap in the writer queue so only the peak is measured.
+        results.append({'loop': 'capture', 'frames': capture_result['frames'],
+                        'MB/frame': '-',
+                        'peak_traced_MB': traced, 'peak_rss_MB': rss,
+                        'buffers_allocated': capture.frame_pool.allocations})
+    finally:
+        if temp_root:
+            shutil.rmtree(root, ignore_errors=True)
+
+    backend = SyntheticBackend((0, 0, size[0], size[1]))
+    backend.open()
+    bgra_images = [backend.grab().copy() for _ in range(4)]
+    backend.close()
+    overlay = create_overlay(create_test_swatches())
+    arena = get_thread_arena()
+    for channel_order, images in (
+            ('BGRA', bgra_images),
+            ('RGB', [cv2.cvtColor(image, cv2.COLOR_BGRA2RGB)
+                     for image in bgra_images])):
+        arena.clear()
+        start_allocations = arena.allocations
+        mean, traced, rss = measure_memory(
+            transform_frames, images, overlay, channel_order, frames)
+        results.append({'loop': f'transform {channel_order}',
+                        'frames': frames, 'MB/frame': mean,
+                        'peak_traced_MB': traced, 'peak_rss_MB': rss,
+                        'buffers_allocated': (arena.allocations
+                                              - start_allocations)})
+    return results
+
+
+def main(argv=None):
+    """Runs the benchmark chosen from the command line."""
+
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('benchmark', choices=['cache', 'capture', 'composite',
+                                              'codecs', 'resize', 'processing',
+                                              'tiling', 'streaming',
+                                              'memory'])
+    parser.add_argument('--seconds', type=float, default=10.)
+    parser.add_argument('--width', type=int, default=1400)
+    parser.add_argument('--height', type=int, default=900)
+    parser.add_argument('--fps', type=int, default=15)
+    parser.add_argument('--frames', type=int, default=100)
+    parser.add_argument('--backend', default=THREADS,
+                        choices=[THREADS, PROCESSES, PIPELINE],
+                        help='ImageProcessor backend for the streaming '
+                             'and tiling benchmarks.')
+    parser.add_argument('--clip-seconds', type=float, nargs='+',
+                        default=[1., 10.],
+                        help='Lengths of the clips the tiling benchmark '
+                             'converts.')
+    parser.add_argument('--capture-sizes', nargs='+',
+                        default=RESIZE_CAPTURE_SIZES,
+                        help='Capture sizes the resize benchmark scales to '
+                             'the output resolution, e.g. 2560x1440.')
+    parser.add_argument('--pool-sizes', type=int, nargs='+', default=[None],
+                        help='Number of worker processes to compare.')
+    parser.add_argument('--folder', default=None,
+                        help='Folder for temporary files, default is a temp '
+                             'folder that is removed afterwards.')
+    args = parser.parse_args(argv)
+    size = (args.width, args.height)
+
+    if args.benchmark == 'cache':
+        results = benchmark_cache_modes(args.seconds, size, args.fps,
+                                        args.folder)
+        print_table(f'Frame cache modes, {size[0]}x{size[1]} at {args.fps} fps',
+                    results)
+    elif args.benchmark == 'capture':
+        results = benchmark_capture_modes(args.seconds, size, args.fps,
+                                          args.folder)
+        print_table(f'Capture modes, {size[0]}x{size[1]} at {args.fps} fps',
+                    results)
+    elif args.benchmark == 'composite':
+        results = benchmark_compositing(args.frames, size)
+        print_table(f'Compositing {size[0]}x{size[1]} frames', results)
+    elif args.benchmark == 'codecs':
+        results = benchmark_codecs(args.frames, size)
+        print_table(f'Encoding output frames captured at {size[0]}x{size[1]}',
+                    results)
+    elif args.benchmark == 'resize':
+        results = benchmark_resize(args.capture_sizes, args.frames)
+        print_table(f'Resizing sample captures to {IMAGE_RES[0]}x'
+                    f'{IMAGE_RES[1]}', results)
+    elif args.benchmark == 'processing':
+        results, stage_stats = benchmark_processing(args.seconds, size,
+                                                    args.fps, args.folder,
+                                                    args.pool_sizes)
+        print_table(f'Processing a {args.seconds:g}s {size[0]}x{size[1]} clip',
+                    results)
+        print_table('Pipeline stages', stage_stats)
+    elif args.benchmark == 'tiling':
+        results = benchmark_tiling(args.clip_seconds, size, args.fps,
+                                   args.folder, args.backend)
+        print_table(f'Tiled output, {size[0]}x{size[1]} with {args.backend}, '
+                    f'{os.cpu_count()} CPU cores', results)
+    elif args.benchmark == 'streaming':
+        results = benchmark_streaming(args.seconds, size, args.fps,
+                                      args.folder, args.backend)
+        print_table(f'Streaming a {args.seconds:g}s {size[0]}x{size[1]} clip '
+                    f'with {args.backend}', results)
+    elif args.benchmark == 'memory':
+        results = benchmark_memory(args.seconds, size, args.fps, args.folder,
+                                   args.frames)
+        print_table(f'Memory allocated per frame, {size[0]}x{size[1]}',
+                    results)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,166 @@
+#!/usr/bin/python3
+"""This module writes captured frames to the cache on background threads."""
+
+import time
+import queue
+import threading
+
+from THNScreenRecorder.THN_FileManagement import LOGGER
+
+# Backpressure policies for when the queue of frames waiting to be written is
+# full, either the new frame is dropped or the capture thread waits.
+DROP = 'drop'
+BLOCK = 'block'
+
+
+class CacheWriter:
+    """Saves captured frames to disk without stalling the capture thread.
+
+    The capture thread pushes each frame on to a bounded queue which is
+    drained by one or more writer threads, so a slow disk flush doesn't delay
+    the next grab. When the queue is full the backpressure policy decides if
+    the frame is dropped, with the number of dropped frames being recorded, or
+    if the capture thread blocks until there is space.
+
+    Args:
+        write_frame: Callable used to save a frame, it's called with the frame
+            number, the numpy array of the frame and any extra values that
+            were queued with the frame.
+        num_writers: Integer for the number of writer threads.
+        max_queue: Integer for the maximum number of frames waiting in memory.
+        policy: String for the backpressure policy, 'drop' or 'block'.
+    """
+
+    # **************************************************************************
+    # Init
+    def __init__(self, write_frame, num_writers=2, max_queue=30, policy=DROP):
+        """Inits CacheWriter with class attributes."""
+
+        self.write_frame = write_frame
+        self.num_writers = max(int(num_writers), 1)
+        self.max_queue = max(int(max_queue), 1)
+        if policy not in (DROP, BLOCK):
+            log_txt = f'Unknown backpressure policy {policy}, using {DROP}'
+            LOGGER.warning(log_txt)
+            policy = DROP
+        self.policy = policy
+
+        self.frame_queue = queue.Queue(maxsize=self.max_queue)
+        self.writers = []
+        self.stats_lock = threading.Lock()
+
+        self.frames_queued = 0
+        self.frames_written = 0
+        self.frames_dropped = 0
+        self.write_errors = 0
+        self.peak_depth = 0
+        self.blocked_time = 0.
+        self.total_write_time = 0.
+        self.max_write_time = 0.
+
+    # **************************************************************************
+    # Funtions
+    def start(self):
+        """Starts the writer threads."""
+
+        for i in range(self.num_writers):
+            writer = threading.Thread(target=self.write_frames,
+                                      name=f'cache_writer_{i}', daemon=True)
+            writer.start()
+            self.writers.append(writer)
+
+    def put(self, num, frame, *args):
+        """Adds a frame to the queue of frames to be written to disk.
+
+        Args:
+            num: Integer for the frame number.
+            frame: Numpy array of the captured frame.
+            *args: Extra values passed on to 'write_frame', e.g. the time the
+                frame was captured.
+
+        Returns:
+            True if the frame was queued, False if it was dropped.
+        """
+
+        if self.policy == BLOCK:
+            start = time.perf_counter()
+            self.frame_queue.put((num, frame, args))
+            self.blocked_time += time.perf_counter() - start
+        else:
+            try:
+                self.frame_queue.put_nowait((num, frame, args))
+            except queue.Full:
+                self.frames_dropped += 1
+                return False
+
+        self.frames_queued += 1
+        self.peak_depth = max(self.peak_depth, self.frame_queue.qsize())
+        return True
+
+    def write_frames(self):
+        """Writer thread loop, saves frames until the queue is closed."""
+
+        while True:
+            item = self.frame_queue.get()
+            if item is None:
+                break
+            num, frame, args = item
+            start = time.perf_counter()
+            try:
+                self.write_frame(num, frame, *args)
+            except Exception as e:
+                # The writer keeps going, a capture blocked on a full queue
+                # would otherwise wait forever.
+                log_error = f'Error writing frame {num} to cache: {e!r}'
+                LOGGER.error(log_error)
+                with self.stats_lock:
+                    self.write_errors += 1
+                continue
+            write_time = time.perf_counter() - start
+            with self.stats_lock:
+                self.frames_written += 1
+                self.total_write_time += write_time
+                self.max_write_time = max(self.max_write_time, write_time)
+
+    def close(self):
+        """Waits for all queued frames to be written and stops the threads."""
+
+        for _ in self.writers:
+            self.frame_queue.put(None)
+        for writer in self.writers:
+            writer.join()
+        self.writers = []
+
+    def queue_depth(self):
+        """Returns the number of frames waiting to be written."""
+
+        return self.frame_queue.qsize()
+
+    def stats(self):
+        """Returns a Dict of the queue and write statistics."""
+
+        with self.stats_lock:
+            written = self.frames_written
+            mean_write = self.total_write_time / written if written else 0.
+            return {'frames_queued': self.frames_queued,
+                    'frames_written': written,
+                    'frames_dropped': self.frames_dropped,
+                    'write_errors': self.write_errors,
+                    'queue_depth': self.queue_depth(),
+                    'peak_queue_depth': self.peak_depth,
+                    'max_queue': self.max_queue,
+                    'blocked_ms': self.blocked_time * 1000,
+                    'mean_write_ms': mean_write * 1000,
+                    'max_write_ms': self.max_write_time * 1000}
+
+    def log_stats(self):
+        """Writes the queue and write statistics to the logger."""
+
+        stats = self.stats()
+        log_txt = (f'Cache writer wrote {stats["frames_written"]} frames, '
+                   f'{stats["frames_dropped"]} dropped, '
+                   f'peak queue {stats["peak_queue_depth"]}/{self.max_queue}, '
+                   f'write mean {stats["mean_write_ms"]:.1f}ms '
+                   f'max {stats["max_write_ms"]:.1f}ms, '
+                   f'blocked {stats["blocked_ms"]:.1f}ms')
+        LOGGER.info(log_txt)
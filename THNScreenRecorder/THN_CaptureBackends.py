@@ -0,0 +1,217 @@
+#!/usr/bin/python3
+"""This module contains the backends used to grab frames of the screen."""
+
+import mss
+import numpy as np
+
+from THNScreenRecorder.THN_FileManagement import LOGGER
+
+
+class CaptureBackend:
+    """Base class for the objects used by ImageCapture to grab frames.
+
+    A backend is opened once at the start of a recording and the same object
+    is used to grab every frame, it's only rebuilt when the area of the screen
+    being captured changes. Grabbed frames are returned as numpy arrays in
+    BGRA order with the shape (height, width, 4).
+
+    Args:
+        region: Tuple for the area of the screen to capture in the format
+            (left, top, width, height).
+        fps: Integer for the frame rate of the recording.
+    """
+
+    name = None
+
+    # **************************************************************************
+    # Init
+    def __init__(self, region, fps=15):
+        """Inits CaptureBackend with class attributes."""
+
+        self.region = tuple(region)
+        self.fps = fps
+        self.is_open = False
+
+    def __enter__(self):
+        self.open()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    # **************************************************************************
+    # Funtions
+    def open(self):
+        """Creates any resources needed to grab frames."""
+
+        self.is_open = True
+
+    def close(self):
+        """Releases any resources created when the backend was opened."""
+
+        self.is_open = False
+
+    def set_region(self, region):
+        """Changes the area of the screen being captured.
+
+        The backend is only rebuilt if the region is different to the one that
+        is currently being captured.
+
+        Args:
+            region: Tuple for the new area of the screen to capture in the
+                format (left, top, width, height).
+        """
+
+        region = tuple(region)
+        if region == self.region:
+            return
+        log_txt = f'Rebuilding {self.name} capture backend for region {region}'
+        LOGGER.info(log_txt)
+        was_open = self.is_open
+        if was_open:
+            self.close()
+        self.region = region
+        if was_open:
+            self.open()
+
+    def grab(self):
+        """Grabs a single frame of the current region.
+
+        Returns:
+            Numpy array of the frame in BGRA order.
+        """
+
+        raise NotImplementedError
+
+
+class MSSBackend(CaptureBackend):
+    """Grabs frames of the screen using the mss module.
+
+    The mss object, and the display handles it holds, are kept open for the
+    whole recording instead of being created for every frame. As the handles
+    can be tied to the thread that created them the backend should be opened
+    and used on the capture thread.
+    """
+
+    name = 'mss'
+
+    def open(self):
+        """Opens the mss object used to grab the screen."""
+
+        left, top, width, height = self.region
+        self.monitor = {'top': top, 'left': left, 'width': width,
+                        'height': height}
+        self.sct = mss.mss()
+        super().open()
+
+    def close(self):
+        """Closes the mss object and releases the display handles."""
+
+        if self.is_open:
+            self.sct.close()
+        super().close()
+
+    def grab(self):
+        """Grabs area of the screen to be saved to image sequence.
+
+        Returns:
+            Numpy array of the frame in BGRA order, the array uses the buffer
+            of the mss screenshot so no extra copy is made.
+        """
+
+        return np.asarray(self.sct.grab(self.monitor))
+
+
+class SyntheticBackend(CaptureBackend):
+    """Generates deterministic frames without needing a display.
+
+    The frames show a square orbiting over a fixed, lightly textured gradient
+    so they don't compress unrealistically well. Every other second the square
+    holds still to imitate an artist stopping to look at
+    the asset. The same frame number always produces the same image so the
+    whole pipeline can be run and benchmarked on a headless machine.
+    """
+
+    name = 'synthetic'
+
+    def __init__(self, region, fps=15):
+        """Inits SyntheticBackend with class attributes."""
+
+        super().__init__(region, fps)
+        self.frame_number = 0
+
+    def open(self):
+        """Creates the background gradient for the current region."""
+
+        _, _, width, height = self.region
+        x_ramp = np.linspace(0, 255, width, dtype=np.float32)
+        y_ramp = np.linspace(0, 255, height, dtype=np.float32)
+        self.background = np.empty((height, width, 4), dtype=np.uint8)
+        self.background[:, :, 0] = x_ramp[np.newaxis, :]
+        self.background[:, :, 1] = y_ramp[:, np.newaxis]
+        self.background[:, :, 2] = 128
+        self.background[:, :, 3] = 255
+        # Seeded noise gives every run the same texture.
+        noise = np.random.default_rng(0).integers(0, 8, (height, width, 3),
+                                                  dtype=np.uint8)
+        self.background[:, :, :3] //= 2
+        self.background[:, :, :3] += noise
+        self.square_size = max(min(width, height) // 6, 1)
+        # Every frame is drawn in to the same buffer.
+        self.frame = np.empty_like(self.background)
+        super().open()
+
+    def grab(self):
+        """Returns the next frame of the synthetic sequence.
+
+        Returns:
+            Numpy array of the frame in BGRA order, the array is reused by the
+            next grab so it must be copied or converted before then.
+        """
+
+        num = self.frame_number
+        self.frame_number += 1
+
+        # Hold the square still for every other second of footage.
+        second, frame_in_second = divmod(num, self.fps)
+        moving_frames = (second + 1) // 2 * self.fps
+        if second % 2 == 0:
+            moving_frames += frame_in_second
+        angle = moving_frames * 2 * np.pi / (self.fps * 4)
+
+        _, _, width, height = self.region
+        size = self.square_size
+        x = int((width - size) / 2 * (1 + 0.8 * np.cos(angle)))
+        y = int((height - size) / 2 * (1 + 0.8 * np.sin(angle)))
+
+        frame = self.frame
+        np.copyto(frame, self.background)
+        frame[y:y + size, x:x + size, :3] = (40, 200, 240)
+        return frame
+
+
+CAPTURE_BACKENDS = {backend.name: backend
+                    for backend in (MSSBackend, SyntheticBackend)}
+
+
+def create_capture_backend(name, region, fps=15):
+    """Creates a capture backend from the name used in the settings file.
+
+    Args:
+        name: String for the name of the backend, e.g. 'mss'.
+        region: Tuple for the area of the screen to capture in the format
+            (left, top, width, height).
+        fps: Integer for the frame rate of the recording.
+
+    Returns:
+        CaptureBackend object, the 'mss' backend is used if the name can't be
+        found.
+    """
+
+    try:
+        backend = CAPTURE_BACKENDS[name]
+    except KeyError:
+        log_txt = f'Capture backend {name} not found, using mss'
+        LOGGER.warning(log_txt)
+        backend = MSSBackend
+    return backend(region, fps)
@@ -0,0 +1,292 @@
+#!/usr/bin/python3
+"""This module runs the capture of the screen in its own child process.
+
+The grab loop is sensitive to anything else holding the GIL, UI repaints,
+logging or processing on other threads can delay the moment a frame is
+grabbed. CaptureProcess has the same interface as ImageCapture but runs the
+capture loop in a child process with a raised priority, the frames are passed
+back through the frame cache and the shared memory frame ring. Commands are
+sent to the child on a queue and its log records and results come back on
+another.
+
+Starting a new interpreter takes a second or more, so a standby process is
+started ahead of a recording and waits for the command to start capturing.
+"""
+
+import os
+import queue
+import logging
+import threading
+import multiprocessing
+from logging.handlers import QueueHandler
+
+import psutil
+from PySide6.QtCore import Qt, QPoint
+
+from THNScreenRecorder.THN_ImageCapture import ImageCapture
+from THNScreenRecorder.THN_FileManagement import LOGGER
+
+# Commands sent to the capture process.
+START = 'start'
+PAUSE = 'pause'
+RESUME = 'resume'
+REGION = 'region'
+STOP = 'stop'
+
+# Messages sent back from the capture process.
+CACHE_OPENED = 'cache_opened'
+CAPTURE_CANCELED = 'capture_canceled'
+CAPTURE_FINISHED = 'capture_finished'
+
+# Number of seconds between checks that the capture process is still alive.
+PROCESS_CHECK_INTERVAL = 0.5
+
+# Capture process started ahead of the next recording.
+_standby = {}
+
+
+def raise_process_priority():
+    """Raises the scheduling priority of the current process if allowed."""
+
+    process = psutil.Process()
+    try:
+        process.nice(psutil.HIGH_PRIORITY_CLASS if os.name == 'nt' else -5)
+    except (psutil.AccessDenied, PermissionError) as e:
+        log_txt = f'Capture process priority could not be raised: {e}'
+        LOGGER.warning(log_txt)
+
+
+def serve_capture_process(commands, messages):
+    """Waits in the child process for a recording to start and captures it.
+
+    Args:
+        commands: Queue the commands from the parent are read from, the first
+            is expected to be 'start' with the arguments of the recording.
+        messages: Queue log records and results are sent back on.
+    """
+
+    # Every log record is handled by the loggers of the parent process.
+    LOGGER.handlers = [QueueHandler(messages)]
+    LOGGER.setLevel(logging.DEBUG)
+    raise_process_priority()
+
+    command, value = commands.get()
+    if command != START:
+        return
+    region, clip_name, fps, capture_settings = value
+    left, top, width, height = region
+    capture = ImageCapture(width, height, QPoint(left, top), clip_name, fps,
+                           **capture_settings)
+    # There is no event loop in the child to deliver a queued signal.
+    capture.signals.cache_opened.connect(
+        lambda cache: messages.put((CACHE_OPENED, cache)),
+        Qt.DirectConnection)
+    capture.signals.canceled.connect(
+        lambda: messages.put((CAPTURE_CANCELED, None)), Qt.DirectConnection)
+
+    def read_commands():
+        while True:
+            command, value = commands.get()
+            if command == PAUSE:
+                capture.capturing_paused = True
+            elif command == RESUME:
+                capture.capturing_paused = False
+            elif command == REGION:
+                left, top, width, height = value
+                capture.update_position([width, height, QPoint(left, top)])
+            elif command == STOP:
+                capture.stop_capture()
+                return
+
+    command_thread = threading.Thread(target=read_commands, daemon=True)
+    command_thread.start()
+    capture.run()
+    capture.release_frame_ring()
+    messages.put((CAPTURE_FINISHED, capture.capture_stats()))
+
+
+def start_standby_process():
+    """Starts a capture process that waits for the next recording.
+
+    Nothing is started if there is already a standby process running.
+    """
+
+    process = _standby.get('process')
+    if process is not None and process.is_alive():
+        return
+    context = multiprocessing.get_context('spawn')
+    commands = context.Queue()
+    messages = context.Queue()
+    process = context.Process(target=serve_capture_process,
+                              name='thn_capture', daemon=True,
+                              args=(commands, messages))
+    process.start()
+    _standby.update(process=process, commands=commands, messages=messages)
+
+
+def take_standby_process():
+    """Returns the standby capture process, starting one if needed.
+
+    Returns:
+        Tuple of the process, its command Queue and its message Queue.
+    """
+
+    start_standby_process()
+    standby = (_standby.pop('process'), _standby.pop('commands'),
+               _standby.pop('messages'))
+    return standby
+
+
+class CaptureProcess(ImageCapture):
+    """Captures the user's screen in a child process.
+
+    The object lives on a QThread of the UI process like ImageCapture and
+    emits the same Signals, while the grab loop, the frame clock and the cache
+    writers run in a child process started with the 'spawn' method so it
+    shares nothing with the UI. The standby process is told to start
+    capturing as soon as this object is created, and a new standby process is
+    started once the capture has finished. The frame ring is created by this
+    object so it stays available after the child has finished.
+
+    Args:
+        width: Integer for the width of the UI window.
+        height: Integer for the height of the UI window.
+        widget_pos: Tuple for the (x, y) coordinates of the UI window using the
+            upper left corner.
+        clip_name: String for the name of the clip being recorded.
+        fps: Integer for the number of frames to capture per second.
+        **capture_settings: Keyword arguments passed to ImageCapture in the
+            child process.
+    """
+
+    # **************************************************************************
+    # Init
+    def __init__(self, width, height, widget_pos, clip_name, fps,
+                 **capture_settings):
+        """Inits CaptureProcess with class attributes."""
+
+        super().__init__(width, height, widget_pos, clip_name, fps,
+                         **capture_settings)
+
+        self.paused = False
+        self.stats = {}
+
+        frame_ring = self.create_frame_ring(self.get_cache_size())
+        capture_settings = dict(capture_settings, cache_folder=self.cache,
+                                ring_size_mb=0,
+                                ring_info=frame_ring.info() if frame_ring
+                                else None)
+        self.process, self.commands, self.messages = take_standby_process()
+        self.commands.put((START, (self.get_region(), clip_name, fps,
+                                   capture_settings)))
+        self.capturing = True
+
+    def create_capture_loop(self, writers, queue_size, backpressure):
+        """The capture loop runs in the child process, so the cache writer,
+        buffer pool and frame clock are only created there."""
+
+    # **************************************************************************
+    # Properties
+    @property
+    def capturing_paused(self):
+        """Boolean for if the capture has been paused by the user."""
+
+        return self.paused
+
+    @capturing_paused.setter
+    def capturing_paused(self, paused):
+        """Pauses or resumes the capture loop in the child process."""
+
+        self.paused = paused
+        self.commands.put((PAUSE if paused else RESUME, None))
+
+    # **************************************************************************
+    # Funtions
+    def run(self):
+        """This method is triggered once the QThread is started.
+
+        Relays the log records and messages of the child process until the
+        capture has finished.
+        """
+
+        LOGGER.info('Image capture process initiated')
+        finished = self.relay_messages()
+        self.process.join()
+        self.capturing = False
+        if not finished and not self.capture_canceled:
+            LOGGER.error('Capture process ended without finishing')
+            self.capture_canceled = True
+            self.signals.canceled.emit()
+        LOGGER.info('Capturing screen finished')
+        # Get the next process ready while nothing is being recorded.
+        start_standby_process()
+
+        if not self.capture_canceled:
+            self.signals.captured_frames.emit(self.cache)
+        # The QThread is stopped whether or not the capture finished.
+        self.signals.finished.emit()
+
+    def relay_messages(self):
+        """Handles the messages of the child process until it has finished.
+
+        Returns:
+            True if the capture finished, False if the process ended first.
+        """
+
+        while True:
+            # Anything sent before the process ended is already queued.
+            alive = self.process.is_alive()
+            try:
+                message = self.messages.get(timeout=PROCESS_CHECK_INTERVAL)
+            except queue.Empty:
+                if not alive:
+                    return False
+                continue
+            if isinstance(message, logging.LogRecord):
+                LOGGER.handle(message)
+                continue
+            kind, value = message
+            if kind == CACHE_OPENED:
+                self.signals.cache_opened.emit(value)
+            elif kind == CAPTURE_CANCELED:
+                # The capture could not run in the child process.
+                self.capture_canceled = True
+                self.signals.canceled.emit()
+            elif kind == CAPTURE_FINISHED:
+                self.stats = value
+                return True
+
+    def update_position(self, new_position):
+        """Sends a new area of the screen to capture to the child process.
+
+        Args:
+            new_position: List containing the new width, height and position
+                of the UI window, [width, height, position].
+        """
+
+        super().update_position(new_position)
+        self.commands.put((REGION, self.get_region()))
+
+    def capture_stats(self):
+        """Returns a Dict of the statistics sent back by the child process."""
+
+        return self.stats
+
+    def stop_capture(self):
+        """Tells the child process to stop capturing."""
+
+        LOGGER.info('Capture stopped')
+        self.commands.put((STOP, None))
+
+    def cancel_capture(self):
+        """If user cancels the process emit Signals to UI to stop QThread.
+
+        The finished Signal is only emitted by 'run', once the child process
+        has stopped.
+        """
+
+        if self.capturing:
+            LOGGER.warning('Canceling capture sent from app exit')
+            self.capture_canceled = True
+            self.commands.put((STOP, None))
+            self.signals.canceled.emit()
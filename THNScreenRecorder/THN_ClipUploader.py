@@ -0,0 +1,283 @@
+#!/usr/bin/python3
+"""This module uploads a finished clip from local staging to the review share.
+
+Writing every frame straight to the network drive ties the speed of the
+workers converting frames to the latency of the share. Frames are instead
+written to a local staging folder, and once the whole clip is converted
+ClipUploader copies it to the share with a few copy threads. The files are
+uploaded to a folder next to the clip folder which is renamed once every file
+is there, so the review tools never see a half uploaded clip. A clip folder
+already on the share is replaced, or when versioning is on it's kept and the
+new clip is published as the next free version of the folder instead.
+Network errors are retried with an
+increasing delay before the upload gives up, the staged clip is only removed
+once it has been published.
+"""
+
+import os
+import time
+import uuid
+import random
+import shutil
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from PySide6.QtCore import QObject
+
+from THNScreenRecorder.THN_PySideSignals import PySideSignals
+from THNScreenRecorder.THN_FileManagement import LOGGER, create_folder
+
+# Suffixes of the folders used while a clip is published.
+UPLOAD_SUFFIX = '.uploading'
+REPLACED_SUFFIX = '.replaced'
+# Most versions of a clip folder tried before publishing gives up.
+MAX_VERSIONS = 999
+
+
+def find_staged_files(folder):
+    """Lists the files of a staged clip, grouping hard linked copies.
+
+    Duplicate frames are hard links to an earlier frame, the data of each
+    group only needs to be uploaded once.
+
+    Args:
+        folder: String for the staged clip folder.
+
+    Returns:
+        List of Lists for each group of relative file paths sharing the same
+        data, the first path of each group is the one uploaded.
+    """
+
+    groups = {}
+    for root, _, files in os.walk(folder):
+        for file_name in sorted(files):
+            path = os.path.join(root, file_name)
+            stat = os.stat(path)
+            key = (stat.st_dev, stat.st_ino) if stat.st_nlink > 1 else path
+            groups.setdefault(key, []).append(os.path.relpath(path, folder))
+    return list(groups.values())
+
+
+def retry(function, *args, retries=5, delay=0.5, max_delay=8.,
+          canceled=None):
+    """Calls a function, retrying with an increasing delay on OSError.
+
+    Args:
+        function: Callable to call.
+        *args: Arguments passed to the function.
+        retries: Integer for the number of times a failed call is retried.
+        delay: Float for the seconds waited before the first retry, doubled
+            for each retry after it.
+        max_delay: Float for the most seconds waited between two retries.
+        canceled: threading Event which stops the retries once set.
+
+    Returns:
+        The value returned by the function.
+    """
+
+    for attempt in range(retries + 1):
+        try:
+            return function(*args)
+        except OSError as e:
+            if attempt == retries or (canceled and canceled.is_set()):
+                raise
+            wait = min(delay * 2 ** attempt, max_delay)
+            # Jitter keeps the copy threads from retrying in step.
+            wait += random.uniform(0, delay)
+            log_txt = (f'{function.__name__} failed, retrying in '
+                       f'{wait:.1f}s: {e}')
+            LOGGER.warning(log_txt)
+            time.sleep(wait)
+
+
+def link_or_copy(source, destination, local_source):
+    """Links a file to an uploaded file, copying the local file if it can't.
+
+    Args:
+        source: String for the uploaded file on the share.
+        destination: String for the new file on the share.
+        local_source: String for the staged file copied if linking fails.
+    """
+
+    try:
+        os.link(source, destination)
+    except FileExistsError:
+        os.remove(destination)
+        link_or_copy(source, destination, local_source)
+    except OSError:
+        shutil.copyfile(local_source, destination)
+
+
+def publish_folder(upload_folder, folder, version_clips=False):
+    """Renames an uploaded folder to the clip folder.
+
+    A clip folder already on the share, e.g. from an earlier recording with
+    the same name, is moved aside first and removed once the new folder is
+    in place. When clips are versioned it's kept instead, and the clip is
+    published as folder_v002, folder_v003 and so on.
+
+    Args:
+        upload_folder: String for the folder the clip was uploaded to.
+        folder: String for the clip folder it's published as.
+        version_clips: Boolean for if an existing clip folder is kept.
+
+    Returns:
+        String for the folder the clip was published to.
+    """
+
+    if not version_clips:
+        # Named after the upload so a retry finds the folder it moved aside.
+        replaced = f'{upload_folder}{REPLACED_SUFFIX}'
+        if os.path.exists(folder):
+            os.rename(folder, replaced)
+        os.rename(upload_folder, folder)
+        shutil.rmtree(replaced, ignore_errors=True)
+        return folder
+
+    for version in range(1, MAX_VERSIONS + 1):
+        published = folder if version == 1 else f'{folder}_v{version:03}'
+        # Renaming on to an empty folder succeeds outside of Windows.
+        if os.path.exists(published):
+            continue
+        try:
+            os.rename(upload_folder, published)
+        except FileExistsError:
+            continue
+        return published
+    raise FileExistsError(f'Every version of {folder} is already published')
+
+
+class ClipUploader(QObject):
+    """Uploads a staged clip to the review share and publishes it.
+
+    Args:
+        staging_folder: String for the local folder the clip was written to.
+        folder: String for the clip folder on the review share.
+        workers: Integer for the number of files copied at once.
+        retries: Integer for the number of times a failed copy is retried.
+        retry_delay: Float for the seconds waited before the first retry.
+        version_clips: Boolean for if a clip folder already on the share is
+            kept and the clip published as a new version, instead of the
+            folder being replaced.
+    """
+
+    # **************************************************************************
+    # Init
+    def __init__(self, staging_folder, folder, workers=4, retries=5,
+                 retry_delay=0.5, version_clips=False):
+        """Inits ClipUploader with class attributes."""
+
+        super().__init__()
+
+        self.signals = PySideSignals()
+
+        self.staging_folder = staging_folder
+        self.folder = folder
+        # Unique so two uploads of a clip with the same name don't mix.
+        self.upload_folder = f'{folder}.{uuid.uuid4().hex[:8]}{UPLOAD_SUFFIX}'
+        self.published_folder = None
+        self.workers = max(int(workers), 1)
+        self.retries = int(retries)
+        self.retry_delay = float(retry_delay)
+        self.version_clips = version_clips
+        self.canceled = threading.Event()
+        self.published = False
+        self.files_uploaded = 0
+        self.bytes_uploaded = 0
+
+    # **************************************************************************
+    # Funtions
+    def run(self):
+        """This method is triggered once the QThread is started."""
+
+        start = time.perf_counter()
+        try:
+            self.upload()
+        except Exception as e:
+            log_error = (f'Error uploading {self.folder}, the clip is kept in '
+                         f'{self.staging_folder}: {e!r}')
+            LOGGER.error(log_error)
+            shutil.rmtree(self.upload_folder, ignore_errors=True)
+        else:
+            if not self.canceled.is_set():
+                self.published = True
+                duration = time.perf_counter() - start
+                log_txt = (f'Published {self.files_uploaded} files, '
+                           f'{self.bytes_uploaded / 1024 ** 2:.1f}MB to '
+                           f'{self.published_folder} in {duration:.2f}s')
+                LOGGER.info(log_txt)
+                shutil.rmtree(self.staging_folder, ignore_errors=True)
+        finally:
+            # The QThread is stopped however the upload ended.
+            self.signals.finished.emit()
+
+    def upload(self):
+        """Copies every staged file to the upload folder and publishes it."""
+
+        groups = find_staged_files(self.staging_folder)
+        num_files = sum(len(group) for group in groups)
+        log_txt = (f'Uploading {num_files} files, {len(groups)} unique, with '
+                   f'{self.workers} threads')
+        LOGGER.info(log_txt)
+
+        for root, _, _ in os.walk(self.staging_folder):
+            relative = os.path.relpath(root, self.staging_folder)
+            self.retry(create_folder,
+                       os.path.normpath(os.path.join(self.upload_folder,
+                                                     relative)))
+
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            futures = [executor.submit(self.upload_group, group)
+                       for group in groups]
+            try:
+                for future in as_completed(futures):
+                    files, num_bytes = future.result()
+                    self.files_uploaded += files
+                    self.bytes_uploaded += num_bytes
+                    self.signals.progress.emit(self.files_uploaded
+                                               / max(num_files, 1))
+            except BaseException:
+                self.canceled.set()
+                raise
+        if self.canceled.is_set():
+            LOGGER.warning('Upload canceled, the clip was not published')
+            shutil.rmtree(self.upload_folder, ignore_errors=True)
+            return
+        self.published_folder = self.retry(publish_folder, self.upload_folder,
+                                           self.folder, self.version_clips)
+        if self.published_folder != self.folder:
+            log_txt = (f'{self.folder} already exists, the clip was published '
+                       f'as {self.published_folder}')
+            LOGGER.warning(log_txt)
+
+    def upload_group(self, group):
+        """Uploads the data of a group of files once and links the rest.
+
+        Args:
+            group: List of relative file paths sharing the same data.
+
+        Returns:
+            Tuple of the number of files uploaded and the number of bytes
+            copied.
+        """
+
+        if self.canceled.is_set():
+            return 0, 0
+        source = os.path.join(self.staging_folder, group[0])
+        uploaded = os.path.join(self.upload_folder, group[0])
+        self.retry(shutil.copyfile, source, uploaded)
+        for relative in group[1:]:
+            self.retry(link_or_copy, uploaded,
+                       os.path.join(self.upload_folder, relative), source)
+        return len(group), os.path.getsize(source)
+
+    def retry(self, function, *args):
+        """Calls a function with the retry settings of the uploader."""
+
+        return retry(function, *args, retries=self.retries,
+                     delay=self.retry_delay, canceled=self.canceled)
+
+    def cancel_upload(self):
+        """Stops the upload, the staged clip is kept."""
+
+        self.canceled.set()
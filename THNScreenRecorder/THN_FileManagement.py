@@ -1,6 +1,7 @@
 #!/usr/bin/python3
 """This module contains all the shared constants and funtions."""
 
+import io
 import os
 import shutil
 import logging
@@ -14,14 +15,21 @@ import numpy as np
 from tifffile import imwrite
 
 LOCAL_CACHE = f"{os.getenv('APPDATA')}\\temp\\screen_recorder"
+# Clips are written here before being uploaded, it's kept apart from the cache
+# so a clip that failed to upload isn't cleaned up with the cache.
+STAGING_FOLDER = f"{os.getenv('APPDATA')}\\temp\\screen_recorder_staging"
 LIB_PATH = 'L:\\Library\\_tools\\THN_ReviewTools\\THN_screenRecorder2.0'
 SETTINGS_FILE = f'{LIB_PATH}\\settings.ini'
 IMAGE_FORMAT = '.tiff'
-CACHE_FORMAT = '.npy'
+CACHE_FORMAT = '.bin'
 IMAGE_RES = (1920, 1080)
 
 LOGGER = logging.getLogger()
 CONFIG = configparser.ConfigParser()
+# Values read from the settings file by load_settings, None until it's read.
+SETTINGS = None
+BOOL_VALUES = {'true': True, 'yes': True, 'on': True, '1': True,
+               'false': False, 'no': False, 'off': False, '0': False}
 
 
 # **************************************************************************
@@ -63,6 +71,107 @@ def get_config_values(section, key):
     return CONFIG[section][key]
 
 
+def load_settings():
+    """Reads the tool's settings file once so settings can be looked up.
+
+    The settings file is on the network so it's read at the start of each
+    recording rather than for every setting. A separate parser is used so
+    CONFIG isn't changed.
+
+    Returns:
+        Dict of section names to Dicts of the keys and values read, empty if
+        the settings file can't be read.
+    """
+
+    global SETTINGS
+    parser = configparser.ConfigParser()
+    try:
+        parser.read(SETTINGS_FILE)
+        SETTINGS = {section: dict(parser[section])
+                    for section in parser.sections()}
+    except configparser.Error as e:
+        log_txt = f'Settings file could not be read, using defaults: {e}'
+        LOGGER.warning(log_txt)
+        SETTINGS = {}
+    return SETTINGS
+
+
+def convert_setting(value, fallback):
+    """Converts a value read from the settings file to the fallback's type.
+
+    Args:
+        value: String read from the settings file.
+        fallback: Value whose type is used, a bool, int or float. Any other
+            type leaves the value as a String.
+
+    Returns:
+        The converted value.
+
+    Raises:
+        ValueError: If the value can't be converted.
+    """
+
+    value = value.strip()
+    if isinstance(fallback, bool):
+        try:
+            return BOOL_VALUES[value.lower()]
+        except KeyError:
+            raise ValueError(f'{value!r} is not true or false') from None
+    if isinstance(fallback, int):
+        return int(value)
+    if isinstance(fallback, float):
+        return float(value)
+    return value
+
+
+def get_setting(section, key, fallback=None):
+    """Reads a single value from the tool's settings file.
+
+    The values read by the last call to load_settings are used, the settings
+    file is only read here if it hasn't been read yet.
+
+    Args:
+        section: String for the name of the specific section.
+        key: String for the name of the specific key.
+        fallback: Value to return if the setting can't be read, a bool, int
+            or float fallback also sets the type the value is converted to.
+
+    Returns:
+        The value that has been read, the fallback value is returned if the
+        settings file, section or key cannot be found or the value isn't
+        valid for the fallback's type.
+    """
+
+    settings = SETTINGS if SETTINGS is not None else load_settings()
+    try:
+        value = settings[section][key]
+    except KeyError:
+        return fallback
+    try:
+        return convert_setting(value, fallback)
+    except ValueError:
+        log_txt = (f'Setting {section} {key} = {value!r} is not a valid '
+                   f'{type(fallback).__name__}, using {fallback!r}')
+        LOGGER.warning(log_txt)
+        return fallback
+
+
+def get_bool_setting(section, key, fallback=False):
+    """Reads a True / False value from the tool's settings file.
+
+    Args:
+        section: String for the name of the specific section.
+        key: String for the name of the specific key.
+        fallback: Boolean to return if the setting can't be read.
+
+    Returns:
+        True if the value is 'true', 'yes', 'on' or '1', False if it's
+        'false', 'no', 'off' or '0', the fallback if otherwise.
+    """
+
+    return get_setting(section, key, bool(fallback))
+
+
 def save_config_file(main_section, key_values, output_path, overwrite=True):
     """Saves information in an INI file using configparser.
 
@@ -100,29 +209,130 @@ def save_config_file(main_section, key_values, output_path, overwrite=True):
         return
 
 
+# **************************************************************************
+# Image helpers.
+def get_scaled_size(width, height, resolution=IMAGE_RES):
+    """Finds the size an image needs to be scaled to, to fit the output.
+
+    Images that are larger than the output resolution in either direction
+    are scaled down keeping their aspect ratio, smaller images are not scaled.
+
+    Args:
+        width: Integer for the width of the image.
+        height: Integer for the height of the image.
+        resolution: Tuple for the (width, height) of the output resolution.
+
+    Returns:
+        Tuple for the (width, height) the image should be scaled to.
+    """
+
+    ratio = min(resolution[0] / width, resolution[1] / height)
+    if ratio >= 1:
+        return (width, height)
+    new_w = min(int(width * ratio), resolution[0])
+    new_h = min(int(height * ratio), resolution[1])
+    return (new_w, new_h)
+
+
 # **************************************************************************
 # Create files / folders.
-def write_image(image, path, project, frame_number=0):
-    """Saves catured and prepared PIL image to the specified folder on disk.
+def write_image(image, path, project, frame_number=0, codec=None):
+    """Saves catured and prepared image to the specified folder on disk.
 
     Args:
-        image: PIL image object to be saved to disk.
+        image: Numpy array or PIL image object to be saved to disk.
         path: String for the output path for the image.
         project: String which will be used for the image tag.
         num: An integer for the current frame number to be used in the output.
             name of the image file.
+        codec: OutputCodec used to encode the image, a deflate TIFF is
+            written if not set.
 
     Returns:
-        False if information was unsuccessfully saved.
+        True once the image is saved, errors writing the file are raised.
     """
 
-    # convert PIL image to np array
+    # convert PIL image to np array, arrays are passed through unchanged
     np_image = np.asarray(image)
 
+    if codec is not None:
+        return write_encoded_image(codec.encode(np_image, project), path,
+                                   frame_number, codec.extension)
+
     # save tiff files to folder
     path = f'{path}_{frame_number:04}{IMAGE_FORMAT}'
     imwrite(path, np_image, compression='deflate', description=project)
-    return os.path.exists(path)
+    return True
+
+
+def encode_image(image, project, codec=None):
+    """Encodes a prepared image in memory in the same format as write_image.
+
+    Args:
+        image: Numpy array or PIL image object to be encoded.
+        project: String which will be used for the image tag.
+        codec: OutputCodec used to encode the image, a deflate TIFF is
+            encoded if not set.
+
+    Returns:
+        Bytes of the encoded image file.
+    """
+
+    if codec is not None:
+        return codec.encode(np.asarray(image), project)
+    buffer = io.BytesIO()
+    imwrite(buffer, np.asarray(image), compression='deflate',
+            description=project)
+    return buffer.getvalue()
+
+
+def write_encoded_image(data, path, frame_number=0, extension=IMAGE_FORMAT):
+    """Saves an image encoded by encode_image to the folder on disk.
+
+    Args:
+        data: Bytes of the encoded image file.
+        path: String for the output path for the image.
+        frame_number: Integer for the frame number used in the file name.
+        extension: String for the file extension of the codec the image was
+            encoded with.
+
+    Returns:
+        True once the image is saved, errors writing the file are raised.
+    """
+
+    path = f'{path}_{frame_number:04}{extension}'
+    with open(path, 'wb') as image_file:
+        image_file.write(data)
+    return True
+
+
+def duplicate_image(path, frame_number, new_frame_number,
+                    extension=IMAGE_FORMAT):
+    """Creates another frame of an image sequence from an existing frame.
+
+    The new frame is hard linked to the existing file where the file system
+    allows it, otherwise the file is copied.
+
+    Args:
+        path: String for the output path used for the image sequence.
+        frame_number: Integer for the frame number of the existing image.
+        new_frame_number: Integer for the frame number of the new image.
+        extension: String for the file extension of the image sequence.
+
+    Returns:
+        True once the new frame is saved, errors writing the file are raised.
+    """
+
+    source = f'{path}_{frame_number:04}{extension}'
+    destination = f'{path}_{new_frame_number:04}{extension}'
+    try:
+        os.link(source, destination)
+    except FileExistsError:
+        os.remove(destination)
+        return duplicate_image(path, frame_number, new_frame_number, extension)
+    except OSError:
+        shutil.copyfile(source, destination)
+    return True
 
 
 def create_folder(path):
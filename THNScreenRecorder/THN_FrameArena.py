@@ -0,0 +1,176 @@
+#!/usr/bin/python3
+"""This module holds reusable buffers so frames can be handled without
+allocating new arrays for every frame.
+
+The geometry of the frames is fixed for a whole recording, only changing if
+the window is moved or resized while paused, so a buffer allocated for one
+frame can be used for every frame after it. A FrameArena holds named scratch
+buffers used by a single worker, a BufferPool hands out buffers that are
+passed between threads and returns them to the pool once every user has
+released them.
+"""
+
+import threading
+
+import numpy as np
+
+# Scratch buffers of each thread converting frames.
+_thread_arena = threading.local()
+
+
+def get_thread_arena():
+    """Returns the FrameArena of the current thread, creating it if needed."""
+
+    arena = getattr(_thread_arena, 'arena', None)
+    if arena is None:
+        arena = FrameArena()
+        _thread_arena.arena = arena
+    return arena
+
+
+class FrameArena:
+    """Named scratch buffers owned by a single worker.
+
+    A buffer is only allocated again if the shape or type asked for changes,
+    the contents are left over from the last time it was used.
+    """
+
+    # **************************************************************************
+    # Init
+    def __init__(self):
+        """Inits FrameArena with class attributes."""
+
+        self.buffers = {}
+        self.allocations = 0
+
+    # **************************************************************************
+    # Funtions
+    def get(self, name, shape, dtype=np.uint8):
+        """Returns the scratch buffer for a name.
+
+        Args:
+            name: String for what the buffer is used for, e.g. 'canvas'.
+            shape: Tuple for the shape of the buffer.
+            dtype: Numpy dtype of the buffer.
+
+        Returns:
+            Numpy array of the shape and type asked for.
+        """
+
+        buffer = self.buffers.get(name)
+        if buffer is None or buffer.shape != shape or buffer.dtype != dtype:
+            buffer = np.empty(shape, dtype=dtype)
+            self.buffers[name] = buffer
+            self.allocations += 1
+        return buffer
+
+    def nbytes(self):
+        """Returns the number of bytes held by the scratch buffers."""
+
+        return sum(buffer.nbytes for buffer in self.buffers.values())
+
+    def clear(self):
+        """Releases every scratch buffer."""
+
+        self.buffers = {}
+
+
+class BufferPool:
+    """Reference counted buffers shared between threads.
+
+    A buffer starts with a single reference when it's acquired, anything
+    else that keeps the buffer adds a reference and every reference is
+    released once it's done with. When the last reference is released the
+    buffer goes back to the pool to be handed out again. If the shape of the
+    buffers changes the free buffers are dropped and buffers of the old shape
+    aren't returned to the pool.
+
+    Args:
+        max_free: Integer for the maximum number of free buffers kept.
+    """
+
+    # **************************************************************************
+    # Init
+    def __init__(self, max_free=64):
+        """Inits BufferPool with class attributes."""
+
+        self.max_free = max_free
+        self.shape = None
+        self.dtype = None
+        self.free = []
+        self.references = {}
+        self.lock = threading.Lock()
+        self.allocations = 0
+        self.reuses = 0
+
+    # **************************************************************************
+    # Funtions
+    def acquire(self, shape, dtype=np.uint8):
+        """Returns a buffer of the shape asked for with one reference.
+
+        Args:
+            shape: Tuple for the shape of the buffer.
+            dtype: Numpy dtype of the buffer.
+
+        Returns:
+            Numpy array, the contents are left over from its last use.
+        """
+
+        with self.lock:
+            if shape != self.shape or dtype != self.dtype:
+                self.shape = shape
+                self.dtype = dtype
+                self.free = []
+            if self.free:
+                buffer = self.free.pop()
+                self.reuses += 1
+            else:
+                buffer = np.empty(shape, dtype=dtype)
+                self.allocations += 1
+            self.references[id(buffer)] = [buffer, 1]
+        return buffer
+
+    def retain(self, buffer):
+        """Adds a reference to a buffer from the pool.
+
+        Args:
+            buffer: Numpy array handed out by 'acquire', None is ignored.
+        """
+
+        if buffer is None:
+            return
+        with self.lock:
+            entry = self.references.get(id(buffer))
+            if entry is not None:
+                entry[1] += 1
+
+    def release(self, buffer):
+        """Removes a reference to a buffer, returning it to the pool if it
+        was the last one.
+
+        Args:
+            buffer: Numpy array handed out by 'acquire', None is ignored.
+        """
+
+        if buffer is None:
+            return
+        with self.lock:
+            entry = self.references.get(id(buffer))
+            if entry is None:
+                return
+            entry[1] -= 1
+            if entry[1] > 0:
+                return
+            del self.references[id(buffer)]
+            if (buffer.shape == self.shape and buffer.dtype == self.dtype
+                    and len(self.free) < self.max_free):
+                self.free.append(buffer)
+
+    def stats(self):
+        """Returns a Dict of how many buffers were allocated and reused."""
+
+        with self.lock:
+            return {'allocations': self.allocations,
+                    'reuses': self.reuses,
+                    'in_use': len(self.references),
+                    'free': len(self.free)}
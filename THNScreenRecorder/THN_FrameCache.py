@@ -0,0 +1,599 @@
+#!/usr/bin/python3
+"""This module reads and writes the container used to cache captured frames.
+
+A cache folder holds three files; a header with the format of the cache, an
+append-only data file holding the pixels of every frame back to back and an
+index with a fixed size record for each frame storing where it can be found in
+the data file, its shape and when it was captured. The data file is read back
+using memory mapping so the frames don't need to be copied to be processed.
+
+The order of the colour channels of the stored frames is kept in the header,
+captured frames are stored as packed RGB so they can be used as they are.
+
+Frames can optionally be compressed with zlib. When delta encoding is enabled
+a compressed frame can also be stored as the difference to the frame before
+it, with a full keyframe being stored at a regular interval so only a few
+frames need to be decoded to rebuild any frame in the cache.
+
+A frame that is identical to the frame before it is stored as a duplicate,
+only its index record is written and it points back to the earlier frame.
+
+When a FrameRing is used the pixels of a frame are copied in to a slot of
+shared memory instead of the data file, its index record holds the slot.
+Frames are only written to the data file when every slot is in use.
+"""
+
+import os
+import json
+import zlib
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+from THNScreenRecorder.THN_FrameRing import FrameRing
+from THNScreenRecorder.THN_FileManagement import CACHE_FORMAT, LOGGER
+
+CACHE_VERSION = 2
+HEADER_FILE = 'header.json'
+INDEX_FILE = 'index.idx'
+DATA_FILE = f'frames{CACHE_FORMAT}'
+
+# Channel orders of the frames stored in the cache.
+RGB = 'RGB'
+BGRA = 'BGRA'
+
+# Compression used for the frames stored in the data file.
+NO_COMPRESSION = 'none'
+ZLIB = 'zlib'
+
+# The kind of data stored for each frame.
+KEYFRAME = 0
+DELTA = 1
+DUPLICATE = 2
+RING = 3
+
+# Every n-th row is compared before checking if a whole frame is a duplicate.
+DUPLICATE_SAMPLE_STEP = 16
+
+INDEX_DTYPE = np.dtype([('frame', '<u4'),
+                        ('offset', '<u8'),
+                        ('size', '<u8'),
+                        ('height', '<u2'),
+                        ('width', '<u2'),
+                        ('channels', '<u1'),
+                        ('timestamp', '<f8'),
+                        ('kind', '<u1'),
+                        ('ref', '<i4')])
+
+
+class FrameCacheWriter:
+    """Appends captured frames to a frame cache folder.
+
+    Frames can be appended from more than one writer thread, each frame is
+    written to the data file before its index record so a reader never finds
+    a record pointing to pixels that haven't been written yet. Compression is
+    done before the files are locked so writer threads compress in parallel.
+
+    Args:
+        folder: String for the full path of the cache folder.
+        channel_order: String for the order of the colour channels of the
+            frames being written, 'RGB' or 'BGRA'.
+        compression: String for the compression of stored frames, 'none' or
+            'zlib'.
+        level: Integer for the zlib compression level, 1 is the fastest.
+        delta: Boolean for if compressed frames should be stored as the
+            difference to the previous frame when possible.
+        keyframe_interval: Integer for how often a full frame is stored when
+            delta encoding is used.
+        skip_duplicates: Boolean for if frames identical to the previous frame
+            are stored as a reference instead of new pixels.
+        ring: FrameRing the frames are stored in, frames are only written to
+            the data file when the ring is full. Frames in the ring can be
+            freed once converted so delta encoding isn't used with a ring.
+    """
+
+    # **************************************************************************
+    # Init
+    def __init__(self, folder, channel_order=RGB, compression=NO_COMPRESSION,
+                 level=1, delta=False, keyframe_interval=30,
+                 skip_duplicates=True, ring=None):
+        """Inits FrameCacheWriter with class attributes."""
+
+        self.folder = folder
+        self.channel_order = channel_order
+        if compression not in (NO_COMPRESSION, ZLIB):
+            log_txt = f'Unknown cache compression {compression}, using none'
+            LOGGER.warning(log_txt)
+            compression = NO_COMPRESSION
+        self.compression = compression
+        self.level = int(level)
+        # Delta frames are only worth storing when they are compressed.
+        self.delta = bool(delta) and compression == ZLIB and ring is None
+        self.keyframe_interval = max(int(keyframe_interval), 1)
+        self.skip_duplicates = skip_duplicates
+        self.ring = ring
+
+        self.lock = threading.Lock()
+        self.data_file = None
+        self.index_file = None
+        self.frames_written = 0
+        self.bytes_written = 0
+        self.keyframes = 0
+        self.delta_frames = 0
+        self.duplicate_frames = 0
+        self.ring_frames = 0
+
+    def __enter__(self):
+        self.open()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    # **************************************************************************
+    # Funtions
+    def open(self):
+        """Creates the cache files, replacing any left from a previous take.
+
+        The header is written last so a reader never finds a header without
+        the data and index files of the same take.
+        """
+
+        header_path = os.path.join(self.folder, HEADER_FILE)
+        if os.path.exists(header_path):
+            os.remove(header_path)
+        self.data_file = open(os.path.join(self.folder, DATA_FILE), 'wb')
+        self.index_file = open(os.path.join(self.folder, INDEX_FILE), 'wb')
+
+        header = {'version': CACHE_VERSION,
+                  'channel_order': self.channel_order,
+                  'compression': self.compression,
+                  'delta': self.delta,
+                  'keyframe_interval': self.keyframe_interval,
+                  'ring': self.ring.info() if self.ring else None,
+                  'index_dtype': INDEX_DTYPE.descr}
+        with open(header_path, 'w') as header_file:
+            json.dump(header, header_file)
+
+    def is_duplicate(self, frame, previous):
+        """Checks if a frame is identical to the frame before it.
+
+        A sample of rows is compared first so frames that have changed are
+        usually rejected without reading the whole frame.
+
+        Args:
+            frame: Numpy array of the frame.
+            previous: Numpy array of the frame captured before this one.
+
+        Returns:
+            True if both frames have exactly the same pixels.
+        """
+
+        if previous is None or previous.shape != frame.shape:
+            return False
+        step = DUPLICATE_SAMPLE_STEP
+        if not np.array_equal(frame[::step], previous[::step]):
+            return False
+        return np.array_equal(frame, previous)
+
+    def encode(self, num, frame, previous=None, duplicate=None):
+        """Creates the bytes to be stored for a frame.
+
+        Args:
+            num: Integer for the frame number.
+            frame: Contiguous numpy array of the frame.
+            previous: Numpy array of the frame captured before this one, used
+                for delta encoding.
+            duplicate: Boolean for if the frame is a duplicate to be skipped,
+                None to check the frame against the previous one.
+
+        Returns:
+            Tuple of the bytes like object to store, the kind of frame and the
+            frame number it references, (data, kind, ref).
+        """
+
+        if duplicate is None:
+            duplicate = (self.skip_duplicates
+                         and self.is_duplicate(frame, previous))
+        if duplicate:
+            return b'', DUPLICATE, num - 1
+
+        if self.compression == NO_COMPRESSION:
+            return memoryview(frame).cast('B'), KEYFRAME, -1
+
+        use_delta = (self.delta and previous is not None
+                     and previous.shape == frame.shape
+                     and num % self.keyframe_interval != 0)
+        if use_delta:
+            difference = np.bitwise_xor(frame, previous)
+            return zlib.compress(difference, self.level), DELTA, num - 1
+        return zlib.compress(frame, self.level), KEYFRAME, -1
+
+    def append(self, num, frame, timestamp=0., previous=None):
+        """Writes a frame to the end of the data file and records it.
+
+        Args:
+            num: Integer for the frame number.
+            frame: Numpy array of the frame with the shape (h, w, channels).
+            timestamp: Float for the time in seconds the frame was captured.
+            previous: Numpy array of the frame numbered 'num - 1', needed to
+                store the frame as a delta.
+        """
+
+        frame = np.ascontiguousarray(frame, dtype=np.uint8)
+        height, width, channels = frame.shape
+        duplicate = self.skip_duplicates and self.is_duplicate(frame, previous)
+        # Frames are only compressed if they don't fit in the ring.
+        slot = None
+        if self.ring is not None and not duplicate:
+            slot = self.ring.put(num, frame)
+        if slot is not None:
+            data, kind, ref = b'', RING, -1
+        else:
+            data, kind, ref = self.encode(num, frame, previous, duplicate)
+
+        record = np.zeros(1, dtype=INDEX_DTYPE)
+        record['frame'] = num
+        record['size'] = frame.nbytes if kind == RING else len(data)
+        record['height'] = height
+        record['width'] = width
+        record['channels'] = channels
+        record['timestamp'] = timestamp
+        record['kind'] = kind
+        record['ref'] = ref
+
+        with self.lock:
+            if kind == RING:
+                record['offset'] = slot
+            else:
+                record['offset'] = self.data_file.tell()
+                self.data_file.write(data)
+                self.data_file.flush()
+            self.index_file.write(record.tobytes())
+            self.index_file.flush()
+            self.frames_written += 1
+            self.bytes_written += len(data)
+            if kind == DELTA:
+                self.delta_frames += 1
+            elif kind == DUPLICATE:
+                self.duplicate_frames += 1
+            elif kind == RING:
+                self.ring_frames += 1
+            else:
+                self.keyframes += 1
+
+    def close(self):
+        """Closes the data and index files."""
+
+        with self.lock:
+            for cache_file in (self.data_file, self.index_file):
+                if cache_file is not None:
+                    cache_file.close()
+            self.data_file = None
+            self.index_file = None
+
+    def log_stats(self):
+        """Writes the number of frames and bytes stored to the logger."""
+
+        mb_written = self.bytes_written / 1024 ** 2
+        log_txt = (f'Frame cache stored {self.frames_written} frames, '
+                   f'{self.keyframes} keyframes, {self.delta_frames} deltas, '
+                   f'{self.duplicate_frames} duplicates skipped, '
+                   f'{self.ring_frames} in the frame ring, '
+                   f'{mb_written:.1f}MB ({self.compression})')
+        LOGGER.info(log_txt)
+
+
+class FrameCacheReader:
+    """Reads frames from a frame cache folder.
+
+    The reader behaves like a read-only list of frames sorted by frame number.
+    Uncompressed frames are numpy array views of the memory mapped data file
+    so they are never copied, compressed frames are decoded on request with
+    the most recently decoded frames being kept to speed up delta chains. The
+    frame order comes from the index rather than the files on disk. Duplicate
+    frames return the pixels of the frame they point to. Frames stored in a
+    FrameRing are views of its shared memory slot.
+
+    Args:
+        folder: String for the full path of the cache folder.
+        decoded_frames: Integer for the number of decoded frames to keep.
+    """
+
+    # **************************************************************************
+    # Init
+    def __init__(self, folder, decoded_frames=8):
+        """Inits FrameCacheReader with class attributes."""
+
+        self.folder = folder
+        self.channel_order = RGB
+        self.compression = NO_COMPRESSION
+        self.index = np.zeros(0, dtype=INDEX_DTYPE)
+        self.positions = {}
+        self.sources = []
+        self.data = None
+        self.ring = None
+
+        self.decoded = OrderedDict()
+        self.max_decoded = decoded_frames
+        self.decode_lock = threading.Lock()
+        # The index, positions, sources and data are replaced together by
+        # 'refresh' while other threads are reading frames.
+        self.index_lock = threading.RLock()
+        self.refresh()
+
+    def __len__(self):
+        return len(self.index)
+
+    def __getitem__(self, position):
+        return self.frame(position)
+
+    def __iter__(self):
+        for position in range(len(self)):
+            yield self.frame(position)
+
+    # **************************************************************************
+    # Funtions
+    def refresh(self):
+        """Reads the index and maps the data file again.
+
+        Any frames that have been appended since the cache was last read will
+        be picked up.
+
+        Returns:
+            Integer for the number of frames found in the cache.
+        """
+
+        header_path = os.path.join(self.folder, HEADER_FILE)
+        if not os.path.exists(header_path):
+            log_txt = f'No frame cache found in {self.folder}'
+            LOGGER.warning(log_txt)
+            return 0
+
+        with open(header_path) as header_file:
+            header = json.load(header_file)
+        self.channel_order = header.get('channel_order', BGRA)
+        self.compression = header.get('compression', NO_COMPRESSION)
+        index_dtype = np.dtype([tuple(field) for field in header['index_dtype']])
+        ring_info = header.get('ring')
+        if ring_info and (self.ring is None
+                          or self.ring.name != ring_info['name']):
+            self.ring = FrameRing.attach(**ring_info)
+
+        index_path = os.path.join(self.folder, INDEX_FILE)
+        index_bytes = os.path.getsize(index_path)
+        # Ignore a record that is only partly written.
+        count = index_bytes // index_dtype.itemsize
+        index = np.fromfile(index_path, dtype=index_dtype, count=count)
+
+        # Everything is read before the lock is taken so frames can be read
+        # by other threads while the cache is refreshed.
+        data_path = os.path.join(self.folder, DATA_FILE)
+        data = None
+        if os.path.getsize(data_path):
+            data = np.memmap(data_path, dtype=np.uint8, mode='r')
+        index = np.sort(index, order='frame')
+        positions = {int(num): position
+                     for position, num in enumerate(index['frame'])}
+        sources = self.find_sources(index, positions)
+
+        with self.index_lock:
+            if data is not None:
+                self.data = data
+            self.index = index
+            self.positions = positions
+            self.sources = sources
+        return len(index)
+
+    def find_sources(self, index, positions):
+        """Finds the position of the frame holding the pixels for each frame.
+
+        Duplicates always point to an earlier frame so following the index in
+        order resolves chains of duplicates to the original frame. If the
+        earlier frame is missing, because it couldn't be written, the frame
+        before the duplicate is used instead.
+
+        Args:
+            index: Numpy array of the index records sorted by frame number.
+            positions: Dict of frame numbers to their position in the index.
+
+        Returns:
+            List of Integers for the source position of each frame.
+        """
+
+        sources = []
+        for position, record in enumerate(index):
+            source = position
+            if record['kind'] == DUPLICATE:
+                ref_position = positions.get(int(record['ref']))
+                if ref_position is not None:
+                    source = sources[ref_position]
+                elif sources:
+                    source = sources[-1]
+            sources.append(source)
+        return sources
+
+    def settled_frames(self):
+        """Returns how many frames at the start of the cache are complete.
+
+        Frames can be appended out of order by the writer threads while a
+        recording is running, only the frames before the first missing frame
+        number will keep the same position when the cache is read again.
+        """
+
+        numbers = self.index['frame']
+        missing = np.flatnonzero(numbers != np.arange(len(numbers)))
+        return int(missing[0]) if len(missing) else len(numbers)
+
+    def source_position(self, position):
+        """Returns the position of the frame that holds a frame's pixels.
+
+        Args:
+            position: Integer for the position of the frame in the index.
+
+        Returns:
+            Integer for the position of the original frame, this is the same
+            as 'position' for any frame that isn't a duplicate.
+        """
+
+        with self.index_lock:
+            return self.sources[position]
+
+    def frame(self, position):
+        """Returns the frame at a position in the cache.
+
+        Args:
+            position: Integer for the position of the frame in the index.
+
+        Returns:
+            Numpy array of the frame, uncompressed frames are a view of the
+            mapped data file. Decoded frames are shared so are read-only.
+        """
+
+        with self.index_lock:
+            record = self.index[self.sources[position]]
+            data = self.data
+        if record['kind'] == RING:
+            return self.ring_frame(record)
+        if self.compression == NO_COMPRESSION:
+            start = int(record['offset'])
+            end = start + int(record['size'])
+            return data[start:end].reshape(self.frame_shape(record))
+        return self.decode(int(record['frame']))
+
+    def ring_frame(self, record):
+        """Returns the frame of an index record stored in the frame ring.
+
+        Raises:
+            IndexError: If the frame has been freed from the ring.
+        """
+
+        frame = None
+        if self.ring is not None:
+            frame = self.ring.frame(int(record['offset']), int(record['frame']),
+                                    self.frame_shape(record))
+        if frame is None:
+            raise IndexError(f'Frame {record["frame"]} is no longer in the '
+                             f'frame ring')
+        return frame
+
+    def release(self, position):
+        """Frees the slot of the frame ring used by a converted frame.
+
+        Args:
+            position: Integer for the position of the frame in the index.
+        """
+
+        with self.index_lock:
+            record = self.index[self.sources[position]]
+        if record['kind'] == RING and self.ring is not None:
+            self.ring.release(int(record['offset']), int(record['frame']))
+
+    def frame_shape(self, record):
+        """Returns the (height, width, channels) shape of an index record."""
+
+        return (int(record['height']), int(record['width']),
+                int(record['channels']))
+
+    def decode(self, num):
+        """Decompresses a frame, rebuilding it from its keyframe if needed.
+
+        If a frame the chain depends on is missing, because it couldn't be
+        written, the chain can't be rebuilt and the last frame before the
+        missing one is used instead until the next keyframe.
+
+        Args:
+            num: Integer for the frame number.
+
+        Returns:
+            Numpy array of the decoded frame.
+        """
+
+        # Walk back to the keyframe, or a frame that's already decoded,
+        # collecting the frames that need to be decompressed on the way.
+        chain = []
+        frame = None
+        with self.index_lock:
+            data = self.data
+            while True:
+                with self.decode_lock:
+                    frame = self.decoded.get(num)
+                if frame is not None:
+                    break
+                position = self.positions.get(num)
+                if position is None:
+                    frame = self.decode_before(num)
+                    chain = []
+                    break
+                record = self.index[position]
+                if record['kind'] == DUPLICATE:
+                    num = int(record['ref'])
+                    continue
+                chain.append(record)
+                if record['kind'] == KEYFRAME:
+                    break
+                num = int(record['ref'])
+
+        for record in reversed(chain):
+            start = int(record['offset'])
+            end = start + int(record['size'])
+            pixels = np.frombuffer(zlib.decompress(data[start:end]),
+                                   dtype=np.uint8)
+            pixels = pixels.reshape(self.frame_shape(record))
+            if record['kind'] == DELTA:
+                pixels = np.bitwise_xor(pixels, frame)
+            frame = pixels
+            frame.flags.writeable = False
+            self.keep_decoded(int(record['frame']), frame)
+
+        return frame
+
+    def decode_before(self, num):
+        """Decodes the last frame before a frame missing from the cache.
+
+        Args:
+            num: Integer for the number of the missing frame.
+
+        Returns:
+            Numpy array of the decoded frame.
+
+        Raises:
+            IndexError: If there is no frame before the missing frame.
+        """
+
+        with self.index_lock:
+            numbers = self.index['frame']
+        earlier = numbers[numbers < num]
+        if not len(earlier):
+            raise IndexError(f'Frame {num} is missing from the cache')
+        log_txt = (f'Frame {num} is missing from the cache, frame '
+                   f'{int(earlier[-1])} is used until the next keyframe')
+        LOGGER.warning(log_txt)
+        return self.decode(int(earlier[-1]))
+
+    def keep_decoded(self, num, frame):
+        """Stores a decoded frame, removing the oldest ones over the limit."""
+
+        with self.decode_lock:
+            self.decoded[num] = frame
+            self.decoded.move_to_end(num)
+            while len(self.decoded) > self.max_decoded:
+                self.decoded.popitem(last=False)
+
+    @property
+    def timestamps(self):
+        """Numpy array of the capture time of each frame in seconds."""
+
+        return self.index['timestamp']
+
+    def close(self):
+        """Releases the memory mapped data file so the cache can be removed."""
+
+        with self.index_lock:
+            self.data = None
+        if self.ring is not None:
+            self.ring.close()
+            self.ring = None
+        with self.decode_lock:
+            self.decoded.clear()
@@ -0,0 +1,181 @@
+#!/usr/bin/python3
+"""This module schedules the capture of frames at a fixed frame rate."""
+
+import time
+import threading
+
+from THNScreenRecorder.THN_FileManagement import LOGGER
+
+
+class FrameClock:
+    """Deadline driven clock used to pace the capture of frames.
+
+    Instead of polling the current time in a loop the clock sleeps until the
+    deadline of the next frame. Every deadline is calculated from the start of
+    the recording, not from the previous frame, so any time lost to a slow
+    grab is not carried over to the following frames and the frame rate
+    doesn't drift over a long recording. If the capture falls behind by more
+    than a frame the missed deadlines are skipped and counted as dropped.
+
+    While the clock is paused the capture thread blocks on an Event, time
+    spent paused is removed from the schedule once the clock is resumed.
+
+    Args:
+        fps: Integer for the number of frames per second to capture.
+    """
+
+    # A frame is counted as late once it starts this fraction of a frame
+    # interval after its deadline.
+    LATE_TOLERANCE = 0.25
+
+    # **************************************************************************
+    # Init
+    def __init__(self, fps):
+        """Inits FrameClock with class attributes."""
+
+        self.fps = fps
+        self.interval = 1. / fps
+
+        # Set when the clock is running, cleared while paused.
+        self._running = threading.Event()
+        self._running.set()
+        # Used to wake the clock up early when the capture is stopped.
+        self._wake = threading.Event()
+        self.stopped = False
+
+        self.start_time = None
+        self.stopped_at = None
+        self.paused_at = None
+        self.paused_duration = 0.
+        self.frame_index = 0
+
+        self.frames = 0
+        self.late_frames = 0
+        self.dropped_frames = 0
+        self.max_lateness = 0.
+        # Running sums used for the mean and jitter of the lateness.
+        self.total_lateness = 0.
+        self.total_lateness_sq = 0.
+
+    # **************************************************************************
+    # Funtions
+    def start(self):
+        """Sets the start of the schedule to the current time."""
+
+        self.start_time = time.perf_counter()
+        self.frame_index = 0
+
+    def deadline(self, index):
+        """Returns the time the frame at 'index' should be captured at."""
+
+        return self.start_time + self.paused_duration + index * self.interval
+
+    def wait_next(self):
+        """Blocks until the next frame is due.
+
+        Returns:
+            True when a frame should be captured, False if the clock has been
+            stopped while waiting.
+        """
+
+        if self.start_time is None:
+            self.start()
+
+        while not self.stopped:
+            # Block without using any CPU while the recording is paused.
+            if not self._running.is_set():
+                self._running.wait()
+                continue
+
+            next_deadline = self.deadline(self.frame_index)
+            remaining = next_deadline - time.perf_counter()
+            if remaining > 0:
+                self._wake.wait(remaining)
+                # The clock may have been paused or stopped while sleeping.
+                continue
+
+            lateness = -remaining
+            if lateness >= self.interval:
+                # Skip deadlines that have already passed.
+                missed = int(lateness // self.interval)
+                self.dropped_frames += missed
+                self.frame_index += missed
+                lateness -= missed * self.interval
+
+            if lateness > self.interval * self.LATE_TOLERANCE:
+                self.late_frames += 1
+            self.max_lateness = max(self.max_lateness, lateness)
+            self.total_lateness += lateness
+            self.total_lateness_sq += lateness * lateness
+
+            self.frame_index += 1
+            self.frames += 1
+            return True
+
+        return False
+
+    def pause(self):
+        """Pauses the clock, the capture thread blocks on the next wait."""
+
+        if self.paused_at is None:
+            self.paused_at = time.perf_counter()
+        self._running.clear()
+
+    def resume(self):
+        """Resumes the clock, removing the paused time from the schedule."""
+
+        if self.paused_at is not None:
+            self.paused_duration += time.perf_counter() - self.paused_at
+            self.paused_at = None
+        self._running.set()
+
+    def stop(self):
+        """Stops the clock and wakes up any thread waiting on it."""
+
+        self.stopped = True
+        self.stopped_at = time.perf_counter()
+        self._wake.set()
+        self._running.set()
+
+    def elapsed(self):
+        """Returns the number of seconds the clock has been running for.
+
+        Any time spent paused or after the clock was stopped is excluded.
+        """
+
+        if self.start_time is None:
+            return 0.
+        now = self.paused_at or self.stopped_at or time.perf_counter()
+        return now - self.start_time - self.paused_duration
+
+    def stats(self):
+        """Returns a Dict of the timing statistics for the recording.
+
+        The jitter is the standard deviation of how late each frame was
+        captured compared to its deadline.
+        """
+
+        elapsed = self.elapsed()
+        achieved_fps = self.frames / elapsed if elapsed else 0.
+        frames = max(self.frames, 1)
+        mean_lateness = self.total_lateness / frames
+        variance = self.total_lateness_sq / frames - mean_lateness ** 2
+        return {'frames': self.frames,
+                'late_frames': self.late_frames,
+                'dropped_frames': self.dropped_frames,
+                'mean_lateness_ms': mean_lateness * 1000,
+                'jitter_ms': max(variance, 0.) ** 0.5 * 1000,
+                'max_lateness_ms': self.max_lateness * 1000,
+                'achieved_fps': achieved_fps}
+
+    def log_stats(self):
+        """Writes the timing statistics of the recording to the logger."""
+
+        stats = self.stats()
+        log_txt = (f'Captured {stats["frames"]} frames at '
+                   f'{stats["achieved_fps"]:.2f} fps (target {self.fps}), '
+                   f'{stats["late_frames"]} late, '
+                   f'{stats["dropped_frames"]} dropped, '
+                   f'jitter {stats["jitter_ms"]:.2f}ms, '
+                   f'max lateness {stats["max_lateness_ms"]:.1f}ms')
+        LOGGER.info(log_txt)
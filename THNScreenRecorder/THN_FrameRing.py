@@ -0,0 +1,240 @@
+#!/usr/bin/python3
+"""This module holds captured frames in a ring of shared memory slots.
+
+The ring is a single block of shared memory split in to a table with an entry
+for each slot and a fixed number of frame slots, each big enough for one
+uncompressed frame. The capture copies a frame in to a free slot instead of
+writing it to the data file of the frame cache, processing workers in any
+process read the frame straight from the slot and free it once the frame has
+been converted. When every slot is in use the frame is spilled to the frame
+cache on disk instead.
+"""
+
+import threading
+from multiprocessing import shared_memory
+
+import numpy as np
+
+from THNScreenRecorder.THN_FileManagement import LOGGER
+
+# Slots are aligned so every frame starts on a cache line.
+SLOT_ALIGNMENT = 64
+
+# Frame number stored in the table for a slot that can be used.
+FREE_SLOT = -1
+
+
+def get_table_size(num_slots):
+    """Returns the number of bytes used by the table of a ring's slots."""
+
+    return -(-num_slots * 8 // SLOT_ALIGNMENT) * SLOT_ALIGNMENT
+
+
+class FrameRing:
+    """Fixed size ring of frame slots in shared memory.
+
+    The process that creates the ring owns it and is the only one that puts
+    frames in to it, other processes attach to it by name to read and free
+    slots. Each entry of the table holds the number of the frame in the slot
+    so a frame is never read from a slot that has been reused.
+
+    Args:
+        shm: SharedMemory block holding the table and the slots.
+        num_slots: Integer for the number of frame slots.
+        slot_size: Integer for the number of bytes in each slot.
+        owner: Boolean for if this object created the shared memory and is
+            responsible for removing it.
+    """
+
+    # **************************************************************************
+    # Init
+    def __init__(self, shm, num_slots, slot_size, owner=False):
+        """Inits FrameRing with class attributes."""
+
+        self.shm = shm
+        self.name = shm.name
+        self.num_slots = num_slots
+        self.slot_size = slot_size
+        self.owner = owner
+
+        table_size = get_table_size(num_slots)
+        self.table = np.ndarray((num_slots,), dtype='<i8', buffer=shm.buf)
+        self.slots = np.ndarray((num_slots, slot_size), dtype=np.uint8,
+                                buffer=shm.buf, offset=table_size)
+
+        self.lock = threading.Lock()
+        self.next_slot = 0
+        self.frames_stored = 0
+        self.frames_spilled = 0
+        self.peak_used = 0
+
+    @classmethod
+    def create(cls, size_mb, frame_size, max_frames=None):
+        """Creates a new ring in shared memory.
+
+        Args:
+            size_mb: Integer for the most megabytes the ring can use.
+            frame_size: Integer for the number of bytes in the largest frame
+                that will be stored.
+            max_frames: Integer for the most frames the ring holds, None to
+                fill the whole size.
+
+        Returns:
+            FrameRing object owning the new ring, or None if the ring is too
+            small to hold a frame or the shared memory can't be created.
+        """
+
+        slot_size = -(-int(frame_size) // SLOT_ALIGNMENT) * SLOT_ALIGNMENT
+        num_slots = int(size_mb) * 1024 ** 2 // (slot_size + 8)
+        if max_frames is not None:
+            num_slots = min(num_slots, int(max_frames))
+        if slot_size <= 0 or num_slots < 1:
+            return None
+        size = get_table_size(num_slots) + num_slots * slot_size
+        try:
+            shm = shared_memory.SharedMemory(create=True, size=size)
+        except OSError as e:
+            log_error = f'Error creating frame ring of {size_mb}MB: {e}'
+            LOGGER.error(log_error)
+            return None
+        ring = cls(shm, num_slots, slot_size, owner=True)
+        ring.table[:] = FREE_SLOT
+        log_txt = (f'Frame ring {ring.name} created with {num_slots} slots of '
+                   f'{slot_size / 1024 ** 2:.1f}MB')
+        LOGGER.info(log_txt)
+        return ring
+
+    @classmethod
+    def attach(cls, name, num_slots, slot_size):
+        """Opens a ring created by another object or process.
+
+        Args:
+            name: String for the name of the shared memory block.
+            num_slots: Integer for the number of frame slots.
+            slot_size: Integer for the number of bytes in each slot.
+
+        Returns:
+            FrameRing object, or None if the ring no longer exists.
+        """
+
+        try:
+            shm = shared_memory.SharedMemory(name=name)
+        except OSError as e:
+            log_error = f'Error opening frame ring {name}: {e}'
+            LOGGER.error(log_error)
+            return None
+        return cls(shm, num_slots, slot_size)
+
+    # **************************************************************************
+    # Funtions
+    def info(self):
+        """Returns a Dict of the values needed to attach to the ring."""
+
+        return {'name': self.name, 'num_slots': self.num_slots,
+                'slot_size': self.slot_size}
+
+    def put(self, num, frame):
+        """Copies a frame in to a free slot.
+
+        Args:
+            num: Integer for the frame number.
+            frame: Contiguous numpy array of the frame.
+
+        Returns:
+            Integer for the slot the frame was stored in, or None if the ring
+            is full or the frame is too big for a slot.
+        """
+
+        if frame.nbytes > self.slot_size:
+            self.frames_spilled += 1
+            return None
+
+        with self.lock:
+            # Search for a free slot starting after the last one used.
+            order = np.roll(np.arange(self.num_slots), -self.next_slot)
+            free = order[self.table[order] == FREE_SLOT]
+            if not len(free):
+                self.frames_spilled += 1
+                return None
+            slot = int(free[0])
+            self.table[slot] = num
+            self.next_slot = (slot + 1) % self.num_slots
+            self.frames_stored += 1
+            self.peak_used = max(self.peak_used, self.num_slots - len(free) + 1)
+
+        self.slots[slot, :frame.nbytes] = frame.reshape(-1)
+        return slot
+
+    def frame(self, slot, num, shape):
+        """Returns the frame stored in a slot.
+
+        Args:
+            slot: Integer for the slot the frame was stored in.
+            num: Integer for the frame number.
+            shape: Tuple for the (height, width, channels) of the frame.
+
+        Returns:
+            Read-only numpy array viewing the slot, or None if the slot no
+            longer holds the frame or the ring has been closed.
+        """
+
+        # The arrays are kept so the ring can't be closed while reading.
+        table, slots = self.table, self.slots
+        if table is None or slots is None or table[slot] != num:
+            return None
+        frame = slots[slot, :int(np.prod(shape))].reshape(shape)
+        frame.flags.writeable = False
+        return frame
+
+    def release(self, slot, num):
+        """Frees a slot so it can be used for another frame.
+
+        Args:
+            slot: Integer for the slot the frame was stored in.
+            num: Integer for the frame number, the slot is only freed if it
+                still holds this frame.
+        """
+
+        table = self.table
+        if table is not None and table[slot] == num:
+            table[slot] = FREE_SLOT
+
+    def slots_used(self):
+        """Returns the number of slots holding a frame."""
+
+        table = self.table
+        if table is None:
+            return 0
+        return int(np.count_nonzero(table != FREE_SLOT))
+
+    def close(self):
+        """Closes this object's access to the shared memory."""
+
+        self.table = None
+        self.slots = None
+        try:
+            self.shm.close()
+        except BufferError:
+            # Frames are still being viewed, the memory is released once
+            # they have been garbage collected.
+            log_txt = f'Frame ring {self.name} still in use when closed'
+            LOGGER.warning(log_txt)
+
+    def unlink(self):
+        """Closes the ring and removes the shared memory if it's the owner."""
+
+        self.close()
+        if not self.owner:
+            return
+        try:
+            self.shm.unlink()
+        except FileNotFoundError:
+            pass
+
+    def log_stats(self):
+        """Writes the number of frames stored and spilled to the logger."""
+
+        log_txt = (f'Frame ring stored {self.frames_stored} frames, '
+                   f'{self.frames_spilled} spilled to disk, peak '
+                   f'{self.peak_used}/{self.num_slots} slots')
+        LOGGER.info(log_txt)
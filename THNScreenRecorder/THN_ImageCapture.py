@@ -1,16 +1,21 @@
 #!/usr/bin/python3
 """This module captures the screen and saves the files to a cache folder."""
 
-import time
-
-import mss
-import mss.tools
-import numpy as np
+import math
 
+import cv2
 from PySide6.QtCore import QObject
 
 from THNScreenRecorder.THN_PySideSignals import PySideSignals
-from THNScreenRecorder.THN_FileManagement import (LOCAL_CACHE, CACHE_FORMAT,
+from THNScreenRecorder.THN_FrameClock import FrameClock
+from THNScreenRecorder.THN_CaptureBackends import create_capture_backend
+from THNScreenRecorder.THN_CacheWriter import CacheWriter
+from THNScreenRecorder.THN_FrameCache import FrameCacheWriter
+from THNScreenRecorder.THN_FrameRing import FrameRing
+from THNScreenRecorder.THN_FrameArena import FrameArena, BufferPool
+from THNScreenRecorder.THN_ScalingPlan import (DEFAULT_RESIZE_QUALITY,
+                                               get_scaling_plan)
+from THNScreenRecorder.THN_FileManagement import (LOCAL_CACHE, IMAGE_RES,
                                                   LOGGER, create_folder)
 
 
@@ -19,8 +24,9 @@ class ImageCapture(QObject):
 
     The coordinates of the screen covered by the main UI are used to grab 
     images of the users screen and save the information in temp numpy arrays 
-    which are output to temporary .npy files to be converted once the 
-    capturing is complete.
+    which are appended to a frame cache to be converted once the capturing is
+    complete. While there is room the frames are held in a shared memory ring
+    instead of being written to disk.
 
     Args:
         width: Integer for the width of the UI window.
@@ -29,11 +35,50 @@ class ImageCapture(QObject):
             upper left corner.
         clip_name: String for the name of the clip being recorded, input by the
             user. 
+        fps: Integer for the number of frames to capture per second.
+        backend: String for the name of the capture backend used to grab the
+            frames, defaults to 'mss'.
+        writers: Integer for the number of threads writing frames to the cache.
+        queue_size: Integer for the maximum number of frames held in memory
+            while waiting to be written to the cache.
+        backpressure: String for what happens when the queue is full, 'drop'
+            to skip the new frame or 'block' to wait for space in the queue.
+        compression: String for the compression used in the frame cache,
+            'none' or 'zlib'.
+        level: Integer for the compression level of the frame cache.
+        delta: Boolean for if compressed frames are stored as the difference
+            to the previous frame.
+        keyframe_interval: Integer for how often a full frame is stored when
+            delta encoding is used.
+        skip_duplicates: Boolean for if frames identical to the previous frame
+            are stored as a reference instead of new pixels.
+        scale_at_capture: Boolean for if frames larger than the output 
+            resolution are scaled down before they are cached, instead of when
+            they are processed.
+        cache_folder: String for the folder to cache the frames in, defaults
+            to a folder named after the clip in the local cache.
+        ring_size_mb: Integer for the most megabytes of shared memory used by
+            the ring frames are stored in before the cache on disk is used, 0
+            to write every frame to disk.
+        ring_seconds: Float for the seconds of frames the ring holds when
+            frames are processed and freed while recording, 0 for a ring of
+            ring_size_mb that holds as much of the take as it can.
+        ring_info: Dict from 'FrameRing.info' of a ring created by another
+            process, frames are stored in it instead of a new ring.
+        resolution: Tuple for the (width, height) of the output frames.
+        resize_quality: String for the quality of the filter used to scale
+            frames at capture time, 'fast', 'balanced' or 'best'.
     """
 
     # **************************************************************************
     # Init
-    def __init__(self, width, height, widget_pos, clip_name, fps):
+    def __init__(self, width, height, widget_pos, clip_name, fps, backend='mss',
+                 writers=2, queue_size=30, backpressure='drop',
+                 compression='none', level=1, delta=False, keyframe_interval=30,
+                 skip_duplicates=True, scale_at_capture=False,
+                 cache_folder=None, ring_size_mb=1024,
+                 ring_seconds=0, ring_info=None,
+                 resolution=IMAGE_RES, resize_quality=DEFAULT_RESIZE_QUALITY):
         """Inits ImageCapture with class attributes."""
 
         super().__init__()
@@ -42,15 +87,75 @@ class ImageCapture(QObject):
         self.signals = PySideSignals()
 
         # Set folder for frames based on user name input.
-        self.cache = f'{LOCAL_CACHE}\\{clip_name}'
+        self.cache = cache_folder or f'{LOCAL_CACHE}\\{clip_name}'
+        self.cache_options = {'compression': compression, 'level': level,
+                              'delta': delta,
+                              'keyframe_interval': keyframe_interval,
+                              'skip_duplicates': skip_duplicates}
 
         # Default 
         self.capturing = False
-        self.capturing_paused = False
         self.frame_width = width
         self.frame_height = height
         self.widget_position = widget_pos
         self.fps = fps
+        self.backend = backend
+        self.region_changed = False
+        self.scale_at_capture = scale_at_capture
+        self.resolution = tuple(resolution)
+        self.resize_quality = resize_quality
+        # Plan for fitting frames of the current region to the output.
+        self.scaling_plan = get_scaling_plan(width, height, self.resolution,
+                                             resize_quality)
+        self.capture_canceled = False
+        self.ring_size_mb = int(ring_size_mb)
+        self.ring_seconds = float(ring_seconds)
+        self.ring_info = ring_info
+        self.frame_ring = None
+
+        self.create_capture_loop(writers, queue_size, backpressure)
+
+    def create_capture_loop(self, writers, queue_size, backpressure):
+        """Creates the objects used by the capture loop.
+
+        Args:
+            writers: Integer for the number of threads writing frames to the
+                cache.
+            queue_size: Integer for the maximum number of frames held in
+                memory while waiting to be written to the cache.
+            backpressure: String for what happens when the queue is full,
+                'drop' or 'block'.
+        """
+
+        # Frames are written to the cache from a queue on background threads.
+        self.writer = CacheWriter(self.save_frame, writers, queue_size,
+                                  backpressure)
+
+        # Converted frames are held in pooled buffers until they have been
+        # written, and scratch buffers are reused for every frame, so the
+        # capture loop doesn't allocate a new frame each time.
+        self.frame_pool = BufferPool(self.writer.max_queue + 4)
+        self.arena = FrameArena()
+
+        # Clock used to schedule when each frame is captured.
+        self.clock = FrameClock(self.fps)
+
+    # **************************************************************************
+    # Properties
+    @property
+    def capturing_paused(self):
+        """Boolean for if the capture has been paused by the user."""
+
+        return self.clock.paused_at is not None
+
+    @capturing_paused.setter
+    def capturing_paused(self, paused):
+        """Pauses or resumes the frame clock used by the capture loop."""
+
+        if paused:
+            self.clock.pause()
+        else:
+            self.clock.resume()
 
     # **************************************************************************
     # Funtions
@@ -59,87 +164,242 @@ class ImageCapture(QObject):
 
         LOGGER.info('Image capture initiated')
         self.capturing = True
-        self.capture_screen()
+        try:
+            self.capture_screen()
+        except Exception as e:
+            log_error = f'Error capturing screen: {e!r}'
+            LOGGER.error(log_error)
+            self.abort_capture()
 
     def update_position(self, new_position):
+        """Sets a new area of the screen to capture.
+
+        The capture backend is rebuilt for the new region by the capture
+        thread before it grabs the next frame.
+
+        Args:
+            new_position: List containing the new width, height and position
+                of the UI window, [width, height, position].
+        """
+
         LOGGER.info('Updating window position')
         self.frame_width = new_position[0]
         self.frame_height = new_position[1]
         self.widget_position = new_position[2]
+        self.scaling_plan = get_scaling_plan(self.frame_width,
+                                             self.frame_height, self.resolution,
+                                             self.resize_quality)
+        self.region_changed = True
         log_txt = (f'New window dimentions: {self.frame_width},'
                    f'{self.frame_height}, {self.widget_position}')
         LOGGER.info(log_txt)
 
+    def get_region(self):
+        """Returns the area of the screen to capture.
+
+        Returns:
+            Tuple in the format (left, top, width, height).
+        """
+
+        pos = self.widget_position
+        return (pos.x(), pos.y(), self.frame_width, self.frame_height)
+
+    def get_cache_size(self):
+        """Returns the size frames are stored at in the cache.
+
+        Returns:
+            Tuple for the (width, height) of the cached frames, None if frames
+            are cached at the size they are captured.
+        """
+
+        plan = self.scaling_plan
+        if not self.scale_at_capture or not plan.resize:
+            return None
+        log_txt = f'Frames will be scaled from {plan.source_size} to {plan.size}'
+        LOGGER.info(log_txt)
+        return plan.size
+
+    def create_frame_ring(self, cache_size=None):
+        """Creates the shared memory ring the captured frames are stored in.
+
+        Each slot is big enough for a frame of the current region, frames
+        captured after the region grows are written to the cache on disk.
+        Frames are only freed from the ring once they are processed, so when
+        processing waits for the recording to stop the ring is as big as the
+        most megabytes set, and frames that don't fit are written to disk.
+        When frames are processed while recording the ring only holds a few
+        seconds of frames, as it's emptied as it's filled.
+
+        Args:
+            cache_size: Tuple for the (width, height) frames are cached at,
+                None if frames are cached at the size they are captured.
+
+        Returns:
+            FrameRing object, or None if the ring is disabled.
+        """
+
+        self.release_frame_ring()
+        if self.ring_info:
+            self.frame_ring = FrameRing.attach(**self.ring_info)
+            return self.frame_ring
+        if self.ring_size_mb <= 0:
+            return None
+        width, height = cache_size or (self.frame_width, self.frame_height)
+        max_frames = None
+        if self.ring_seconds > 0:
+            max_frames = max(math.ceil(self.fps * self.ring_seconds), 1)
+        self.frame_ring = FrameRing.create(self.ring_size_mb,
+                                           width * height * 3, max_frames)
+        return self.frame_ring
+
+    def release_frame_ring(self):
+        """Removes the frame ring once its frames are no longer needed."""
+
+        if self.frame_ring is not None:
+            self.frame_ring.unlink()
+            self.frame_ring = None
+
+    def capture_stats(self):
+        """Returns a Dict of the timing and cache statistics of the capture."""
+
+        stats = self.clock.stats()
+        stats.update({'cache_frames': self.frame_cache.frames_written,
+                      'cache_bytes': self.frame_cache.bytes_written,
+                      'ring_frames': self.frame_cache.ring_frames,
+                      'pool_allocations': self.frame_pool.allocations,
+                      'queue_dropped': self.writer.frames_dropped})
+        return stats
+
     def cancel_capture(self):
         """If user cancels the process emit Signals to UI to stop QThread."""
 
         if self.capturing:
             LOGGER.warning('Canceling capture sent from app exit')
+            self.capture_canceled = True
             self.capturing = False
+            self.clock.stop()
             self.signals.canceled.emit()
         self.signals.finished.emit()
 
+    def abort_capture(self):
+        """Ends a capture that could not run, emitting Signals to the UI so
+        the QThread stops and the recording is canceled."""
+
+        self.capture_canceled = True
+        self.capturing = False
+        self.clock.stop()
+        # Stops any cache writers started before the capture failed.
+        self.writer.close()
+        self.signals.canceled.emit()
+        self.signals.finished.emit()
+
     def stop_capture(self):
-        """Once the process is stopped emit Signals to UI to stop QThread.
+        """Stops the capture loop running on the QThread.
 
-        When capture process is stopped the cache file is emitted back to the
-        main UI to be used to collect recorded files.
+        Once the capture loop has finished and every queued frame has been 
+        written, the cache folder is emitted back to the main UI to be used to
+        collect recorded files.
         """
 
         LOGGER.info('Capture stopped')
         self.capturing = False
-        self.signals.captured_frames.emit(self.cache)
-        self.signals.finished.emit()
+        self.clock.stop()
 
     def capture_screen(self):
-        """Creates cache folder and saves .npy files of captured screen.
+        """Creates cache folder and saves the frames of the captured screen.
 
-        Each captured frame is saved as a numpy binary file so that images are
+        Each captured frame is appended to the frame cache so that images are
         not stored in memory but read and converted to image files once the 
-        capturing is complete.
+        capturing is complete. The FrameClock sleeps the thread in between
+        frames so the capture doesn't keep a CPU core busy and the frames are
+        handed to the CacheWriter so the capture never waits on the disk.
 
         Returns:
             False if there are errors defining the output path.
         """
 
-        self.prev = 0
         num = 0
 
         cache_folder = create_folder(self.cache)
         if not cache_folder:
             LOGGER.error('Error creating cache folder')
+            self.abort_capture()
             return
 
-        while self.capturing:
-            if self.capturing_paused:
-                continue
-            time_elapsed = time.time() - self.prev
-
-            if time_elapsed > 1. / self.fps:
-                self.prev = time.time()
-                frame = self.screen_grab_mss(self.frame_width, self.frame_height,
-                                             self.widget_position)
-                np.save(f'{self.cache}\\frame_{num:04}{CACHE_FORMAT}', frame)
-                num += 1
-
+        # One grabber is opened for the whole recording and only rebuilt when
+        # the region changes.
+        self.region_changed = False
+        cache_size = self.get_cache_size()
+        grabber = create_capture_backend(self.backend, self.get_region(),
+                                         self.fps)
+        frame_ring = self.create_frame_ring(cache_size)
+        self.frame_cache = FrameCacheWriter(self.cache, ring=frame_ring,
+                                            **self.cache_options)
+        self.frame_cache.open()
+        self.signals.cache_opened.emit(self.cache)
+        self.writer.start()
+        # The last frame queued is passed along with the next frame so it can
+        # be stored as a delta or skipped if nothing has changed. The capture
+        # loop holds a reference to the previous frame until the next frame is
+        # queued, when its reference is handed over to the queue.
+        previous = None
+        with grabber:
+            self.clock.start()
+            while self.capturing and self.clock.wait_next():
+                if self.region_changed:
+                    self.region_changed = False
+                    grabber.set_region(self.get_region())
+                    cache_size = self.get_cache_size()
+                timestamp = self.clock.elapsed()
+                frame = grabber.grab()
+                if cache_size:
+                    scaled = self.arena.get(
+                        'scaled', (cache_size[1], cache_size[0], 4))
+                    frame = self.scaling_plan.scale_frame(frame, dst=scaled)
+                # Drop the alpha channel and store the frame as packed RGB.
+                rgb = self.frame_pool.acquire(frame.shape[:2] + (3,))
+                frame = cv2.cvtColor(frame, cv2.COLOR_BGRA2RGB, dst=rgb)
+                if self.writer.put(num, frame, timestamp, previous):
+                    # One reference for the queue and one kept as previous.
+                    self.frame_pool.retain(frame)
+                    previous = frame
+                    num += 1
+                else:
+                    self.frame_pool.release(frame)
+
+        # Wait for any frames still in the queue to be written.
+        self.writer.close()
+        self.frame_pool.release(previous)
+        self.arena.clear()
+        self.frame_cache.close()
+        self.frame_cache.log_stats()
+        if frame_ring is not None:
+            frame_ring.log_stats()
+        self.writer.log_stats()
+        self.clock.log_stats()
+        pool_stats = self.frame_pool.stats()
+        log_txt = (f'Frame pool allocated {pool_stats["allocations"]} buffers, '
+                   f'reused {pool_stats["reuses"]} times')
+        LOGGER.info(log_txt)
         LOGGER.info('Capturing screen finished')
 
-    def screen_grab_mss(self, w, h, pos):
-        """Grabs area of the screen to be saved to image sequence.
+        if not self.capture_canceled:
+            self.signals.captured_frames.emit(self.cache)
+            self.signals.finished.emit()
 
-        Using the variables defined when the class is executed on the QThread,
-        the specific area of the screen is saved. The mss module is used for 
-        this over PIL as it's much faster.
+    def save_frame(self, num, frame, timestamp, previous):
+        """Appends a captured frame to the frame cache, used by CacheWriter.
 
-        Returns:
-            mss.screenshot.ScreenShot object to be saved as numpy binary file.
+        Args:
+            num: Integer for the frame number.
+            frame: Numpy array of the captured frame.
+            timestamp: Float for the time in seconds the frame was captured.
+            previous: Numpy array of the frame queued before this one.
         """
 
-        left = pos.x()
-        upper = pos.y()
-        right = w
-        lower = h
-        with mss.mss() as sct:
-            monitor = {"top": upper, "left": left, "width": right, "height": lower}
-            sct_img = sct.grab(monitor)
-            return sct_img
+        try:
+            self.frame_cache.append(num, frame, timestamp, previous)
+        finally:
+            # The queue's references to both frames are no longer needed.
+            self.frame_pool.release(frame)
+            self.frame_pool.release(previous)
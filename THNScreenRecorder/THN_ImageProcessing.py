@@ -2,14 +2,448 @@
 """This module reads and converts captured caches files to an image sequence."""
 
 import os
+import time
+import threading
+import multiprocessing
+from functools import partial
+from concurrent.futures import ProcessPoolExecutor
 
 import cv2
+import psutil
 import numpy as np
-from PIL import Image
-from PySide6.QtCore import QThreadPool, QObject, QRunnable, Slot
+from PySide6.QtCore import QThread, QThreadPool, QObject, QRunnable, Slot
 
 from THNScreenRecorder.THN_PySideSignals import PySideSignals
-from THNScreenRecorder.THN_FileManagement import IMAGE_RES, LOGGER, write_image
+from THNScreenRecorder.THN_Pipeline import Pipeline, PipelineStage
+from THNScreenRecorder.THN_FrameCache import RGB, BGRA, FrameCacheReader
+from THNScreenRecorder.THN_FrameArena import BufferPool, get_thread_arena
+from THNScreenRecorder.THN_OverlayCache import OverlayCache, blend_overlay
+from THNScreenRecorder.THN_OutputCodecs import DEFAULT_CODEC, TILE_SIZE
+from THNScreenRecorder.THN_ScalingPlan import (DEFAULT_RESIZE_QUALITY,
+                                               get_scaling_plan)
+from THNScreenRecorder.THN_Renditions import (create_rendition_folders,
+                                              write_renditions,
+                                              write_encoded_rendition,
+                                              link_renditions)
+from THNScreenRecorder.THN_FileManagement import (IMAGE_RES, LOGGER, write_image,
+                                                  encode_image,
+                                                  write_encoded_image,
+                                                  duplicate_image)
+
+# Backends used to run the conversion of frames, threads share the memory of
+# the UI process while processes each have their own interpreter and GIL. The
+# pipeline splits the conversion in to stages each with their own threads.
+THREADS = 'threads'
+PROCESSES = 'processes'
+PIPELINE = 'pipeline'
+
+# Modes for writing tiled TIFFs, in 'auto' frames are only tiled when fewer
+# frames are encoded at once than there are CPU cores.
+TILED_AUTO = 'auto'
+TILED_ON = 'on'
+TILED_OFF = 'off'
+
+# Number of seconds between checks of the progress while processing.
+PROGRESS_INTERVAL = 0.1
+
+# Number of seconds between checks for new frames while streaming.
+STREAM_INTERVAL = 0.5
+
+# Objects opened once by each worker process of the process pool.
+_process_worker = {}
+
+
+def get_timing_stats(timestamps, fps):
+    """Measures how evenly a sequence of frames was captured.
+
+    Args:
+        timestamps: Numpy array of the capture time of each frame in seconds.
+        fps: Integer for the frame rate the frames should have been captured.
+
+    Returns:
+        Dict of the achieved frame rate, the standard deviation of the time
+        between frames (jitter) and the longest gap between two frames.
+    """
+
+    intervals = np.diff(timestamps)
+    duration = float(timestamps[-1] - timestamps[0])
+    achieved_fps = len(intervals) / duration if duration > 0 else 0.
+    return {'target_fps': fps,
+            'achieved_fps': achieved_fps,
+            'jitter_ms': float(intervals.std()) * 1000,
+            'max_gap_ms': float(intervals.max()) * 1000}
+
+
+def retime_frames(timestamps, fps):
+    """Maps a constant frame rate output sequence on to captured frames.
+
+    Each output frame uses the captured frame closest to it in time. When the
+    capture fell behind a captured frame is used more than once and if frames
+    were captured too quickly some of them are skipped.
+
+    Args:
+        timestamps: Numpy array of the capture time of each frame in seconds,
+            in increasing order.
+        fps: Integer for the frame rate of the output sequence.
+
+    Returns:
+        Numpy array of the position of the captured frame to use for each
+        frame of the output sequence.
+    """
+
+    num_captured = len(timestamps)
+    if num_captured < 2:
+        return np.arange(num_captured)
+
+    duration = timestamps[-1] - timestamps[0]
+    num_output = int(round(duration * fps)) + 1
+    output_times = timestamps[0] + np.arange(num_output) / fps
+
+    after = np.searchsorted(timestamps, output_times).clip(1, num_captured - 1)
+    before = after - 1
+    use_before = ((output_times - timestamps[before])
+                  <= (timestamps[after] - output_times))
+    return np.where(use_before, before, after)
+
+
+def get_canvas(resolution=IMAGE_RES):
+    """Returns the output canvas of the current thread.
+
+    Each thread keeps its own canvas in its FrameArena so frames converted at
+    the same time don't share memory, the canvas is only allocated again if
+    the resolution changes.
+
+    Args:
+        resolution: Tuple for the (width, height) of the output frame.
+
+    Returns:
+        Numpy array of shape (height, width, 3), the contents are left over
+        from the last frame converted on the thread.
+    """
+
+    shape = (resolution[1], resolution[0], 3)
+    return get_thread_arena().get('canvas', shape)
+
+
+def composite_frame(image, canvas, overlay=None):
+    """Letterboxes an RGB image in the centre of the canvas.
+
+    Only the bars around the image are cleared, the rest of the canvas is
+    overwritten by the image, so a canvas can be reused without clearing it
+    between frames. An image that was written straight in to the canvas
+    region of its ScalingPlan isn't copied.
+
+    Args:
+        image: Numpy array of the RGB frame, no larger than the canvas.
+        canvas: Numpy array of the RGB output frame, changed in place.
+        overlay: List of overlay strips created by 'create_overlay' which
+            are blended over the frame.
+
+    Returns:
+        Numpy array of the canvas.
+    """
+
+    canvas_height, canvas_width = canvas.shape[:2]
+    height, width = image.shape[:2]
+    left = (canvas_width - width) // 2
+    top = (canvas_height - height) // 2
+    bottom = top + height
+    right = left + width
+
+    canvas[:top] = 0
+    canvas[bottom:] = 0
+    canvas[top:bottom, :left] = 0
+    canvas[top:bottom, right:] = 0
+    if not np.may_share_memory(image, canvas):
+        canvas[top:bottom, left:right] = image
+
+    if overlay:
+        blend_overlay(canvas, overlay)
+    return canvas
+
+
+def load_frame(img):
+    """Loads a captured frame if it was saved as a .npy file.
+
+    Args:
+        img: Numpy array of the captured frame or the string file path of a
+            saved .npy file.
+
+    Returns:
+        Numpy array of the frame, or None if the file couldn't be found.
+    """
+
+    if type(img) == str:
+        try:
+            img = np.load(img)
+        except FileNotFoundError as e:
+            log_error = f'Error loading cached frame: {e}'
+            LOGGER.error(log_error)
+            return None
+    return img
+
+
+def transform_frame(num, img, swatches=None, channel_order=BGRA, canvas=None,
+                    resolution=IMAGE_RES, resize_quality=DEFAULT_RESIZE_QUALITY):
+    """Performs checks and adjustments to a frame before it's encoded.
+
+    Once the captured image is read the ScalingPlan for its size is used to
+    see if it needs to be scaled to the output resolution before overlaying
+    with value swatches. The colour conversion and the resize write straight in to
+    the canvas where they can, so apart from a scratch buffer of the thread's
+    FrameArena no memory is allocated for the frame.
+
+    Args:
+        num: Integer for the output frame number.
+        img: Numpy array of the captured frame.
+        swatches: List of overlay strips created by 'create_overlay'.
+        channel_order: String for the order of the colour channels of the
+            captured frame, 'RGB' or 'BGRA'.
+        canvas: Numpy array the output frame is composited on, the canvas of
+            the current thread is used if not set.
+        resolution: Tuple for the (width, height) of the output frame, the
+            size of the canvas is used if it's set.
+        resize_quality: String for the quality of the filter used to scale
+            the frame, 'fast', 'balanced' or 'best'.
+
+    Returns:
+        Numpy array of the RGB output frame.
+    """
+
+    if canvas is None:
+        canvas = get_canvas(resolution)
+    resolution = (canvas.shape[1], canvas.shape[0])
+    img = np.asarray(img, dtype=np.uint8)
+
+    # The third integer unpacked here is the depth of the image which we
+    # don't need. Frames of the same size share a plan, frames already
+    # scaled at capture time will fit.
+    im_height, im_width, _ = img.shape
+    plan = get_scaling_plan(im_width, im_height, resolution, resize_quality)
+    region = plan.canvas_region(canvas)
+
+    if channel_order == RGB:
+        # Frames converted at capture time can be used without a copy.
+        img_capture_np = img
+    elif plan.resize:
+        # Convert between BGRA and RGB in a single pass.
+        rgb = get_thread_arena().get('rgb', (im_height, im_width, 3))
+        img_capture_np = cv2.cvtColor(img, cv2.COLOR_BGRA2RGB, dst=rgb)
+    else:
+        img_capture_np = cv2.cvtColor(img, cv2.COLOR_BGRA2RGB, dst=region)
+
+    if plan.resize:
+        # Use openCV to scale down the image with the filters of the plan.
+        im_resize_np = plan.scale_frame(img_capture_np, dst=region)
+    else:
+        im_resize_np = img_capture_np
+
+    # Letterbox the frame on the canvas and, if the swatches overlay image
+    # was found, blend it over the capture.
+    return composite_frame(im_resize_np, canvas, swatches)
+
+
+def convert_frame(num, img, out_path, project, swatches=None,
+                  channel_order=BGRA, duplicates=(), codec=DEFAULT_CODEC,
+                  resolution=IMAGE_RES, resize_quality=DEFAULT_RESIZE_QUALITY,
+                  renditions=()):
+    """Converts a captured frame and saves it to disk.
+
+    The frame is written along with any duplicate frames, and any renditions
+    are scaled from the same output frame.
+
+    Args:
+        num: Integer for the output frame number.
+        img: Numpy array of the captured frame or the string file path of a
+            saved .npy file.
+        out_path: String for the full file path of where the converted file
+            should be saved to.
+        project: String for the project used to tag the image files.
+        swatches: List of overlay strips created by 'create_overlay'.
+        channel_order: String for the order of the colour channels of the
+            captured frame, 'RGB' or 'BGRA'.
+        duplicates: List of frame numbers to be linked to the converted frame.
+        codec: OutputCodec the frame is encoded with.
+        resolution: Tuple for the (width, height) of the output frame.
+        resize_quality: String for the quality of the filter used to scale
+            the frame.
+        renditions: List of Rendition objects written alongside the frame.
+
+    Returns:
+        Integer for the number of frames written, 0 if the frame couldn't be
+        loaded.
+    """
+
+    img = load_frame(img)
+    if img is None:
+        return 0
+    output_frame = transform_frame(num, img, swatches, channel_order,
+                                   resolution=resolution,
+                                   resize_quality=resize_quality)
+
+    # Write final image to disk.
+    write_image(output_frame, out_path, project, frame_number=num,
+                codec=codec)
+    for duplicate_number in duplicates:
+        duplicate_image(out_path, num, duplicate_number, codec.extension)
+    write_renditions(output_frame, out_path, project, num, renditions,
+                     duplicates)
+    return 1 + len(duplicates)
+
+
+def init_process_worker(cache_folder, out_path, project, swatch_path,
+                        channel_order, low_priority=False, gate=None,
+                        release_frames=False, codec=DEFAULT_CODEC,
+                        resolution=IMAGE_RES,
+                        resize_quality=DEFAULT_RESIZE_QUALITY, renditions=()):
+    """Opens the frame cache and overlay once in each worker process.
+
+    Args:
+        cache_folder: String for the frame cache folder, or None if the
+            frames are sent to the worker with each task.
+        out_path: String for the full file path of where the converted files
+            should be saved to.
+        project: String for the project used to tag the image files.
+        swatch_path: String to the full file path of the swatch image.
+        channel_order: String for the order of the colour channels of the
+            captured frames.
+        low_priority: multiprocessing Event set while the worker should run
+            at a lower priority than the capture, None to keep the priority.
+        gate: multiprocessing Event the worker waits on before converting
+            each frame, frames are only converted while it's set.
+        release_frames: Boolean for if frames held in the frame ring should
+            be freed once they have been converted.
+        codec: OutputCodec the frames are encoded with.
+        resolution: Tuple for the (width, height) of the output frames.
+        resize_quality: String for the quality of the filter used to scale
+            the frames.
+        renditions: List of Rendition objects written alongside the frames.
+    """
+
+    _process_worker['low_priority'] = low_priority
+    _process_worker['priority_lowered'] = False
+    set_worker_priority()
+
+    _process_worker['frames'] = (FrameCacheReader(cache_folder)
+                                 if cache_folder else None)
+    _process_worker['swatches'] = OverlayCache(resolution).swatches(
+        swatch_path)
+    _process_worker['settings'] = (out_path, project, channel_order, codec,
+                                   resolution, resize_quality, renditions)
+    _process_worker['gate'] = gate
+    _process_worker['release_frames'] = release_frames
+
+
+def set_worker_priority():
+    """Lowers the priority of a worker process while the recording runs.
+
+    The priority is checked before each batch, so once the recording stops
+    the rest of the clip is converted at normal priority.
+    """
+
+    low_priority = _process_worker['low_priority']
+    lowered = low_priority is not None and low_priority.is_set()
+    if lowered == _process_worker['priority_lowered']:
+        return
+    _process_worker['priority_lowered'] = lowered
+    if os.name == 'nt':
+        priority = (psutil.BELOW_NORMAL_PRIORITY_CLASS if lowered
+                    else psutil.NORMAL_PRIORITY_CLASS)
+    else:
+        priority = 10 if lowered else 0
+    try:
+        psutil.Process().nice(priority)
+    except (psutil.AccessDenied, PermissionError) as e:
+        log_txt = f'Worker process priority could not be changed: {e}'
+        LOGGER.warning(log_txt)
+
+
+def convert_batch_in_process(batch):
+    """Converts a batch of frames inside a worker process of the pool.
+
+    Args:
+        batch: List of Tuples for each frame in the format (frame, output
+            frame number, duplicate frame numbers), the frame is the position
+            in the frame cache or the frame itself if the worker has no frame
+            cache.
+
+    Returns:
+        Integer for the number of frames written.
+    """
+
+    frames = _process_worker['frames']
+    (out_path, project, channel_order, codec, resolution, resize_quality,
+     renditions) = _process_worker['settings']
+    gate = _process_worker['gate']
+    set_worker_priority()
+    frames_written = 0
+    for frame, num, duplicates in batch:
+        if gate is not None:
+            gate.wait()
+        position = None
+        if frames is not None:
+            # Frames may have been added to the cache since it was opened.
+            if frame >= len(frames):
+                frames.refresh()
+            position, frame = frame, frames[frame]
+        frames_written += convert_frame(num, frame, out_path, project,
+                                        _process_worker['swatches'],
+                                        channel_order, duplicates, codec,
+                                        resolution, resize_quality,
+                                        renditions)
+        if position is not None and _process_worker['release_frames']:
+            frames.release(position)
+    return frames_written
+
+
+class FrameCounter:
+    """Thread safe count of the frames finished by the workers.
+
+    Workers add to the counter once they finish a batch of frames instead of
+    emitting a Signal for every frame, the processor waits on the counter to
+    report the progress and to limit how many batches are in flight.
+    """
+
+    # **************************************************************************
+    # Init
+    def __init__(self):
+        """Inits FrameCounter with class attributes."""
+
+        self.condition = threading.Condition()
+        self.frames = 0
+        self.batches = 0
+        self.canceled = False
+
+    # **************************************************************************
+    # Funtions
+    def add(self, num_frames, num_batches=1):
+        """Records a finished batch and wakes up any waiting thread.
+
+        Args:
+            num_frames: Integer for the number of output frames in the batch.
+            num_batches: Integer for the number of batches finished.
+        """
+
+        with self.condition:
+            self.frames += num_frames
+            self.batches += num_batches
+            self.condition.notify_all()
+
+    def wait(self, num_batches, timeout=None):
+        """Blocks until a number of batches have finished or the timeout.
+
+        Args:
+            num_batches: Integer for the total number of finished batches to
+                wait for.
+            timeout: Float for the maximum number of seconds to wait.
+
+        Returns:
+            True if the batches have finished.
+        """
+
+        with self.condition:
+            return self.condition.wait_for(
+                lambda: self.batches >= num_batches, timeout)
 
 
 class ImageProcessor(QObject):
@@ -18,20 +452,68 @@ class ImageProcessor(QObject):
     To reduce any lag of hanging in the main UI thread the processing of 
     captured frames are passed to a new QThread which off loads each frame in 
     to a queue managed by the global QThreadPool that picks up each frame when
-    a thread becomes available.
+    a thread becomes available. Alternatively the frames can be converted by
+    a pool of worker processes, each reading frames straight from the frame
+    cache, so the conversion isn't limited by the GIL of the UI process, or
+    by a pipeline of stages where reading the cache and writing the images
+    run on I/O threads separately from the CPU heavy transform and encode.
+
+    When streaming, processing starts with the recording and frames are
+    converted as soon as they are added to the frame cache, using a single
+    batch at a time at a low priority so the capture isn't disturbed. Once
+    'recording_finished' is called only the end of the clip is left.
 
     Args:
         start_num: Integer for what the number of the start frame should be.
-        frames: List of the full paths to all recorded frame files.
+        frames: FrameCacheReader, or any sequence, of all recorded frames in
+            the order they were captured.
         output: String for where the final images should be saved.
         project_name: String name of the current project selected by the user
             which will be used to tag the image files.
         swatch_file: String to the full file path of the swatch image.
+        fps: Integer for the frame rate the frames were captured at.
+        retime: Boolean for if the frames should be retimed to a constant
+            frame rate using the time each frame was captured.
+        overlay_cache: OverlayCache used to load the swatch image, a new
+            cache is created if not set.
+        backend: String for how frames are converted, 'threads', 'processes'
+            or 'pipeline'.
+        pool_size: Integer for the number of worker processes, or the number
+            of threads of each CPU stage of the pipeline, the number of CPU
+            cores is used if not set.
+        batch_size: Integer for the number of unique frames given to a worker
+            at a time.
+        max_in_flight: Integer for the maximum number of batches waiting or
+            being converted, twice the number of workers if not set.
+        io_threads: Integer for the number of threads of the load and write
+            stages of the pipeline.
+        stage_queue_size: Integer for the maximum number of frames waiting
+            between two stages of the pipeline.
+        streaming: Boolean for if frames should be converted while they are
+            still being recorded, frames can't be retimed when streaming.
+        pause_only: Boolean for if a streaming processor should only convert
+            frames while the recording is paused.
+        codec: OutputCodec the output frames are encoded with, deflate TIFF
+            files are written if not set.
+        tiled_output: String for when TIFF frames are written as tiles
+            compressed on several threads, 'auto', 'on' or 'off'.
+        tile_size: Integer for the size of the square tiles.
+        resolution: Tuple for the (width, height) of the output frames.
+        resize_quality: String for the quality of the filter used to scale
+            frames larger than the output, 'fast', 'balanced' or 'best'.
+        renditions: List of Rendition objects, e.g. proxies and thumbnails,
+            written from the same output frames in the same pass.
     """
 
     # **************************************************************************
     # Init
-    def __init__(self, start_num, frames, output, project_name, swatch_file=None):
+    def __init__(self, start_num, frames, output, project_name, swatch_file=None,
+                 fps=None, retime=False, overlay_cache=None, backend=THREADS,
+                 pool_size=None, batch_size=8, max_in_flight=None,
+                 io_threads=4, stage_queue_size=8, streaming=False,
+                 pause_only=False, codec=None, tiled_output=TILED_AUTO,
+                 tile_size=TILE_SIZE, resolution=IMAGE_RES,
+                 resize_quality=DEFAULT_RESIZE_QUALITY, renditions=None):
         """Inits ImageProcessor with class attributes."""
 
         super().__init__()
@@ -41,10 +523,83 @@ class ImageProcessor(QObject):
         self.processing_images = False
         self.start_frame = start_num
         self.captured_frame_list = frames
-        self.num_frames = len(self.captured_frame_list)
+        self.fps = fps
+        self.streaming = streaming
+        # Frames are being recorded until 'recording_finished' is called.
+        self.recording = streaming
+        self.stream_wake = threading.Event()
+        self.stopped_at = None
+        self.pause_only = streaming and pause_only
+        self.capture_paused = False
+        # Streamed frames are freed from the frame ring once converted so the
+        # capture can reuse their slots.
+        self.release_frames = streaming
+        if streaming and retime:
+            LOGGER.warning('Frames can not be retimed while streaming')
+            retime = False
+        self.retime = retime
+        # Position in the captured frames to use for each output frame.
+        self.frame_order = self.get_frame_order()
+        self.num_frames = len(self.frame_order)
+        # Frames from the cache are already RGB, .npy files are BGRA.
+        self.channel_order = getattr(frames, 'channel_order', BGRA)
         self.output_path = output
         self.project = project_name
         self.swatch_path = swatch_file
+        self.resolution = tuple(resolution)
+        self.resize_quality = resize_quality
+        # Single frame renditions, e.g. the thumbnail, use the first frame.
+        self.renditions = [rendition.for_clip(start_num)
+                           for rendition in renditions or ()]
+        # The codec used is chosen from the base codec once the number of
+        # frames to convert is known.
+        self.base_codec = codec or DEFAULT_CODEC
+        self.codec = self.base_codec
+        if tiled_output not in (TILED_AUTO, TILED_ON, TILED_OFF):
+            log_txt = (f'Unknown tiled output mode {tiled_output}, using '
+                       f'{TILED_AUTO}')
+            LOGGER.warning(log_txt)
+            tiled_output = TILED_AUTO
+        self.tiled_output = tiled_output
+        self.tile_size = int(tile_size)
+        self.overlay_cache = overlay_cache or OverlayCache()
+        self.swatches = None
+
+        if backend not in (THREADS, PROCESSES, PIPELINE):
+            log_txt = f'Unknown processing backend {backend}, using {THREADS}'
+            LOGGER.warning(log_txt)
+            backend = THREADS
+        self.backend = backend
+        self.pool_size = int(pool_size or 0) or os.cpu_count()
+        self.process_pool = None
+        self.batch_size = max(int(batch_size), 1)
+        self.max_in_flight = int(max_in_flight or 0)
+        self.io_threads = max(int(io_threads), 1)
+        self.stage_queue_size = int(stage_queue_size)
+        self.pipeline = None
+        # Loaded frames and canvases passed between the pipeline stages are
+        # reused once transformed and encoded.
+        self.frame_pool = BufferPool()
+        self.canvas_pool = BufferPool()
+        self.frames_saved = 0
+        self.counter = FrameCounter()
+        # Duplicates of frames converted in an earlier round of streaming.
+        self.pending_links = []
+        # Workers wait on the gate before each frame, it's cleared while a
+        # recording that should only be processed during pauses is running.
+        # Worker processes need an Event that can be shared with them.
+        if backend == PROCESSES:
+            self.work_allowed = multiprocessing.Event()
+        else:
+            self.work_allowed = threading.Event()
+        if not self.pause_only:
+            self.work_allowed.set()
+        # Worker processes run at a low priority while this is set, it's
+        # cleared once the recording has finished.
+        self.low_priority = None
+        if backend == PROCESSES and streaming:
+            self.low_priority = multiprocessing.Event()
+            self.low_priority.set()
 
         self.image_process_threadpool = QThreadPool.globalInstance()
 
@@ -53,188 +608,724 @@ class ImageProcessor(QObject):
     def run(self):
         """This method is triggered once the QThread is started.
 
-        Each image file is converted on it's own QThread, all of the necessary
-        info is used when created the QRunnable object to keep track of the 
-        naming and image order. This way frames can be created out of order 
-        whenever new threads are available without breaking the recording.
+        The unique frames are split in to batches of neighbouring frames and
+        each batch is converted by a worker, all of the necessary info is
+        passed with the batch to keep track of the naming and image order.
+        This way frames can be created out of order whenever a worker becomes
+        available without breaking the recording. Only a limited number of
+        batches are handed out at once, this thread waits on the shared
+        counter of finished frames to report the progress back to the main UI.
+        Frames that are duplicates of an earlier frame are not converted
+        again, the output of the earlier frame is linked instead.
         """
 
-        # Loop over every cached file using the full file path and create a
-        # QThread for each image that is added to the queue.
-        num_threads = self.image_process_threadpool.maxThreadCount()
-        log_txt = f'Multithreading with maximum {num_threads} threads'
-        LOGGER.info(log_txt)
-
         # Reset the number of processed frames to keep track of new task.
         self.frames_saved = 0
+        self.counter = FrameCounter()
+        self.pending_links = []
 
         self.processing_images = True
-        frame_number = 0
-        frame_output_number = self.start_frame
 
+        num_unique = None
+        if not self.streaming:
+            frame_groups = self.group_duplicate_frames()
+            num_unique = len(frame_groups)
+            num_duplicates = self.num_frames - len(frame_groups)
+            log_txt = (f'Converting {len(frame_groups)} unique frames, '
+                       f'{num_duplicates} duplicate frames will be linked')
+            LOGGER.info(log_txt)
+        # The codec is passed to worker processes as the pool starts.
+        self.codec = self.choose_codec(num_unique)
+        create_rendition_folders(self.output_path, self.renditions)
+
+        if self.backend == PROCESSES:
+            submit_batch = self.start_process_pool()
+        elif self.backend == PIPELINE:
+            submit_batch = self.start_pipeline()
+        else:
+            submit_batch = self.start_thread_pool()
+
+        if self.streaming:
+            num_batches = self.stream_frames(submit_batch)
+        else:
+            batches = self.create_batches(frame_groups)
+            log_txt = (f'Converting in {len(batches)} batches of up to '
+                       f'{self.batch_size} frames, '
+                       f'{self.max_in_flight} in flight')
+            LOGGER.info(log_txt)
+            num_batches = self.submit_batches(batches, submit_batch)
+
+        if num_batches is None or not self.wait_for_batches(num_batches):
+            return
+        self.link_pending_frames()
+        self.processing_images = False
+        self.close_process_pool()
+        self.close_pipeline()
+
+        if self.stopped_at is not None:
+            log_txt = (f'Processing finished '
+                       f'{time.perf_counter() - self.stopped_at:.2f}s after '
+                       f'the recording was stopped')
+            LOGGER.info(log_txt)
+        self.signals.finished.emit()
+
+    def submit_batches(self, batches, submit_batch, num_submitted=0):
+        """Hands out batches to the workers keeping a limited number in flight.
+
+        While streaming frames from a recording that is still running only a
+        single batch is in flight at a time, unless the recording is paused.
+
+        Args:
+            batches: List of batches created by 'create_batches'.
+            submit_batch: Callable used to start converting a batch.
+            num_submitted: Integer for the number of batches already handed
+                out.
+
+        Returns:
+            Integer for the total number of batches handed out, or None if
+            processing was canceled.
+        """
+
+        for batch in batches:
+            max_in_flight = self.max_in_flight
+            if self.recording and not self.capture_paused:
+                max_in_flight = 1
+            # Wait for a batch to finish before handing out another.
+            if not self.wait_for_batches(num_submitted - max_in_flight + 1):
+                return None
+            submit_batch(batch)
+            num_submitted += 1
+        return num_submitted
+
+    def stream_frames(self, submit_batch):
+        """Converts frames as they are added to the frame cache.
+
+        The frame cache is read again every 'STREAM_INTERVAL' seconds and any
+        new frames are handed out to the workers, until the recording has
+        finished and the last frames have been read. If frames should only be
+        converted during pauses no frames are handed out while the recording
+        is running. Duplicates of frames handed out in an earlier round are
+        linked once every frame has been converted.
+
+        Args:
+            submit_batch: Callable used to start converting a batch.
+
+        Returns:
+            Integer for the total number of batches handed out, or None if
+            processing was canceled.
+        """
+
+        frames = self.captured_frame_list
+        next_position = 0
+        num_submitted = 0
         while self.processing_images:
-            current_frame = self.captured_frame_list[frame_number]
-            self.create_image_process_thread((frame_output_number, current_frame))
+            self.stream_wake.clear()
+            recording = self.recording
+            if recording and self.pause_only and not self.capture_paused:
+                self.stream_wake.wait(STREAM_INTERVAL)
+                continue
+            frames.refresh()
+            # Frames are written out of order by the cache writer threads,
+            # while recording only the complete start of the cache is used.
+            num_ready = frames.settled_frames() if recording else len(frames)
 
-            frame_number += 1
-            frame_output_number += 1
+            if num_ready > next_position:
+                self.frame_order = range(num_ready)
+                self.num_frames = num_ready
+                frame_groups = {}
+                new_groups = self.group_duplicate_frames(
+                    range(next_position, num_ready))
+                for source, output_numbers in new_groups.items():
+                    if source < next_position:
+                        source_number = self.start_frame + source
+                        self.pending_links.extend(
+                            (source_number, output_number)
+                            for output_number in output_numbers)
+                    else:
+                        frame_groups[source] = output_numbers
+                num_submitted = self.submit_batches(
+                    self.create_batches(frame_groups), submit_batch,
+                    num_submitted)
+                if num_submitted is None:
+                    return None
+                next_position = num_ready
 
-            if frame_number == self.num_frames:
-                return
+            if not recording:
+                log_txt = (f'Streamed {self.num_frames} frames, '
+                           f'{len(self.pending_links)} linked at the end')
+                LOGGER.info(log_txt)
+                return num_submitted
+            self.stream_wake.wait(STREAM_INTERVAL)
+        return None
+
+    def recording_finished(self):
+        """Tells a streaming processor that no more frames will be added.
+
+        The rest of the frames are converted with the full number of workers.
+        """
+
+        self.stopped_at = time.perf_counter()
+        log_txt = (f'Recording finished with {self.frames_saved} frames '
+                   f'already processed')
+        LOGGER.info(log_txt)
+        self.recording = False
+        self.work_allowed.set()
+        if self.low_priority is not None:
+            self.low_priority.clear()
+        self.stream_wake.set()
 
-    def create_image_process_thread(self, frame):
-        """Creates and starts a new QThread for the image capturing class.
+    def set_capture_paused(self, paused):
+        """Tells a streaming processor the recording was paused or resumed.
 
-        Once there is a list of file paths to process they are individually
-        added to the threadpool and converted as soon as a thread becomes free.
-        To keep the frames in order a number is passed along with the frame
-        using enumerate.
+        While the recording is paused the full number of batches are handed
+        out. When frames should only be converted during pauses the workers
+        stop before their next frame as soon as the recording is resumed, so
+        at most one frame per worker is converted alongside the capture.
 
         Args:
-            frame: Tuple containing of the full file path to the .npy frame as
-                well as the frame number, (number, file path).
+            paused: Boolean for if the recording has been paused.
         """
 
-        log_txt = f'Creating image processing thread for frame {frame[0]}'
+        self.capture_paused = paused
+        if self.pause_only and self.recording:
+            if paused:
+                self.work_allowed.set()
+            else:
+                self.work_allowed.clear()
+        log_txt = (f'Recording {"paused" if paused else "resumed"} with '
+                   f'{self.counter.frames} frames processed')
         LOGGER.info(log_txt)
-        self.processing_worker = ImageConvertor(frame, self.output_path, self.project,
-                                                self.swatch_path)
-        self.processing_worker.signals.finished.connect(self.image_processing_monitor)
-        self.image_process_threadpool.start(self.processing_worker)
+        self.stream_wake.set()
 
-    def image_processing_monitor(self):
-        """Keeps track of the number of frames that have been processed.
+    def choose_codec(self, num_unique=None):
+        """Picks the codec for the output frames, tiling them if the workers
+        would leave CPU cores idle.
+
+        Without tiles each frame is compressed on a single core, so when
+        fewer frames are encoded at once than there are cores, e.g. a short
+        clip or a clip of mostly duplicate frames, the tiles of each frame
+        are compressed on the spare cores instead. Streamed frames are only
+        tiled if tiling is forced on as they are converted alongside the
+        capture.
+
+        Args:
+            num_unique: Integer for the number of unique frames to convert,
+                None if it isn't known yet.
+
+        Returns:
+            OutputCodec object the frames are encoded with.
+        """
+
+        codec = self.base_codec
+        if self.tiled_output == TILED_OFF or not codec.can_tile:
+            return codec
+
+        if self.backend == PIPELINE:
+            encoders, batch_size = self.pool_size, 1
+        elif self.backend == PROCESSES:
+            encoders, batch_size = self.pool_size, self.batch_size
+        else:
+            encoders = self.image_process_threadpool.maxThreadCount()
+            batch_size = self.batch_size
+        if num_unique:
+            # Each batch is converted by one worker at a time.
+            encoders = min(encoders, -(-num_unique // batch_size))
+        tile_workers = (os.cpu_count() or 1) // max(encoders, 1)
+        if self.tiled_output == TILED_AUTO and (self.streaming
+                                                or tile_workers < 2):
+            return codec
+
+        codec = codec.tiled(max(tile_workers, 1), self.tile_size)
+        log_txt = (f'{encoders} frames encoded at once, tiles of each frame '
+                   f'compressed on {codec.workers} threads')
+        LOGGER.info(log_txt)
+        return codec
+
+    def link_pending_frames(self):
+        """Links duplicates of frames converted in an earlier round."""
+
+        for source_number, output_number in self.pending_links:
+            try:
+                duplicate_image(self.output_path, source_number, output_number,
+                                self.codec.extension)
+                link_renditions(self.output_path, source_number, output_number,
+                                self.renditions)
+            except OSError as e:
+                log_error = f'Error linking frame {output_number}: {e}'
+                LOGGER.error(log_error)
+        self.counter.add(len(self.pending_links), num_batches=0)
+        self.pending_links = []
+        self.image_processing_monitor()
+
+    def start_thread_pool(self):
+        """Prepares to convert the frames on the global QThreadPool.
+
+        Returns:
+            Callable used to start converting a batch of frames.
+        """
+
+        num_threads = self.image_process_threadpool.maxThreadCount()
+        log_txt = f'Multithreading with maximum {num_threads} threads'
+        LOGGER.info(log_txt)
+        self.max_in_flight = self.max_in_flight or num_threads * 2
+        self.load_swatches()
+        return self.create_image_process_thread
+
+    def start_pipeline(self):
+        """Prepares to convert the frames with a pipeline of stages.
+
+        Frames are read from the cache and written to the output folder by
+        I/O threads, while the transform and encode stages each have a thread
+        for every CPU core. Each unique frame runs through the pipeline on its
+        own so the batch size is set to a single frame.
 
-        The QThread created to convert the .npy file to an image file will emit
-        a PyQt Signal when it's finished which will keep increase the 
-        'frames_saved' variable. Once the number of frames saved equals the 
-        total number of frames recorded the 'finished' Signal will emit calling
-        the 'image_processing_finished' method in the main UI.
+        Returns:
+            Callable used to start converting a batch of frames.
         """
 
-        self.frames_saved += 1
-        prog = self.frames_saved / self.num_frames
-        self.signals.progress.emit(prog)
+        cpu_threads = self.pool_size
+        log_txt = (f'Pipeline with {self.io_threads} I/O threads and '
+                   f'{cpu_threads} threads for each CPU stage')
+        LOGGER.info(log_txt)
+        self.batch_size = 1
+        self.max_in_flight = (self.max_in_flight
+                              or (self.io_threads + cpu_threads) * 2)
+        self.load_swatches()
+
+        queue_size = self.stage_queue_size
+        self.pipeline = Pipeline(
+            [PipelineStage('load', self.load_stage, self.io_threads,
+                           queue_size),
+             PipelineStage('transform', self.transform_stage, cpu_threads,
+                           queue_size, self.release_loaded_frame),
+             PipelineStage('encode', self.encode_stage, cpu_threads,
+                           queue_size, self.release_output_frame),
+             PipelineStage('write', self.write_stage, self.io_threads,
+                           queue_size)],
+            on_error=self.pipeline_error)
+        self.pipeline.start()
+
+        def submit_batch(batch):
+            for position, num, duplicates in batch:
+                self.pipeline.put((num, duplicates, position))
+        return submit_batch
+
+    def load_stage(self, item):
+        """Pipeline stage reading a frame from the captured frames.
+
+        Cached frames are memory mapped, so the frame is copied in to a
+        pooled buffer here to read it from disk in this stage rather than
+        when it's transformed.
+        """
+
+        num, duplicates, position = item
+        img = load_frame(self.captured_frame_list[position])
+        if img is None:
+            raise OSError(f'Frame {num} could not be loaded')
+        img = np.asarray(img, dtype=np.uint8)
+        frame = self.frame_pool.acquire(img.shape)
+        np.copyto(frame, img)
+        # The frame has been copied so its slot of the ring can be reused.
+        if self.release_frames:
+            self.captured_frame_list.release(position)
+        return num, duplicates, position, frame
+
+    def transform_stage(self, item):
+        """Pipeline stage converting a frame to the output frame."""
+
+        num, duplicates, position, img = item
+        try:
+            self.work_allowed.wait()
+            # Each frame needs its own canvas as it's passed between threads.
+            width, height = self.resolution
+            canvas = self.canvas_pool.acquire((height, width, 3))
+            try:
+                output_frame = transform_frame(
+                    num, img, self.swatches, self.channel_order, canvas,
+                    resize_quality=self.resize_quality)
+            except Exception:
+                self.canvas_pool.release(canvas)
+                raise
+        finally:
+            self.frame_pool.release(img)
+        return num, duplicates, output_frame
+
+    def encode_stage(self, item):
+        """Pipeline stage encoding an output frame to an image file."""
+
+        num, duplicates, output_frame = item
+        self.work_allowed.wait()
+        try:
+            data = encode_image(output_frame, self.project, self.codec)
+            # Renditions are scaled from the frame before its canvas is freed.
+            renditions = [(rendition, rendition.encode(output_frame,
+                                                       self.project))
+                          for rendition in self.renditions
+                          if rendition.wants(num)]
+            return num, duplicates, data, renditions
+        finally:
+            self.canvas_pool.release(output_frame)
+
+    def write_stage(self, item):
+        """Pipeline stage writing an encoded frame and its duplicates."""
+
+        num, duplicates, data, renditions = item
+        extension = self.codec.extension
+        write_encoded_image(data, self.output_path, num, extension)
+        for duplicate_number in duplicates:
+            duplicate_image(self.output_path, num, duplicate_number, extension)
+        for rendition, rendition_data in renditions:
+            write_encoded_rendition(rendition, rendition_data,
+                                    self.output_path, num, duplicates)
+        self.counter.add(1 + len(duplicates))
+
+    def release_loaded_frame(self, item):
+        """Gives back the buffer of a loaded frame dropped by the pipeline."""
+
+        self.frame_pool.release(item[3])
+
+    def release_output_frame(self, item):
+        """Gives back the canvas of an output frame dropped by the pipeline."""
+
+        self.canvas_pool.release(item[2])
 
-        if prog == 1.0 or not self.processing_images:
-            self.signals.finished.emit()
+    def pipeline_error(self, item):
+        """Counts a frame dropped by the pipeline so progress can finish."""
+
+        duplicates = item[1]
+        self.counter.add(1 + len(duplicates))
+
+    def close_pipeline(self):
+        """Stops the pipeline threads and logs the use of each stage."""
+
+        if self.pipeline is None or self.pipeline.closed:
+            return
+        self.pipeline.close()
+        self.pipeline.log_stats()
+        for name, pool in (('frame buffers', self.frame_pool),
+                           ('canvases', self.canvas_pool)):
+            pool_stats = pool.stats()
+            log_txt = (f'Pipeline allocated {pool_stats["allocations"]} '
+                       f'{name}, reused {pool_stats["reuses"]} times')
+            LOGGER.info(log_txt)
+
+    def load_swatches(self):
+        """Loads the swatches once, every convertor shares the same arrays."""
+
+        self.swatches = self.overlay_cache.swatches(self.swatch_path,
+                                                    self.resolution)
+        if self.swatches is None:
+            LOGGER.warning('Swatch overlay not found, frames will not have '
+                           'swatches')
+
+    def start_process_pool(self):
+        """Prepares to convert the frames using a pool of worker processes.
+
+        Each worker opens the frame cache and the swatch overlay once, so the
+        only thing sent to a worker for each frame is its position and frame
+        numbers. Only the number of frames written is sent back, which is
+        added to the shared counter.
+
+        Returns:
+            Callable used to start converting a batch of frames.
+        """
+
+        log_txt = f'Multiprocessing with {self.pool_size} processes'
+        LOGGER.info(log_txt)
+        self.max_in_flight = self.max_in_flight or self.pool_size * 2
+
+        # Frames from the cache are read by the workers themselves, any other
+        # frames are sent to the worker with the task.
+        cache_folder = getattr(self.captured_frame_list, 'folder', None)
+        self.process_pool = ProcessPoolExecutor(
+            max_workers=self.pool_size, initializer=init_process_worker,
+            initargs=(cache_folder, self.output_path, self.project,
+                      self.swatch_path, self.channel_order, self.low_priority,
+                      self.work_allowed, self.release_frames, self.codec,
+                      self.resolution, self.resize_quality, self.renditions))
+
+        def submit_batch(batch):
+            num_frames = sum(1 + len(duplicates) for _, _, duplicates in batch)
+            if cache_folder is None:
+                batch = [(self.captured_frame_list[position], num, duplicates)
+                         for position, num, duplicates in batch]
+            future = self.process_pool.submit(convert_batch_in_process, batch)
+            future.add_done_callback(partial(self.process_finished,
+                                             num_frames))
+        return submit_batch
+
+    def process_finished(self, num_frames, future):
+        """Called when a worker process has finished converting a batch.
+
+        Failed frames are logged and still counted so the progress can
+        finish.
+
+        Args:
+            num_frames: Integer for the number of output frames of the batch.
+            future: Future of the finished batch.
+        """
+
+        if future.cancelled():
+            return
+        try:
+            future.result()
+        except Exception as e:
+            log_error = f'Error converting frames in worker process: {e}'
+            LOGGER.error(log_error)
+        self.counter.add(num_frames)
+
+    def close_process_pool(self):
+        """Shuts down the worker processes, cancelling any queued frames."""
+
+        if self.process_pool is None:
+            return
+        self.process_pool.shutdown(wait=False, cancel_futures=True)
+        self.process_pool = None
+
+    def create_batches(self, frame_groups):
+        """Splits the unique frames in to batches of neighbouring frames.
+
+        Args:
+            frame_groups: Dict of the unique frames created by
+                'group_duplicate_frames'.
+
+        Returns:
+            List of batches, each a List of Tuples in the format (position in
+            the captured frames, output frame number, duplicate frame numbers).
+        """
+
+        tasks = [(position, output_numbers[0], output_numbers[1:])
+                 for position, output_numbers in frame_groups.items()]
+        return [tasks[i:i + self.batch_size]
+                for i in range(0, len(tasks), self.batch_size)]
+
+    def wait_for_batches(self, num_batches):
+        """Reports the progress until a number of batches have finished.
+
+        Args:
+            num_batches: Integer for the total number of finished batches to
+                wait for.
+
+        Returns:
+            False if processing was canceled while waiting.
+        """
+
+        while self.processing_images:
+            finished = self.counter.wait(num_batches, PROGRESS_INTERVAL)
+            self.image_processing_monitor()
+            if finished:
+                return True
+        return False
+
+    def get_frame_order(self):
+        """Finds which captured frame is used for each output frame.
+
+        If the capture time of each frame is known the timing of the capture
+        is logged and, if retiming is enabled, the frames are retimed to the 
+        nominal frame rate.
+
+        Returns:
+            List or numpy array of the position of the captured frame for each
+            output frame.
+        """
+
+        num_captured = len(self.captured_frame_list)
+        timestamps = getattr(self.captured_frame_list, 'timestamps', None)
+        if not self.fps or timestamps is None or num_captured < 2:
+            return range(num_captured)
+
+        stats = get_timing_stats(timestamps, self.fps)
+        log_txt = (f'Clip was captured at {stats["achieved_fps"]:.2f} fps '
+                   f'(target {self.fps}), jitter {stats["jitter_ms"]:.1f}ms, '
+                   f'longest gap {stats["max_gap_ms"]:.1f}ms')
+        LOGGER.info(log_txt)
+
+        if not self.retime:
+            return range(num_captured)
+
+        frame_order = retime_frames(timestamps, self.fps)
+        log_txt = (f'Retimed {num_captured} captured frames to '
+                   f'{len(frame_order)} frames at {self.fps} fps')
+        LOGGER.info(log_txt)
+        return frame_order
+
+    def group_duplicate_frames(self, output_indices=None):
+        """Groups the output frame numbers by the frame holding their pixels.
+
+        Frames that were retimed to be used more than once are grouped in the
+        same way as frames which were captured as duplicates.
+
+        Args:
+            output_indices: Range of the output frames to group, every output
+                frame is grouped if not set.
+
+        Returns:
+            Dict with the position of each unique frame in the captured frames
+            as the key and a List of the output frame numbers using it as the
+            value, the first being the unique frame itself.
+        """
+
+        frames = self.captured_frame_list
+        source_position = getattr(frames, 'source_position', None)
+        if output_indices is None:
+            output_indices = range(len(self.frame_order))
+        frame_groups = {}
+        for output_index in output_indices:
+            source = int(self.frame_order[output_index])
+            if source_position is not None:
+                source = source_position(source)
+            output_number = self.start_frame + output_index
+            frame_groups.setdefault(source, []).append(output_number)
+        return frame_groups
+
+    def create_image_process_thread(self, batch):
+        """Creates and starts a new QRunnable to convert a batch of frames.
+
+        Once there is a batch of frames to process it's added to the
+        threadpool and converted as soon as a thread becomes free.
+
+        Args:
+            batch: List of Tuples for each frame in the format (position in
+                the captured frames, output frame number, duplicate frame
+                numbers).
+        """
+
+        log_txt = f'Creating image processing thread for frames {batch[0][1]}+'
+        LOGGER.debug(log_txt)
+        processing_worker = ImageConvertor(batch, self.captured_frame_list,
+                                           self.output_path, self.project,
+                                           self.counter, self.swatches,
+                                           self.channel_order, self.recording,
+                                           self.work_allowed,
+                                           self.release_frames, self.codec,
+                                           self.resolution,
+                                           self.resize_quality,
+                                           self.renditions)
+        self.image_process_threadpool.start(processing_worker)
+
+    def image_processing_monitor(self):
+        """Reports the number of frames that have been processed.
+
+        The workers add to the shared counter when they finish a batch, when
+        the count has changed the 'progress' Signal is emitted with the
+        fraction of frames saved back to the main UI. No progress is emitted
+        while streaming frames of a recording that is still running.
+        """
+
+        frames_saved = self.counter.frames
+        if frames_saved == self.frames_saved:
+            return
+        self.frames_saved = frames_saved
+        if self.recording:
+            return
+        self.signals.progress.emit(frames_saved / max(self.num_frames, 1))
 
     def cancel_processor(self):
         """Cancels processing the list of captured frames."""
 
         self.processing_images = False
+        self.counter.canceled = True
+        # Release any workers waiting for the recording to be paused.
+        self.work_allowed.set()
         self.image_process_threadpool.clear()
+        self.close_process_pool()
+        if self.pipeline is not None:
+            self.pipeline.cancel()
+        self.close_pipeline()
         self.signals.finished.emit()
 
 
 class ImageConvertor(QRunnable):
-    """Converts saved numpy binary file to image file.
+    """Converts a batch of cached frames to image files.
+
+    Each frame is read and composited once, any renditions are scaled from
+    the composited frame and written with it.
 
     Args:
-        captured_frame: Tuple containing the string file path of the saved .npy
-            file as well as the integer frame number (frame number, path)
+        batch: List of Tuples for each frame in the format (position in the
+            captured frames, output frame number, duplicate frame numbers).
+        frames: FrameCacheReader, or any sequence, the frames are read from.
         out_path: String for the full file path of where the converted file 
             should be saved to.
         project_name: String name of the current project selected by the user
             which will be used to tag the image files.
-        swatches: String to the full file path of the swatch image.
+        counter: FrameCounter the finished frames are added to.
+        swatches: List of overlay strips created by 'create_overlay' for the
+            swatch image, shared read-only between all convertors.
+        channel_order: String for the order of the colour channels of the 
+            captured frame, 'RGB' or 'BGRA'.
+        low_priority: Boolean for if the thread should run at a low priority
+            while converting the batch, e.g. while still recording.
+        gate: Event waited on before converting each frame, frames are only
+            converted while it's set.
+        release_frames: Boolean for if frames held in the frame ring should
+            be freed once they have been converted.
+        codec: OutputCodec the frames are encoded with.
+        resolution: Tuple for the (width, height) of the output frames.
+        resize_quality: String for the quality of the filter used to scale
+            the frames.
+        renditions: List of Rendition objects written alongside the frames.
     """
 
     # **************************************************************************
     # Init
-    def __init__(self, captured_frame, out_path, project_name, swatches=None):
+    def __init__(self, batch, frames, out_path, project_name, counter,
+                 swatches=None, channel_order=BGRA, low_priority=False,
+                 gate=None, release_frames=False, codec=DEFAULT_CODEC,
+                 resolution=IMAGE_RES, resize_quality=DEFAULT_RESIZE_QUALITY,
+                 renditions=()):
         """Inits ImageConvertor with class attributes."""
 
         super().__init__()
 
-        self.signals = PySideSignals()
-
+        self.batch = batch
+        self.frames = frames
         self.path = out_path
-        self.frame = captured_frame
         self.project = project_name
-        self.swatch_path = swatches
+        self.counter = counter
+        self.swatch = swatches
+        self.channel_order = channel_order
+        self.low_priority = low_priority
+        self.gate = gate
+        self.release_frames = release_frames
+        self.codec = codec
+        self.resolution = resolution
+        self.resize_quality = resize_quality
+        self.renditions = renditions
 
     # **************************************************************************
     # Funtions
     @Slot()
     def run(self):
         """This method is triggered once the QThread is started."""
-        
-        # Check if slate file can be found before processing.
-        if os.path.exists(self.swatch_path):
-            self.swatch = Image.open(self.swatch_path)
-        else:
-            self.swatch = None
 
-        self.prepare_image()
+        # Threads of the pool are reused so the priority is always set.
+        priority = QThread.NormalPriority
+        if self.low_priority:
+            priority = QThread.LowestPriority
+        QThread.currentThread().setPriority(priority)
 
-    def prepare_image(self):
-        """Performs checks and adjustments to file before saving to disk.
-
-        Once the captured image is read the resolution is checked against the
-        default settings to see if it needs to be scaled before overlaying with
-        value swatches. Once image is written to disk the 'finished' Signal is 
-        emitted back to the main UI to track the progress of entire sequence.
-        """
+        try:
+            self.prepare_images()
+        except Exception as e:
+            log_error = f'Error converting frames: {e}'
+            LOGGER.error(log_error)
+        finally:
+            # Failed frames are still counted so the progress can finish.
+            self.counter.add(sum(1 + len(duplicates)
+                                 for _, _, duplicates in self.batch))
 
-        num, img = self.frame
+    def prepare_images(self):
+        """Converts each frame of the batch, stopping if canceled."""
 
-        if type(img) == str:
-            try:
-                img = np.load(img)
-            except FileNotFoundError as e:
-                log_error = f'Error loading cached frame: {e}'
-                LOGGER.error(log_error)
+        for position, num, duplicates in self.batch:
+            if self.gate is not None:
+                self.gate.wait()
+            if self.counter.canceled:
                 return
-
-        img_blank = Image.new('RGB', (IMAGE_RES[0], IMAGE_RES[1]))
-        img_np = np.array(img, dtype=np.uint8)
-
-        # Flip the numpy array to convert between BRG and RGB.
-        img_capture_np = np.flip(img_np[:, :, :3], 2)
-
-        # Use openCV to scale down the image, the third integer unpacked here
-        # is the depth of the image which we don't need.
-        im_height, im_width, _ = img_capture_np.shape
-
-        # Standard HD resolution to scale down to unless specified in settings.
-        w_out, h_out = IMAGE_RES
-
-        # OpenCV pixel interp to use for shaper images.
-        im_interp = cv2.INTER_LANCZOS4
-
-        # Check frame size and see if it needs scaling down.
-        if (im_width, im_height) > IMAGE_RES:
-            log_txt = (f'Image {num} is being resized from '
-                       f'({im_width}, {im_height}) to {IMAGE_RES}')
-            LOGGER.info(log_txt)
-            if im_width > w_out:
-                ratio = w_out / im_width
-            else:
-                ratio = h_out / im_height
-            new_w = int(im_width * ratio)
-            new_h = int(im_height * ratio)
-            im_resize_np = cv2.resize(img_capture_np,
-                                      dsize=(new_w, new_h),
-                                      interpolation=im_interp)
-        else:
-            im_resize_np = img_capture_np
-
-        # Convert image back to PIL for combining with overlay images.
-        image_resized = Image.fromarray(np.uint8(im_resize_np)).convert('RGB')
-
-        # Grab the width / height once captured frame is conformed to HD.
-        new_w, new_h = image_resized.size
-        offset = ((IMAGE_RES[0] - new_w) // 2, (IMAGE_RES[1] - new_h) // 2)
-
-        # The output frame is a PIL object.
-        output_frame = img_blank
-        output_frame.paste(image_resized, offset)
-
-        # If swatches overlay image is found overlay with capture.
-        if self.swatch is not None:
-            output_frame.paste(self.swatch, (0, 0), mask=self.swatch)
-
-        # Write final image to disk.
-        write_image(output_frame, self.path, self.project, frame_number=num)
-        self.signals.finished.emit()
+            convert_frame(num, self.frames[position], self.path, self.project,
+                          self.swatch, self.channel_order, duplicates,
+                          self.codec, self.resolution, self.resize_quality,
+                          self.renditions)
+            if self.release_frames:
+                self.frames.release(position)
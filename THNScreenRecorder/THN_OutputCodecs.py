@@ -0,0 +1,316 @@
+#!/usr/bin/python3
+"""This module encodes the output frames of a recording to image files.
+
+The codec used for the image sequence is chosen in the settings file, each
+codec encodes an RGB frame to the bytes of an image file so the encoding can
+be done apart from writing the file, e.g. in a different pipeline stage.
+TIFF can be written with no compression, LZW, deflate or zstd, PNG and JPEG
+are written with OpenCV.
+"""
+
+import io
+
+import cv2
+import numpy as np
+from tifffile import imwrite
+
+from THNScreenRecorder.THN_FrameArena import get_thread_arena
+from THNScreenRecorder.THN_FileManagement import IMAGE_FORMAT, LOGGER
+
+# Compression schemes the TIFF codec can use, LZW and zstd are encoded by the
+# imagecodecs module.
+TIFF_COMPRESSIONS = ('none', 'lzw', 'deflate', 'zstd')
+
+# Compression schemes that don't take a compression level.
+NO_LEVEL_COMPRESSIONS = ('none', 'lzw')
+
+# Width and height in pixels of the tiles of a tiled TIFF, TIFF needs them to
+# be a multiple of 16.
+TILE_SIZE = 256
+
+
+class OutputCodec:
+    """Base class for the codecs output frames can be encoded with.
+
+    Codecs only hold their settings so they can be sent to worker processes
+    and shared between threads.
+    """
+
+    name = None
+    extension = IMAGE_FORMAT
+    # Codecs that can split a frame in to tiles compressed on several threads.
+    can_tile = False
+    # Only lossless codecs can be used for the review frames.
+    lossless = True
+
+    # **************************************************************************
+    # Funtions
+    def encode(self, image, description=None):
+        """Encodes an output frame in memory.
+
+        Args:
+            image: Numpy array of the RGB frame.
+            description: String stored in the image file where the format
+                allows it, e.g. the project name.
+
+        Returns:
+            Bytes of the encoded image file.
+        """
+
+        raise NotImplementedError
+
+    def label(self):
+        """Returns a String describing the codec and its settings."""
+
+        return self.name
+
+
+class TiffCodec(OutputCodec):
+    """Encodes output frames as TIFF files with tifffile.
+
+    Files with no compression, LZW or deflate can be read by every review
+    tool, zstd is much faster to write but needs a reader built with zstd
+    support, e.g. a recent libtiff. A frame written in strips is compressed
+    on a single thread, a tiled frame can have its tiles compressed on
+    several threads. Tiled TIFFs are read by libtiff based tools but not by
+    every simple image reader.
+
+    Args:
+        compression: String for the compression scheme, one of 'none', 'lzw',
+            'deflate' or 'zstd'.
+        level: Integer for the compression level, the default level of the
+            scheme is used if not set. LZW has no levels.
+        predictor: Boolean for if horizontal differencing is applied before
+            compressing, it often makes screen captures smaller.
+        tile_size: Integer for the size of the square tiles the frame is
+            split in to, the frame is written in strips if not set.
+        workers: Integer for the number of threads compressing the tiles of
+            a frame at once.
+    """
+
+    name = 'tiff'
+    extension = '.tiff'
+
+    # **************************************************************************
+    # Init
+    def __init__(self, compression='deflate', level=None, predictor=False,
+                 tile_size=None, workers=1):
+        """Inits TiffCodec with class attributes."""
+
+        if compression not in TIFF_COMPRESSIONS:
+            raise ValueError(f'Unknown TIFF compression {compression}')
+        self.compression = compression
+        self.level = None
+        if level not in (None, '') and compression not in NO_LEVEL_COMPRESSIONS:
+            self.level = int(level)
+        self.predictor = bool(predictor) and compression != 'none'
+        # Tiles only save time if there is something to compress.
+        self.can_tile = compression != 'none'
+        self.tile_size = None
+        if tile_size:
+            self.tile_size = max(int(tile_size) // 16, 1) * 16
+        self.workers = max(int(workers), 1)
+
+    # **************************************************************************
+    # Funtions
+    def encode(self, image, description=None):
+        """Encodes an output frame as a TIFF file in memory.
+
+        Args:
+            image: Numpy array of the RGB frame.
+            description: String stored in the ImageDescription tag.
+
+        Returns:
+            Bytes of the encoded image file.
+        """
+
+        buffer = io.BytesIO()
+        compression = None if self.compression == 'none' else self.compression
+        compression_args = None
+        if self.level is not None:
+            compression_args = {'level': self.level}
+        tile = None
+        if self.tile_size:
+            tile = (self.tile_size, self.tile_size)
+        imwrite(buffer, np.asarray(image), compression=compression,
+                compressionargs=compression_args,
+                predictor=self.predictor or None, tile=tile,
+                maxworkers=self.workers, description=description)
+        return buffer.getvalue()
+
+    def tiled(self, workers, tile_size=TILE_SIZE):
+        """Returns a copy of the codec that writes tiled TIFFs.
+
+        Args:
+            workers: Integer for the number of threads compressing the tiles
+                of a frame at once.
+            tile_size: Integer for the size of the square tiles.
+
+        Returns:
+            TiffCodec object with the same compression settings.
+        """
+
+        return TiffCodec(self.compression, self.level, self.predictor,
+                         tile_size, workers)
+
+    def label(self):
+        """Returns a String describing the codec and its settings."""
+
+        label = f'{self.name}-{self.compression}'
+        if self.level is not None:
+            label += f'-{self.level}'
+        if self.predictor:
+            label += '-predictor'
+        if self.tile_size:
+            label += f'-tiled{self.tile_size}x{self.workers}'
+        return label
+
+
+class PngCodec(OutputCodec):
+    """Encodes output frames as PNG files with OpenCV.
+
+    PNG can be read by every review tool, the description isn't stored.
+
+    Args:
+        level: Integer from 0 to 9 for the zlib compression level, OpenCV's
+            default level is used if not set.
+    """
+
+    name = 'png'
+    extension = '.png'
+
+    # **************************************************************************
+    # Init
+    def __init__(self, level=None):
+        """Inits PngCodec with class attributes."""
+
+        self.level = None
+        if level not in (None, ''):
+            self.level = min(max(int(level), 0), 9)
+
+    # **************************************************************************
+    # Funtions
+    def encode(self, image, description=None):
+        """Encodes an output frame as a PNG file in memory.
+
+        Args:
+            image: Numpy array of the RGB frame.
+            description: Not used, PNG files are written without it.
+
+        Returns:
+            Bytes of the encoded image file.
+        """
+
+        image = np.asarray(image)
+        # OpenCV expects BGR, the swapped frame is kept in the thread's arena.
+        bgr = get_thread_arena().get('png_bgr', image.shape)
+        cv2.cvtColor(image, cv2.COLOR_RGB2BGR, dst=bgr)
+        params = []
+        if self.level is not None:
+            params = [cv2.IMWRITE_PNG_COMPRESSION, self.level]
+        success, data = cv2.imencode(self.extension, bgr, params)
+        if not success:
+            raise OSError('OpenCV could not encode the frame as PNG')
+        return data.tobytes()
+
+    def label(self):
+        """Returns a String describing the codec and its settings."""
+
+        if self.level is None:
+            return self.name
+        return f'{self.name}-{self.level}'
+
+
+class JpegCodec(PngCodec):
+    """Encodes output frames as JPEG files with OpenCV.
+
+    JPEG is lossy so it's meant for proxies and thumbnails rather than the
+    review frames, the description isn't stored.
+
+    Args:
+        level: Integer from 0 to 100 for the JPEG quality, OpenCV's default
+            quality is used if not set.
+    """
+
+    name = 'jpeg'
+    extension = '.jpg'
+    lossless = False
+
+    # **************************************************************************
+    # Init
+    def __init__(self, level=None):
+        """Inits JpegCodec with class attributes."""
+
+        self.level = None
+        if level not in (None, ''):
+            self.level = min(max(int(level), 0), 100)
+
+    # **************************************************************************
+    # Funtions
+    def encode(self, image, description=None):
+        """Encodes an output frame as a JPEG file in memory.
+
+        Args:
+            image: Numpy array of the RGB frame.
+            description: Not used, JPEG files are written without it.
+
+        Returns:
+            Bytes of the encoded image file.
+        """
+
+        image = np.asarray(image)
+        bgr = get_thread_arena().get('jpeg_bgr', image.shape)
+        cv2.cvtColor(image, cv2.COLOR_RGB2BGR, dst=bgr)
+        params = []
+        if self.level is not None:
+            params = [cv2.IMWRITE_JPEG_QUALITY, self.level]
+        success, data = cv2.imencode(self.extension, bgr, params)
+        if not success:
+            raise OSError('OpenCV could not encode the frame as JPEG')
+        return data.tobytes()
+
+
+OUTPUT_CODECS = {codec.name: codec for codec in (TiffCodec, PngCodec,
+                                                 JpegCodec)}
+
+# Codec matching the deflate TIFF files written before codecs could be chosen.
+DEFAULT_CODEC = TiffCodec('deflate')
+
+
+def create_output_codec(name='tiff', compression='deflate', level=None,
+                        predictor=False):
+    """Creates an output codec from the values used in the settings file.
+
+    The codec is checked by encoding a single pixel, so a codec that can't be
+    used, e.g. zstd without imagecodecs installed, falls back to the default
+    before any frames are converted. Lossy codecs such as JPEG are only used
+    for renditions, the review frames fall back to the default.
+
+    Args:
+        name: String for the name of the codec, 'tiff' or 'png'.
+        compression: String for the TIFF compression scheme.
+        level: Integer for the compression level, None for the default.
+        predictor: Boolean for if the TIFF predictor is used.
+
+    Returns:
+        OutputCodec object, the default deflate TIFF codec is used if the
+        settings can't be used.
+    """
+
+    try:
+        if name == TiffCodec.name:
+            codec = TiffCodec(compression, level, predictor)
+        else:
+            codec = OUTPUT_CODECS[name](level)
+        if not codec.lossless:
+            raise ValueError(f'{name} is lossy, it can only be used for '
+                             f'renditions')
+        codec.encode(np.zeros((1, 1, 3), dtype=np.uint8))
+    except (KeyError, ValueError, TypeError, ImportError, OSError) as e:
+        log_txt = (f'Output codec {name} {compression} could not be used, '
+                   f'using {DEFAULT_CODEC.label()}: {e!r}')
+        LOGGER.warning(log_txt)
+        return DEFAULT_CODEC
+    log_txt = f'Output frames will be encoded with {codec.label()}'
+    LOGGER.info(log_txt)
+    return codec
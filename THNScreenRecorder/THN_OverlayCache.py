@@ -0,0 +1,209 @@
+#!/usr/bin/python3
+"""This module loads and prepares the overlay images used on output frames."""
+
+import os
+import threading
+
+import numpy as np
+from PIL import Image
+
+from THNScreenRecorder.THN_FrameArena import get_thread_arena
+from THNScreenRecorder.THN_FileManagement import IMAGE_RES, LOGGER
+
+
+def create_overlay(image, resolution=IMAGE_RES):
+    """Converts an overlay image to premultiplied arrays ready to blend.
+
+    Only the parts of the overlay that aren't fully transparent are kept. The
+    columns of the overlay are split in to strips, e.g. the swatches down
+    either side of the frame, and each strip is cropped to the rows it uses
+    so the empty middle of the frame is never blended.
+
+    The overlay artwork is made for the default output resolution, for any
+    other resolution it's scaled by the same amount as the output frame.
+
+    Args:
+        image: PIL image object of the overlay, it's placed at the top left
+            corner of the output frame.
+        resolution: Tuple for the (width, height) of the output frame.
+
+    Returns:
+        List of Tuples for each strip in the format (left, top, premultiplied
+        colour, inverse alpha), the arrays are uint16 and read-only.
+    """
+
+    if image.mode != 'RGBA':
+        image = image.convert('RGBA')
+    if tuple(resolution) != IMAGE_RES:
+        size = (max(round(image.width * resolution[0] / IMAGE_RES[0]), 1),
+                max(round(image.height * resolution[1] / IMAGE_RES[1]), 1))
+        # Bilinear filtering doesn't ring, so no faint edges are added
+        # around the swatches.
+        image = image.resize(size, Image.BILINEAR)
+    alpha = np.asarray(image.getchannel('A'))[:resolution[1], :resolution[0]]
+    columns = np.flatnonzero(alpha.any(axis=0))
+    if not len(columns):
+        return []
+
+    # Split the used columns in to runs of neighbouring columns.
+    breaks = np.flatnonzero(np.diff(columns) > 1)
+    starts = np.concatenate(([columns[0]], columns[breaks + 1]))
+    ends = np.concatenate((columns[breaks], [columns[-1]])) + 1
+
+    overlay = []
+    for left, right in zip(starts, ends):
+        rows = np.flatnonzero(alpha[:, left:right].any(axis=1))
+        top, bottom = rows[0], rows[-1] + 1
+        rgba = np.asarray(image.crop((left, top, right, bottom)))
+        strip_alpha = rgba[:, :, 3:].astype(np.uint16)
+        # Adding half of 255 rounds the result when the blend is divided.
+        premultiplied = rgba[:, :, :3] * strip_alpha + 127
+        # Matching the colour shape saves broadcasting for every frame.
+        inverse_alpha = np.repeat(255 - strip_alpha, 3, axis=2)
+        premultiplied.flags.writeable = False
+        inverse_alpha.flags.writeable = False
+        overlay.append((int(left), int(top), premultiplied, inverse_alpha))
+    return overlay
+
+
+def blend_overlay(canvas, overlay):
+    """Alpha blends a premultiplied overlay on to the canvas in place.
+
+    The blend uses integer maths, the premultiplied colour plus the canvas
+    scaled by the inverse alpha is at most 255 * 255 + 127 so it fits in
+    uint16. The uint16 working arrays are scratch buffers of the current
+    thread's FrameArena.
+
+    Args:
+        canvas: Numpy array of the RGB output frame.
+        overlay: List of overlay strips created by 'create_overlay'.
+    """
+
+    arena = get_thread_arena()
+    for index, (left, top, premultiplied, inverse_alpha) in enumerate(overlay):
+        height, width = inverse_alpha.shape[:2]
+        region = canvas[top:top + height, left:left + width]
+        blended = arena.get(f'blend_{index}', inverse_alpha.shape, np.uint16)
+        np.multiply(region, inverse_alpha, out=blended)
+        blended += premultiplied
+        blended //= 255
+        region[:] = blended
+
+
+def prepare_slate(image):
+    """Converts the slate template to an RGB PIL image ready to draw on.
+
+    Args:
+        image: PIL image object of the slate template.
+
+    Returns:
+        PIL image object in RGB mode with the pixels already decoded.
+    """
+
+    slate = image.convert('RGB')
+    slate.load()
+    return slate
+
+
+class OverlayCache:
+    """Keeps the overlay images used on output frames loaded between frames.
+
+    The swatches overlay and the slate template are stored next to the tool,
+    often on a network share, so instead of reading and decoding them for
+    every frame they are loaded once and converted to a form that is ready to
+    use. The prepared swatches are read-only so every worker thread can share
+    them. The modified time of a file is checked whenever it's requested and
+    the file is loaded again if the artwork has changed.
+
+    Args:
+        resolution: Tuple for the (width, height) of the output frame.
+    """
+
+    # **************************************************************************
+    # Init
+    def __init__(self, resolution=IMAGE_RES):
+        """Inits OverlayCache with class attributes."""
+
+        self.resolution = resolution
+        # File path as the key with a Tuple of (modified time, prepared file).
+        self.entries = {}
+        self.lock = threading.Lock()
+        self.loads = 0
+
+    # **************************************************************************
+    # Funtions
+    def get(self, path, prepare, key=None):
+        """Returns a prepared overlay file, loading it if it has changed.
+
+        Args:
+            path: String for the full file path of the image.
+            prepare: Callable used to convert the opened PIL image.
+            key: Value used to store the prepared file, the path is used if
+                not set. Files prepared in different ways need their own key.
+
+        Returns:
+            The prepared file, or None if the file can't be found or read.
+        """
+
+        try:
+            modified = os.path.getmtime(path)
+        except (OSError, TypeError):
+            return None
+
+        key = path if key is None else key
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None and entry[0] == modified:
+                return entry[1]
+
+            try:
+                with Image.open(path) as image:
+                    prepared = prepare(image)
+            except OSError as e:
+                log_error = f'Error loading overlay image {path}: {e}'
+                LOGGER.error(log_error)
+                return None
+
+            self.entries[key] = (modified, prepared)
+            self.loads += 1
+            log_txt = f'Loaded overlay image {path}'
+            LOGGER.info(log_txt)
+            return prepared
+
+    def swatches(self, path, resolution=None):
+        """Returns the swatches overlay as strips ready to blend.
+
+        Args:
+            path: String for the full file path of the swatch image.
+            resolution: Tuple for the (width, height) of the output frame,
+                the resolution of the cache is used if not set.
+
+        Returns:
+            List of read-only overlay strips created by 'create_overlay', or
+            None if the swatch image can't be loaded.
+        """
+
+        resolution = tuple(resolution or self.resolution)
+        return self.get(path, lambda image: create_overlay(image, resolution),
+                        key=(path, resolution))
+
+    def slate(self, path):
+        """Returns a copy of the slate template which can be drawn on.
+
+        Args:
+            path: String for the full file path of the slate image.
+
+        Returns:
+            PIL image object, or None if the slate image can't be loaded.
+        """
+
+        template = self.get(path, prepare_slate)
+        if template is None:
+            return None
+        return template.copy()
+
+    def clear(self):
+        """Removes every loaded overlay from the cache."""
+
+        with self.lock:
+            self.entries.clear()
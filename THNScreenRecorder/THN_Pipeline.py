@@ -0,0 +1,238 @@
+#!/usr/bin/python3
+"""This module runs work through a chain of threaded stages."""
+
+import time
+import queue
+import threading
+
+from THNScreenRecorder.THN_FileManagement import LOGGER
+
+
+class PipelineStage:
+    """A single step of a Pipeline run by its own pool of worker threads.
+
+    Each worker takes an item from the bounded input queue of the stage, runs
+    the stage function on it and puts the result on the input queue of the
+    next stage, blocking while that queue is full. The time the workers spend
+    working, waiting for an item and blocked on the next stage is recorded so
+    the busiest stage of the pipeline can be found.
+
+    Args:
+        name: String for the name of the stage used in the statistics.
+        function: Callable run on each item, its return value is passed on to
+            the next stage, returning None ends the item at this stage.
+        workers: Integer for the number of worker threads.
+        queue_size: Integer for the maximum number of items waiting for the
+            stage.
+        release: Callable called with an item dropped after the pipeline is
+            canceled, so buffers it holds can be given back.
+    """
+
+    # **************************************************************************
+    # Init
+    def __init__(self, name, function, workers=1, queue_size=8, release=None):
+        """Inits PipelineStage with class attributes."""
+
+        self.name = name
+        self.function = function
+        self.release = release
+        self.num_workers = max(int(workers), 1)
+        self.input = queue.Queue(maxsize=max(int(queue_size), 1))
+        self.next_stage = None
+        self.on_error = None
+        self.canceled = False
+        self.workers = []
+        self.stats_lock = threading.Lock()
+
+        self.items = 0
+        self.errors = 0
+        self.peak_depth = 0
+        self.busy_time = 0.
+        self.wait_time = 0.
+        self.blocked_time = 0.
+
+    # **************************************************************************
+    # Funtions
+    def start(self):
+        """Starts the worker threads of the stage."""
+
+        for i in range(self.num_workers):
+            worker = threading.Thread(target=self.work,
+                                      name=f'{self.name}_{i}', daemon=True)
+            worker.start()
+            self.workers.append(worker)
+
+    def put(self, item):
+        """Adds an item to the queue of the stage, blocking while it's full."""
+
+        self.input.put(item)
+        self.peak_depth = max(self.peak_depth, self.input.qsize())
+
+    def work(self):
+        """Worker thread loop, runs items until the stage is closed."""
+
+        while True:
+            start = time.perf_counter()
+            item = self.input.get()
+            waited = time.perf_counter() - start
+            if item is None:
+                break
+            if self.canceled:
+                if self.release is not None:
+                    self.release(item)
+                continue
+
+            start = time.perf_counter()
+            try:
+                result = self.function(item)
+            except Exception as e:
+                log_error = f'Error in {self.name} stage of pipeline: {e}'
+                LOGGER.error(log_error)
+                with self.stats_lock:
+                    self.errors += 1
+                if self.on_error is not None:
+                    self.on_error(item)
+                continue
+            busy = time.perf_counter() - start
+
+            blocked = 0.
+            if result is not None and self.next_stage is not None:
+                start = time.perf_counter()
+                self.next_stage.put(result)
+                blocked = time.perf_counter() - start
+
+            with self.stats_lock:
+                self.items += 1
+                self.busy_time += busy
+                self.wait_time += waited
+                self.blocked_time += blocked
+
+    def close(self):
+        """Waits for the queued items to be run and stops the threads."""
+
+        for _ in self.workers:
+            self.input.put(None)
+        for worker in self.workers:
+            worker.join()
+        self.workers = []
+
+    def stats(self, duration):
+        """Returns a Dict of the statistics of the stage.
+
+        Args:
+            duration: Float for the number of seconds the pipeline has been
+                running for, used to find the utilisation of the workers.
+        """
+
+        worker_time = max(duration * self.num_workers, 1e-9)
+        with self.stats_lock:
+            return {'stage': self.name,
+                    'workers': self.num_workers,
+                    'items': self.items,
+                    'errors': self.errors,
+                    'peak_queue': self.peak_depth,
+                    'busy_%': self.busy_time * 100 / worker_time,
+                    'waiting_%': self.wait_time * 100 / worker_time,
+                    'blocked_%': self.blocked_time * 100 / worker_time,
+                    'ms/item': self.busy_time * 1000 / max(self.items, 1)}
+
+
+class Pipeline:
+    """Runs items through a chain of PipelineStages.
+
+    The stages are connected by their bounded queues so a slow stage holds
+    back the stages before it instead of letting items pile up in memory.
+    When the pipeline is closed each stage is drained in turn, from the first
+    to the last, so every item that was put in the pipeline is finished.
+
+    Args:
+        stages: List of PipelineStage objects in the order items run through
+            them.
+        on_error: Callable called with the item if a stage raises an error,
+            the item is then dropped from the pipeline.
+    """
+
+    # **************************************************************************
+    # Init
+    def __init__(self, stages, on_error=None):
+        """Inits Pipeline with class attributes."""
+
+        self.stages = stages
+        for stage, next_stage in zip(stages, stages[1:]):
+            stage.next_stage = next_stage
+        for stage in stages:
+            stage.on_error = on_error
+        self.start_time = None
+        self.end_time = None
+        self.closed = False
+
+    # **************************************************************************
+    # Funtions
+    def start(self):
+        """Starts the worker threads of every stage."""
+
+        self.start_time = time.perf_counter()
+        for stage in self.stages:
+            stage.start()
+
+    def put(self, item):
+        """Adds an item to the first stage, blocking while its queue is full.
+
+        Returns:
+            False if the pipeline has already been closed or canceled.
+        """
+
+        if self.closed or self.stages[0].canceled:
+            return False
+        self.stages[0].put(item)
+        return True
+
+    def cancel(self):
+        """Drops every item still waiting in the pipeline.
+
+        Each dropped item is passed to the release function of the stage it
+        was waiting for.
+        """
+
+        for stage in self.stages:
+            stage.canceled = True
+
+    def close(self):
+        """Finishes the items in the pipeline and stops every stage."""
+
+        if self.closed:
+            return
+        self.closed = True
+        for stage in self.stages:
+            stage.close()
+        self.end_time = time.perf_counter()
+
+    def stats(self):
+        """Returns a List of Dicts of the statistics of each stage."""
+
+        if self.start_time is None:
+            return []
+        duration = (self.end_time or time.perf_counter()) - self.start_time
+        return [stage.stats(duration) for stage in self.stages]
+
+    def bottleneck(self):
+        """Returns the name of the stage with the busiest workers."""
+
+        stats = self.stats()
+        if not stats:
+            return None
+        return max(stats, key=lambda stage: stage['busy_%'])['stage']
+
+    def log_stats(self):
+        """Writes the utilisation of each stage to the logger."""
+
+        for stage in self.stats():
+            log_txt = (f'Pipeline stage {stage["stage"]}: '
+                       f'{stage["workers"]} workers, {stage["items"]} items, '
+                       f'busy {stage["busy_%"]:.0f}%, '
+                       f'waiting {stage["waiting_%"]:.0f}%, '
+                       f'blocked {stage["blocked_%"]:.0f}%, '
+                       f'{stage["ms/item"]:.1f}ms per item')
+            LOGGER.info(log_txt)
+        log_txt = f'Pipeline bottleneck is the {self.bottleneck()} stage'
+        LOGGER.info(log_txt)
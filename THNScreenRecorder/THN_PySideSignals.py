@@ -13,3 +13,4 @@ class PySideSignals(QObject):
     progress = Signal(float)
     record_duration = Signal(str)
     captured_frames = Signal(str)
+    cache_opened = Signal(str)
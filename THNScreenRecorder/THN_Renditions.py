@@ -0,0 +1,270 @@
+#!/usr/bin/python3
+"""This module writes smaller renditions of the output frames next to them.
+
+The review room and the playlist builder load a clip much faster from a half
+resolution proxy and a thumbnail than from the full review frames. Making
+them afterwards would mean reading the whole image sequence back from the
+network, so each rendition is scaled from the composited output frame while
+it's still in memory and written in the same pass, in to a folder of the
+rendition's name inside the clip folder.
+"""
+
+import os
+import copy
+
+import cv2
+import numpy as np
+
+from THNScreenRecorder.THN_FrameArena import get_thread_arena
+from THNScreenRecorder.THN_OutputCodecs import OUTPUT_CODECS, JpegCodec
+from THNScreenRecorder.THN_FileManagement import (LOGGER, create_folder,
+                                                  write_encoded_image,
+                                                  duplicate_image)
+
+# Scale of the output frame and width in pixels of the thumbnail.
+PROXY_SCALE = 0.5
+THUMBNAIL_WIDTH = 320
+
+
+class Rendition:
+    """A smaller copy of the output frames written alongside them.
+
+    Renditions only hold their settings so they can be sent to worker
+    processes and shared between threads.
+
+    Args:
+        name: String for the name of the rendition, also used for the folder
+            it's written to.
+        codec: OutputCodec the rendition is encoded with.
+        scale: Float for the size of the rendition relative to the output
+            frame, used if no width is set.
+        width: Integer for the width in pixels of the rendition, the height
+            keeps the aspect ratio of the output frame.
+        single_frame: Boolean for if only the first frame of the clip is
+            written, e.g. for a thumbnail.
+    """
+
+    # **************************************************************************
+    # Init
+    def __init__(self, name, codec, scale=PROXY_SCALE, width=None,
+                 single_frame=False):
+        """Inits Rendition with class attributes."""
+
+        self.name = name
+        self.codec = codec
+        self.scale = float(scale)
+        self.width = int(width) if width else None
+        self.single_frame = single_frame
+        # Frame written by a single frame rendition, set for each clip.
+        self.frame_number = None
+
+    # **************************************************************************
+    # Funtions
+    def for_clip(self, first_frame):
+        """Returns the rendition used for a clip starting at a frame number.
+
+        Args:
+            first_frame: Integer for the first output frame of the recording.
+
+        Returns:
+            Rendition object, a copy if it only writes a single frame.
+        """
+
+        if not self.single_frame:
+            return self
+        rendition = copy.copy(self)
+        rendition.frame_number = first_frame
+        return rendition
+
+    def wants(self, frame_number):
+        """Returns True if the rendition is written for an output frame."""
+
+        return not self.single_frame or frame_number == self.frame_number
+
+    def get_size(self, width, height):
+        """Returns the size of the rendition of a frame.
+
+        Args:
+            width: Integer for the width of the output frame.
+            height: Integer for the height of the output frame.
+
+        Returns:
+            Tuple for the (width, height) of the rendition, rounded to even
+            sizes so proxies can be used by video encoders.
+        """
+
+        scale = self.width / width if self.width else self.scale
+        scale = min(scale, 1.)
+        return (max(round(width * scale / 2) * 2, 2),
+                max(round(height * scale / 2) * 2, 2))
+
+    def render(self, frame):
+        """Scales an output frame to the size of the rendition.
+
+        The scaled frame is kept in the thread's FrameArena so it should be
+        encoded before the next frame is rendered.
+
+        Args:
+            frame: Numpy array of the RGB output frame.
+
+        Returns:
+            Numpy array of the RGB rendition.
+        """
+
+        height, width = frame.shape[:2]
+        size = self.get_size(width, height)
+        if size == (width, height):
+            return frame
+        scaled = get_thread_arena().get(f'rendition_{self.name}',
+                                        (size[1], size[0], 3))
+        # Renditions are at least half size, the area filter is a box filter
+        # when shrinking by exactly half.
+        return cv2.resize(frame, size, dst=scaled,
+                          interpolation=cv2.INTER_AREA)
+
+    def encode(self, frame, description=None):
+        """Scales and encodes an output frame.
+
+        Args:
+            frame: Numpy array of the RGB output frame.
+            description: String stored in the image file where the format
+                allows it, e.g. the project name.
+
+        Returns:
+            Bytes of the encoded rendition.
+        """
+
+        return self.codec.encode(self.render(frame), description)
+
+    def get_path(self, out_path):
+        """Returns the output path of the rendition's image sequence.
+
+        Args:
+            out_path: String for the output path of the review frames, the
+                clip folder and the clip name.
+
+        Returns:
+            String for the same clip name inside the rendition's folder.
+        """
+
+        folder, clip_name = os.path.split(out_path)
+        return os.path.join(folder, self.name, clip_name)
+
+    def label(self):
+        """Returns a String describing the rendition and its codec."""
+
+        size = f'{self.width}px' if self.width else f'x{self.scale:g}'
+        return f'{self.name} {size} {self.codec.label()}'
+
+
+def create_renditions(names, codec='jpeg', level=None):
+    """Creates the renditions named in the settings file.
+
+    Args:
+        names: String of comma separated rendition names, 'proxy' for a half
+            resolution copy of every frame and 'thumbnail' for a small copy
+            of the first frame of the clip.
+        codec: String for the codec of the renditions, 'jpeg' or 'png'.
+        level: Integer for the JPEG quality or PNG compression level, None
+            for the default.
+
+    Returns:
+        List of Rendition objects, unknown names are skipped.
+    """
+
+    try:
+        rendition_codec = OUTPUT_CODECS[codec](level)
+    except (KeyError, ValueError, TypeError) as e:
+        log_txt = (f'Rendition codec {codec} could not be used, using '
+                   f'jpeg: {e!r}')
+        LOGGER.warning(log_txt)
+        rendition_codec = JpegCodec()
+
+    renditions = []
+    for name in (names or '').split(','):
+        name = name.strip().lower()
+        if not name:
+            continue
+        if name == 'proxy':
+            renditions.append(Rendition(name, rendition_codec, PROXY_SCALE))
+        elif name == 'thumbnail':
+            renditions.append(Rendition(name, rendition_codec,
+                                        width=THUMBNAIL_WIDTH,
+                                        single_frame=True))
+        else:
+            log_txt = f'Unknown rendition {name} will not be written'
+            LOGGER.warning(log_txt)
+    for rendition in renditions:
+        log_txt = f'Writing rendition {rendition.label()}'
+        LOGGER.info(log_txt)
+    return renditions
+
+
+def create_rendition_folders(out_path, renditions):
+    """Creates the folder of each rendition inside the clip folder.
+
+    Args:
+        out_path: String for the output path of the review frames.
+        renditions: List of Rendition objects.
+    """
+
+    for rendition in renditions:
+        create_folder(os.path.dirname(rendition.get_path(out_path)))
+
+
+def write_renditions(frame, out_path, project, frame_number, renditions,
+                     duplicates=()):
+    """Writes each rendition of an output frame and links its duplicates.
+
+    Args:
+        frame: Numpy array or PIL image object of the RGB output frame.
+        out_path: String for the output path of the review frames.
+        project: String for the project used to tag the image files.
+        frame_number: Integer for the output frame number.
+        renditions: List of Rendition objects.
+        duplicates: List of frame numbers to be linked to the frame.
+    """
+
+    frame = np.asarray(frame)
+    for rendition in renditions:
+        if not rendition.wants(frame_number):
+            continue
+        write_encoded_rendition(rendition, rendition.encode(frame, project),
+                                out_path, frame_number, duplicates)
+
+
+def write_encoded_rendition(rendition, data, out_path, frame_number,
+                            duplicates=()):
+    """Writes an encoded rendition and links its duplicates.
+
+    Args:
+        rendition: Rendition object the data was encoded by.
+        data: Bytes of the encoded rendition.
+        out_path: String for the output path of the review frames.
+        frame_number: Integer for the output frame number.
+        duplicates: List of frame numbers to be linked to the frame.
+    """
+
+    path = rendition.get_path(out_path)
+    extension = rendition.codec.extension
+    write_encoded_image(data, path, frame_number, extension)
+    if rendition.single_frame:
+        return
+    for duplicate_number in duplicates:
+        duplicate_image(path, frame_number, duplicate_number, extension)
+
+
+def link_renditions(out_path, frame_number, new_frame_number, renditions):
+    """Links a duplicate frame in each rendition written for every frame.
+
+    Args:
+        out_path: String for the output path of the review frames.
+        frame_number: Integer for the frame number of the existing frame.
+        new_frame_number: Integer for the frame number of the duplicate.
+        renditions: List of Rendition objects.
+    """
+
+    for rendition in renditions:
+        if not rendition.single_frame:
+            duplicate_image(rendition.get_path(out_path), frame_number,
+                            new_frame_number, rendition.codec.extension)
@@ -0,0 +1,251 @@
+#!/usr/bin/python3
+"""This module decides how captured frames are fitted to the output frame.
+
+The output resolution is chosen in the settings file, either as one of the
+presets or as a 'WIDTHxHEIGHT' string. The size, position and filter used to
+fit a frame only depend on the geometry of the capture, so they are worked
+out once in a ScalingPlan and shared by every frame of that geometry, a new
+plan is only made when the captured region changes.
+
+The filter is picked from the scale factor and the resize quality chosen in
+the settings file. Frames shrunk to half or less are area filtered, which is
+a plain box filter when shrinking by exactly half, and the fast quality
+halves the frame with a box filter for as long as it's twice the output size
+instead. The best quality area filters every frame whatever the scale, so
+no pixels are skipped and nothing aliases. Between a half and two thirds
+only the fast quality takes the cheaper bilinear filter, which starts to
+alias there, and for milder reductions the fast and balanced qualities use a
+bilinear or cubic filter.
+"""
+
+import cv2
+
+from THNScreenRecorder.THN_FrameArena import get_thread_arena
+from THNScreenRecorder.THN_FileManagement import (IMAGE_RES, LOGGER,
+                                                  get_scaled_size)
+
+# Output resolutions that can be chosen by name in the settings file.
+RESOLUTION_PRESETS = {
+    'dailies': (1280, 720),
+    'hd': (1920, 1080),
+    'qhd': (2560, 1440),
+    'uhd': (3840, 2160),
+}
+
+# Resize qualities that can be chosen in the settings file.
+RESIZE_FAST = 'fast'
+RESIZE_BALANCED = 'balanced'
+RESIZE_BEST = 'best'
+RESIZE_QUALITIES = (RESIZE_FAST, RESIZE_BALANCED, RESIZE_BEST)
+
+DEFAULT_RESIZE_QUALITY = RESIZE_BEST
+
+# Scale factor at or below which the area filter is used, and the one at or
+# below which the fast quality uses the bilinear filter instead.
+AREA_SCALE = 0.5
+BILINEAR_SCALE = 0.67
+
+# Filter used for a scale factor above BILINEAR_SCALE, the best quality always
+# uses the area filter.
+MILD_INTERPOLATION = {
+    RESIZE_FAST: cv2.INTER_LINEAR,
+    RESIZE_BALANCED: cv2.INTER_CUBIC,
+}
+
+# Plans already made, keyed by the capture geometry and output resolution.
+_plans = {}
+
+
+def get_output_resolution(value, fallback=IMAGE_RES):
+    """Reads the output resolution from the value used in the settings file.
+
+    Args:
+        value: String for the name of a preset, e.g. 'dailies', or a size in
+            the format 'WIDTHxHEIGHT', e.g. '2560x1440'.
+        fallback: Tuple for the resolution used if the value can't be read.
+
+    Returns:
+        Tuple for the (width, height) of the output frames.
+    """
+
+    if value is None:
+        return fallback
+    value = str(value).strip().lower()
+    if value in RESOLUTION_PRESETS:
+        return RESOLUTION_PRESETS[value]
+    try:
+        width, height = (int(size) for size in value.split('x'))
+    except ValueError:
+        width = height = 0
+    # Even sizes keep the frames usable by video encoders.
+    if width < 2 or height < 2 or width % 2 or height % 2:
+        log_txt = (f'Output resolution {value} not recognised, using '
+                   f'{fallback[0]}x{fallback[1]}')
+        LOGGER.warning(log_txt)
+        return fallback
+    return (width, height)
+
+
+def get_resize_quality(value, fallback=DEFAULT_RESIZE_QUALITY):
+    """Reads the resize quality from the value used in the settings file.
+
+    Args:
+        value: String for the quality, 'fast', 'balanced' or 'best'.
+        fallback: String for the quality used if the value can't be read.
+
+    Returns:
+        String for the resize quality.
+    """
+
+    if value is None:
+        return fallback
+    value = str(value).strip().lower()
+    if value not in RESIZE_QUALITIES:
+        log_txt = f'Resize quality {value} not recognised, using {fallback}'
+        LOGGER.warning(log_txt)
+        return fallback
+    return value
+
+
+def get_scaling_plan(width, height, resolution=IMAGE_RES,
+                     quality=DEFAULT_RESIZE_QUALITY):
+    """Returns the plan for fitting frames of a capture geometry.
+
+    Plans are only made once for each geometry, output resolution and
+    quality, every later frame of the same size is given the same plan.
+
+    Args:
+        width: Integer for the width of the captured frames.
+        height: Integer for the height of the captured frames.
+        resolution: Tuple for the (width, height) of the output frames.
+        quality: String for the resize quality, 'fast', 'balanced' or 'best'.
+
+    Returns:
+        ScalingPlan object.
+    """
+
+    key = (width, height, tuple(resolution), quality)
+    plan = _plans.get(key)
+    if plan is None:
+        plan = ScalingPlan(width, height, resolution, quality)
+        _plans[key] = plan
+        if plan.resize:
+            log_txt = (f'Frames of {width}x{height} will be resized to '
+                       f'{plan.size[0]}x{plan.size[1]} with '
+                       f'{plan.describe()}')
+            LOGGER.info(log_txt)
+    return plan
+
+
+class ScalingPlan:
+    """How frames of a single capture geometry fit in the output frame.
+
+    Frames larger than the output resolution are scaled down keeping their
+    aspect ratio, smaller frames are not scaled, and the frame is centred on
+    the output canvas with black bars around it. A frame is scaled in one or
+    more steps, each a size and the OpenCV filter used to reach it.
+
+    Args:
+        width: Integer for the width of the captured frames.
+        height: Integer for the height of the captured frames.
+        resolution: Tuple for the (width, height) of the output frames.
+        quality: String for the resize quality, 'fast', 'balanced' or 'best'.
+    """
+
+    # **************************************************************************
+    # Init
+    def __init__(self, width, height, resolution=IMAGE_RES,
+                 quality=DEFAULT_RESIZE_QUALITY):
+        """Inits ScalingPlan with class attributes."""
+
+        self.source_size = (int(width), int(height))
+        self.resolution = tuple(resolution)
+        self.quality = quality
+        self.size = get_scaled_size(width, height, self.resolution)
+        self.resize = self.size != self.source_size
+        self.left = (self.resolution[0] - self.size[0]) // 2
+        self.top = (self.resolution[1] - self.size[1]) // 2
+        self.steps = self.plan_steps() if self.resize else []
+        # OpenCV pixel interp of the last step.
+        self.interpolation = self.steps[-1][1] if self.steps else None
+
+    # **************************************************************************
+    # Funtions
+    def plan_steps(self):
+        """Picks the filters used to scale a frame from the scale factor.
+
+        Returns:
+            List of Tuples for each step in the format ((width, height),
+            OpenCV interpolation).
+        """
+
+        width, height = self.source_size
+        steps = []
+        # Halving with a box filter is a cheap way to shrink a frame a long
+        # way, the fast quality uses it for as long as it can.
+        while (self.quality == RESIZE_FAST and width >= self.size[0] * 2
+               and height >= self.size[1] * 2):
+            width, height = width // 2, height // 2
+            steps.append(((width, height), cv2.INTER_AREA))
+        if (width, height) != self.size:
+            scale = max(self.size[0] / width, self.size[1] / height)
+            if scale <= AREA_SCALE or self.quality == RESIZE_BEST:
+                interpolation = cv2.INTER_AREA
+            elif scale <= BILINEAR_SCALE:
+                interpolation = (cv2.INTER_LINEAR
+                                 if self.quality == RESIZE_FAST
+                                 else cv2.INTER_AREA)
+            else:
+                interpolation = MILD_INTERPOLATION[self.quality]
+            steps.append((self.size, interpolation))
+        return steps
+
+    def describe(self):
+        """Returns a String naming the filters of each step."""
+
+        names = {cv2.INTER_AREA: 'area', cv2.INTER_LINEAR: 'bilinear',
+                 cv2.INTER_CUBIC: 'bicubic', cv2.INTER_LANCZOS4: 'lanczos'}
+        steps = [f'{names[interpolation]} to {size[0]}x{size[1]}'
+                 for size, interpolation in self.steps]
+        return ', '.join(steps) or 'no resize'
+
+    def scale_frame(self, image, dst=None):
+        """Scales a frame to the size of the plan.
+
+        Steps before the last are written to scratch buffers of the thread's
+        FrameArena so only the last step writes to the destination.
+
+        Args:
+            image: Numpy array of the frame, of the plan's source size.
+            dst: Numpy array the scaled frame is written to, e.g. a region of
+                the canvas, a new array is returned if not set.
+
+        Returns:
+            Numpy array of the scaled frame.
+        """
+
+        if not self.steps:
+            return image
+        arena = get_thread_arena()
+        channels = image.shape[2:]
+        for index, (size, interpolation) in enumerate(self.steps[:-1]):
+            step = arena.get(f'scale_step_{index}',
+                             (size[1], size[0]) + channels)
+            image = cv2.resize(image, size, dst=step,
+                               interpolation=interpolation)
+        size, interpolation = self.steps[-1]
+        return cv2.resize(image, size, dst=dst, interpolation=interpolation)
+
+    def canvas_region(self, canvas):
+        """Returns the view of the canvas the frame is placed in.
+
+        Args:
+            canvas: Numpy array of the RGB output frame.
+
+        Returns:
+            Numpy array viewing the part of the canvas covered by the frame,
+            writing to it changes the canvas.
+        """
+
+        width, height = self.size
+        return canvas[self.top:self.top + height, self.left:self.left + width]
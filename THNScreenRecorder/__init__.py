@@ -3,10 +3,33 @@
 
 from THNScreenRecorder.THN_PySideSignals import PySideSignals
 from THNScreenRecorder.THN_RecordingTimer import RecordingTimer
+from THNScreenRecorder.THN_FrameClock import FrameClock
+from THNScreenRecorder.THN_CacheWriter import CacheWriter
+from THNScreenRecorder.THN_FrameRing import FrameRing
+from THNScreenRecorder.THN_FrameArena import FrameArena, BufferPool
+from THNScreenRecorder.THN_FrameCache import FrameCacheWriter, FrameCacheReader
 from THNScreenRecorder.THN_ImageCapture import ImageCapture
+from THNScreenRecorder.THN_CaptureProcess import (CaptureProcess,
+                                                  start_standby_process)
 from THNScreenRecorder.THN_ProgressBar import ProgressBar
+from THNScreenRecorder.THN_OverlayCache import OverlayCache
+from THNScreenRecorder.THN_ScalingPlan import (ScalingPlan, RESOLUTION_PRESETS,
+                                               RESIZE_QUALITIES,
+                                               get_output_resolution,
+                                               get_resize_quality,
+                                               get_scaling_plan)
+from THNScreenRecorder.THN_OutputCodecs import (OutputCodec, TiffCodec, PngCodec,
+                                                JpegCodec, create_output_codec)
+from THNScreenRecorder.THN_Renditions import (Rendition, create_renditions,
+                                              create_rendition_folders,
+                                              write_renditions)
 from THNScreenRecorder.THN_ImageProcessing import ImageProcessor
+from THNScreenRecorder.THN_ClipUploader import ClipUploader
 from THNScreenRecorder.THN_FileManagement import (
-    SETTINGS_FILE, LOCAL_CACHE, CACHE_FORMAT, IMAGE_RES, CONFIG, LOGGER,
-    write_image, create_folder, get_next_workday, get_config_values,
-    save_config_file, clean_cache_folder, collect_files)
+    SETTINGS_FILE, LOCAL_CACHE, STAGING_FOLDER, CACHE_FORMAT, IMAGE_RES, CONFIG, LOGGER,
+    get_scaled_size, write_image, encode_image, write_encoded_image,
+    duplicate_image, create_folder,
+    get_next_workday,
+    get_config_values, load_settings, get_setting, get_bool_setting,
+    save_config_file,
+    clean_cache_folder, collect_files)
@@ -20,9 +20,12 @@ __author__ = 'Jack Hunter'
 import os
 import sys
 import time
+import uuid
 import ctypes
+import shutil
 import string
 import logging
+import multiprocessing
 
 import psutil
 from hurry.filesize import size
@@ -35,17 +38,24 @@ from PySide6.QtWidgets import (QApplication, QGraphicsOpacityEffect, QSizeGrip,
 
 from THNScreenRecorderUI import Ui_MainWindow
 from THNScreenRecorder import (PySideSignals, RecordingTimer, ImageCapture,
-                               ProgressBar, ImageProcessor, SETTINGS_FILE,
-                               CONFIG, LOGGER, write_image, create_folder,
-                               get_next_workday, get_config_values,
-                               save_config_file, clean_cache_folder,
-                               collect_files)
+                               CaptureProcess, start_standby_process,
+                               ProgressBar, ImageProcessor, FrameCacheReader,
+                               ClipUploader,
+                               OverlayCache, create_output_codec,
+                               create_renditions, create_rendition_folders,
+                               write_renditions,
+                               get_output_resolution, get_resize_quality,
+                               SETTINGS_FILE, STAGING_FOLDER, CONFIG, LOGGER,
+                               write_image,
+                               create_folder, get_next_workday,
+                               get_config_values, load_settings, get_setting,
+                               get_bool_setting, save_config_file,
+                               clean_cache_folder)
 
 USERNAME = str(os.getlogin())
 TOOL_NAME = 'thn_screenrecorder2.0'
 FRAME_RATE = 15
 IMAGE_FORMAT = '.tiff'
-CACHE_FORMAT = '.npy'
 LEGAL_TXT_CHARACTERS = ' _-0123456789'
 
 # File path variables.
@@ -234,14 +244,26 @@ class ScreenRecorderUI(QMainWindow):
         self.border_widgets = self.get_border_widgets()
         self.clip_name = None
         self.output_path = None
+        # Clip folder on the review share a staged clip is uploaded to.
+        self.publish_folder = None
+        # If the output folder was made for the clip, it's removed if the
+        # clip is canceled.
+        self.output_created = False
         self.user = os.getlogin()
         self.progress_bar = None
+        # Slate and swatch images are kept loaded between recordings.
+        self.overlay_cache = OverlayCache()
 
         # Qthread worker objects.
         self.stopwatch_thread = None
         self.processing_started = False
+        self.streaming = False
         self.capture_canceled = False
         self.capture_thead = None
+        self.upload_thread = None
+        # Load the capture process now so a recording starts straight away.
+        if get_bool_setting('capture_settings', 'capture_process'):
+            start_standby_process()
 
         # Private variable for mouse press on UI.
         self.__press_pos = QPoint()
@@ -439,6 +461,10 @@ class ScreenRecorderUI(QMainWindow):
             self.processing_started = False
             # self.image_process_threadpool.clear()
 
+        if self.upload_thread and self.upload_thread.isRunning():
+            LOGGER.info('Canceling upload')
+            self.upload_worker.cancel_upload()
+
     def set_ui(self, recording_state, recording_enable, paused_state, widget_color,
                pause_enable, pause_btn_text, cancel_enable):
         """Changes state or appearance of UI elements.
@@ -614,7 +640,8 @@ class ScreenRecorderUI(QMainWindow):
 
         Once the record button is pressed the position of the UI is read and
         passed to the ImageCapture class which saves frames of the screen to 
-        Numpy binary files (.npy)
+        Numpy binary files (.npy). When the capture process setting is on the
+        frames are grabbed in a child process by CaptureProcess instead.
         """
 
         LOGGER.info('Creating capture thread')
@@ -622,31 +649,55 @@ class ScreenRecorderUI(QMainWindow):
         if self.capture_thead:
             self.capture_worker.cancel_capture()
             self.kill_active_threads(self.capture_thead)        
+            self.capture_worker.release_frame_ring()
 
         w, h, pos = self.get_window_position()
-        self.capture_worker = ImageCapture(w, h, pos, self.clip_name, self.fps)
+        capture_settings = self.get_capture_settings()
+        capture_class = ImageCapture
+        if get_bool_setting('capture_settings', 'capture_process'):
+            capture_class = CaptureProcess
+        self.capture_worker = capture_class(w, h, pos, self.clip_name, self.fps,
+                                            **capture_settings)
         self.capture_thead = self.create_thread(self.capture_worker)
         self.capture_worker.signals.captured_frames.connect(self.start_image_processing)
         self.capture_worker.signals.canceled.connect(clean_cache_folder)
+        self.capture_worker.signals.canceled.connect(self.capture_failed)
+        # Frames can be processed while they are being recorded.
+        if get_bool_setting('processing_settings', 'streaming'):
+            self.capture_worker.signals.cache_opened.connect(
+                self.start_streaming_processing)
         self.capture_thead.start()
 
-    def create_processing_thread(self):
+    def create_processing_thread(self, streaming=False, pause_only=False):
         """Creates and starts a new QThread for the image processing class.
 
         To minimise the UI from hanging or freezing on the main thread a 
         separate thread is created to manage the processing of captured cache
         files.
+
+        Args:
+            streaming: Boolean for if the frames are processed while they are
+                still being recorded, the thread starts at a low priority.
+            pause_only: Boolean for if the streamed frames are only processed
+                while the recording is paused.
         """
 
         self.processing_started = True
+        retime = get_bool_setting('output_settings', 'retime')
+        processing_settings = self.get_processing_settings()
         self.process_worker = ImageProcessor(self.start_frame, self.captured_frames,
                                              self.output_path, self.project,
-                                             SLATE_SWATCHES)
+                                             SLATE_SWATCHES, self.fps, retime,
+                                             self.overlay_cache,
+                                             streaming=streaming,
+                                             pause_only=pause_only,
+                                             **processing_settings)
 
         self.process_thead = self.create_thread(self.process_worker)
         self.process_worker.signals.progress.connect(self.set_progress_bar_perc)
         self.process_worker.signals.finished.connect(self.image_processing_finished)
-        self.process_thead.start()
+        priority = QThread.LowPriority if streaming else QThread.InheritPriority
+        self.process_thead.start(priority)
     
     # **************************************************************************
     # Screen recording
@@ -669,15 +720,102 @@ class ScreenRecorderUI(QMainWindow):
         """Frames per second for recording is read from settings files."""
 
         # Use default fps incase settings file can't be read.
-        self.fps = FRAME_RATE
-        if os.path.exists(SETTINGS_FILE):
-            CONFIG.clear()
-            CONFIG.read(SETTINGS_FILE)
-            try:
-                self.fps = get_config_values('capture_frame_rate', 'frame_rate')
-                self.fps = int(self.fps)
-            except KeyError:
-                self.fps = FRAME_RATE
+        self.fps = get_setting('capture_frame_rate', 'frame_rate', FRAME_RATE)
+
+    def get_capture_settings(self):
+        """Reads the options used by ImageCapture from the settings file.
+
+        Returns:
+            Dict of keyword arguments to be passed to ImageCapture, defaults 
+            are used for anything that can't be read from the settings file.
+        """
+
+        section = 'capture_settings'
+        capture_settings = {
+            'backend': get_setting(section, 'backend', 'mss'),
+            'writers': get_setting(section, 'cache_writers', 2),
+            'queue_size': get_setting(section, 'queue_size', 30),
+            'backpressure': get_setting(section, 'backpressure', 'drop'),
+            'compression': get_setting(section, 'cache_compression', 'none'),
+            'level': get_setting(section, 'compression_level', 1),
+            'delta': get_bool_setting(section, 'cache_delta'),
+            'keyframe_interval': get_setting(section, 'keyframe_interval', 30),
+            'skip_duplicates': get_bool_setting(section, 'skip_duplicates',
+                                                True),
+            'scale_at_capture': (get_setting('output_settings', 'scaling',
+                                             'process') == 'capture'),
+            'ring_size_mb': get_setting(section, 'ring_size_mb', 1024),
+            # Streamed frames are freed while recording so the ring only
+            # needs a few seconds, otherwise it holds as much of the take as
+            # ring_size_mb allows.
+            'ring_seconds': (get_setting(section, 'ring_seconds', 3.)
+                             if get_bool_setting('processing_settings',
+                                                 'streaming') else 0),
+            'resolution': get_output_resolution(
+                get_setting('output_settings', 'resolution')),
+            # Scaling in the capture loop has to keep up with the frame rate.
+            'resize_quality': get_resize_quality(
+                get_setting('output_settings', 'capture_resize_quality'),
+                'balanced'),
+        }
+        return capture_settings
+
+    def get_processing_settings(self):
+        """Reads the options used by ImageProcessor from the settings file.
+
+        Returns:
+            Dict of keyword arguments to be passed to ImageProcessor, defaults
+            are used for anything that can't be read from the settings file.
+        """
+
+        section = 'processing_settings'
+        processing_settings = {
+            'backend': get_setting(section, 'backend', 'threads'),
+            'pool_size': get_setting(section, 'pool_size', 0),
+            'batch_size': get_setting(section, 'batch_size', 8),
+            'max_in_flight': get_setting(section, 'batches_in_flight', 0),
+            'io_threads': get_setting(section, 'io_threads', 4),
+            'stage_queue_size': get_setting(section, 'stage_queue_size', 8),
+            'codec': self.get_output_codec(),
+            'tiled_output': get_setting('output_settings', 'tiled_output',
+                                        'auto'),
+            'tile_size': get_setting('output_settings', 'tile_size', 256),
+            'resolution': get_output_resolution(
+                get_setting('output_settings', 'resolution')),
+            'resize_quality': get_resize_quality(
+                get_setting('output_settings', 'resize_quality')),
+            'renditions': self.get_renditions(),
+        }
+        return processing_settings
+
+    def get_output_codec(self):
+        """Creates the codec used for the output frames from the settings file.
+
+        Returns:
+            OutputCodec object, a deflate TIFF codec is used if the codec in
+            the settings file can't be read or used.
+        """
+
+        section = 'output_settings'
+        return create_output_codec(
+            get_setting(section, 'codec', 'tiff'),
+            get_setting(section, 'compression', 'deflate'),
+            get_setting(section, 'compression_level'),
+            get_bool_setting(section, 'predictor'))
+
+    def get_renditions(self):
+        """Creates the renditions written with the output frames.
+
+        Returns:
+            List of Rendition objects, empty if no renditions are set in the
+            settings file.
+        """
+
+        section = 'output_settings'
+        return create_renditions(
+            get_setting(section, 'renditions', ''),
+            get_setting(section, 'rendition_codec', 'jpeg'),
+            get_setting(section, 'rendition_quality'))
 
     def start_recording(self):
         """Starts the recording process.
@@ -708,6 +846,8 @@ class ScreenRecorderUI(QMainWindow):
         self.create_recording_timer_thread()
         self.is_recording = True
 
+        # The settings file is read once for everything the recording uses.
+        load_settings()
         self.set_frame_rate()
 
         # Create QThread for cature class to execute on.
@@ -757,6 +897,9 @@ class ScreenRecorderUI(QMainWindow):
             new_icon = pause_icon
             w, h, pos = self.get_window_position()
             self.capture_worker.update_position([w, h, pos])
+            # Stop background processing before the capture starts again.
+            if self.streaming:
+                self.process_worker.set_capture_paused(False)
 
             # Set ui back to recording mode
             self.set_recording_ui()
@@ -771,6 +914,20 @@ class ScreenRecorderUI(QMainWindow):
         self.stopwatch_worker.timer_paused = not is_paused
         self.capture_worker.capturing_paused = not is_paused
 
+        if not is_paused:
+            self.start_paused_processing()
+
+    def capture_failed(self):
+        """Returns the UI to idle if the capture ended before it was stopped,
+        e.g. the cache folder could not be created."""
+
+        if not (self.is_recording or self.is_paused):
+            return
+        LOGGER.error('Capture ended before the recording was stopped')
+        self.capture_canceled = True
+        self.stopwatch_worker.timer_running = False
+        self.set_idle_ui()
+
     def stop_recording(self):
         """Stops the recording process.
 
@@ -812,6 +969,7 @@ class ScreenRecorderUI(QMainWindow):
 
         if self.capture_canceled:
             LOGGER.info('Capture was canceled')
+            self.capture_worker.release_frame_ring()
             self.set_idle_ui()
             return
 
@@ -820,13 +978,26 @@ class ScreenRecorderUI(QMainWindow):
         # Add progress bar to UI.
         self.create_progress_bar()
 
-        # Grab all recorded frames from temp folder.
-        self.captured_frames = collect_files(cache_folder, CACHE_FORMAT)
+        # Frames have been processed during the recording, only the rest of
+        # the clip is left.
+        if self.streaming:
+            self.start_t = time.perf_counter()
+            self.process_worker.recording_finished()
+            self.process_thead.setPriority(QThread.NormalPriority)
+            return
+
+        # Open the frame cache of all recorded frames in the temp folder.
+        self.captured_frames = FrameCacheReader(cache_folder)
 
         self.num_frames = len(self.captured_frames)
         if self.num_frames == 0:
             LOGGER.error('No frames captured')
+            # Nothing was processed so there is no clip to upload.
+            self.publish_folder = None
+            self.output_created = False
+            self.start_t = time.perf_counter()
             self.image_processing_finished()
+            return
 
         log_txt = f'{self.num_frames} frames have been captured'
         LOGGER.info(log_txt)
@@ -839,10 +1010,70 @@ class ScreenRecorderUI(QMainWindow):
 
         LOGGER.info('Image processing started')
         self.start_t = time.perf_counter()
-        
+        if not self.prepare_review_output():
+            self.captured_frames.close()
+            self.capture_worker.release_frame_ring()
+            self.set_idle_ui()
+            return
+        self.create_processing_thread()
+
+    def start_streaming_processing(self, cache_folder, pause_only=False):
+        """Starts processing captured frames while still recording.
+
+        The processor reads the frame cache as the capture thread writes to
+        it, once the recording is stopped 'start_image_processing' tells the
+        processor to finish the rest of the clip.
+
+        Args:
+            cache_folder: String for the folder of the frame cache that was
+                opened by the capture thread.
+            pause_only: Boolean for if frames are only processed while the
+                recording is paused.
+        """
+
+        if not self.prepare_review_output():
+            return
+
+        LOGGER.info('Streaming image processing started')
+        self.start_t = time.perf_counter()
+        self.streaming = True
+        self.captured_frames = FrameCacheReader(cache_folder)
+        self.create_processing_thread(streaming=True, pause_only=pause_only)
+
+    def start_paused_processing(self):
+        """Uses the time the recording is paused to process captured frames.
+
+        The first pause of a recording starts a streaming processor that only
+        converts frames while the recording is paused, if the frames aren't
+        already being streamed. Resuming the recording stops the workers
+        before their next frame so the capture isn't slowed down. The review
+        folder and slate are made on that first pause, so it's only done if
+        the process while paused setting is on.
+        """
+
+        if not self.streaming:
+            if not get_bool_setting('processing_settings',
+                                    'process_while_paused'):
+                return
+            self.start_streaming_processing(self.capture_worker.cache,
+                                            pause_only=True)
+            if not self.streaming:
+                return
+        self.process_worker.set_capture_paused(True)
+
+    def prepare_review_output(self):
+        """Creates the output folder and the slate for the clip.
+
+        Returns:
+            False if the output folder could not be created, nothing is
+            written for the clip.
+        """
+
         self.project = self.project_list.currentText()
         self.date = get_next_workday()
         self.output_path = self.create_review_folder(self.date)
+        if not self.output_path:
+            return False
         log_txt = f'Output path is {self.output_path}'
         LOGGER.info(log_txt)
 
@@ -853,20 +1084,32 @@ class ScreenRecorderUI(QMainWindow):
         else:
             self.start_frame = 1
             self.create_slate()
-
-        self.create_processing_thread()
+        return True
 
     def create_slate(self):
         """Creates slate image for the first frame of the image sequence."""
 
-        img_slate = Image.open(SLATE_BG)
+        img_slate = self.overlay_cache.slate(SLATE_BG)
+        if img_slate is None:
+            return
         draw = ImageDraw.Draw(img_slate)
         font = ImageFont.truetype('arial', 46)
         draw.text((910, 314), self.project, (255, 255, 255), font=font)
         draw.text((910, 393), self.clip_name, (255, 255, 255), font=font)
         draw.text((910, 474), self.user, (255, 255, 255), font=font)
         draw.text((910, 553), str(self.date), (255, 255, 255), font=font)
-        write_image(img_slate, self.output_path, self.project)
+        # The slate is laid out for the default resolution.
+        resolution = get_output_resolution(
+            get_setting('output_settings', 'resolution'))
+        if img_slate.size != resolution:
+            img_slate = img_slate.resize(resolution, Image.LANCZOS)
+        write_image(img_slate, self.output_path, self.project,
+                    codec=self.get_output_codec())
+        # Proxies start with the slate like the review frames.
+        renditions = self.get_renditions()
+        create_rendition_folders(self.output_path, renditions)
+        write_renditions(img_slate, self.output_path, self.project, 0,
+                         renditions)
 
     def image_processing_finished(self):
         """Sets variables and UI state back to idle once processing is done."""
@@ -875,10 +1118,71 @@ class ScreenRecorderUI(QMainWindow):
 
         end_t = time.perf_counter()
         duration = end_t - self.start_t
+        if self.streaming:
+            self.num_frames = self.process_worker.num_frames
+            self.streaming = False
         num_frames = self.num_frames
         log_txt = f'Processing {num_frames} frames took {duration:.4f}s total'
         LOGGER.info(log_txt)
 
+        # Release the memory mapped cache so it can be cleaned up.
+        self.captured_frames.close()
+        self.capture_worker.release_frame_ring()
+
+        # The clip is only published once, the next recording sets its own.
+        publish_folder = self.publish_folder
+        output_created = self.output_created
+        self.publish_folder = None
+        self.output_created = False
+        if publish_folder or output_created:
+            canceled = self.process_worker.counter.canceled
+            if publish_folder and not canceled:
+                self.create_upload_thread(publish_folder)
+                return
+            # A canceled clip is never published, and a folder made for it,
+            # e.g. with the slate written on the first pause, is removed.
+            if canceled and output_created:
+                shutil.rmtree(os.path.dirname(self.output_path),
+                              ignore_errors=True)
+
+        self.set_idle_ui()
+
+    # **************************************************************************
+    # Upload to the review share
+    def create_upload_thread(self, publish_folder):
+        """Creates and starts a new QThread to upload the staged clip.
+
+        Frames are written to a local staging folder while they are
+        processed, once the clip is finished ClipUploader copies it to the
+        review share and publishes the clip folder.
+
+        Args:
+            publish_folder: String for the clip folder on the review share.
+        """
+
+        LOGGER.info('Creating upload thread')
+
+        section = 'upload_settings'
+        self.upload_worker = ClipUploader(
+            os.path.dirname(self.output_path), publish_folder,
+            workers=get_setting(section, 'upload_workers', 4),
+            retries=get_setting(section, 'retries', 5),
+            retry_delay=get_setting(section, 'retry_delay', 0.5),
+            version_clips=get_bool_setting(section, 'version_clips'))
+        self.upload_thread = self.create_thread(self.upload_worker)
+        self.upload_worker.signals.progress.connect(self.set_progress_bar_perc)
+        self.upload_worker.signals.finished.connect(self.upload_finished)
+        self.upload_thread.start()
+
+    def upload_finished(self):
+        """Sets the UI back to idle once the upload has finished."""
+
+        LOGGER.info('Upload finished')
+        if (not self.upload_worker.published
+                and not self.upload_worker.canceled.is_set()):
+            error = (f'The clip could not be uploaded to the review folder, '
+                     f'it has been kept in {self.upload_worker.staging_folder}')
+            message_box(error, 'Error', 0x1000)
         self.set_idle_ui()
 
     # **************************************************************************
@@ -888,7 +1192,9 @@ class ScreenRecorderUI(QMainWindow):
         """Creates a folder path using previous information collected.
 
         Once the necessary variables have been created a final folder path can
-        be created for the destination of the converted image files.
+        be created for the destination of the converted image files. When
+        staging is on the frames are written to a local staging folder and
+        the folder on the review share is only created once it's uploaded.
 
         Args:
             date_folder: String for the date to be used in the folder path.
@@ -900,9 +1206,25 @@ class ScreenRecorderUI(QMainWindow):
 
         folder = (f'{self.review_folder}\\{self.date}\\'
                   f'{self.user}\\{self.clip_name}')
-        new_folder = create_folder(folder)
+        self.publish_folder = None
+        if get_bool_setting('upload_settings', 'staging', True):
+            # Checks the share can be reached before anything is recorded.
+            if not create_folder(os.path.dirname(folder)):
+                folder = None
+            else:
+                self.publish_folder = folder
+                # Each recording is staged in its own folder so a clip with
+                # the same name, or one kept after a failed upload, is never
+                # overwritten.
+                stamp = time.strftime('%Y%m%d_%H%M%S')
+                folder = (f'{STAGING_FOLDER}\\{self.clip_name}_{stamp}_'
+                          f'{uuid.uuid4().hex[:8]}')
+        # A clip folder that already exists is never removed on cancel.
+        self.output_created = bool(folder) and not os.path.exists(folder)
+        new_folder = folder and create_folder(folder)
 
         if not new_folder:
+            self.output_created = False
             error = 'Failed to create output folder. Please check the network'
             ctypes.windll.user32.MessageBoxW(0, error, 'Error', 0x1000)
             return
@@ -1039,9 +1361,20 @@ class ScreenRecorderUI(QMainWindow):
             if self.stopwatch_thread:
                 self.stopwatch_worker.timer_running = False
                 self.kill_active_threads(self.stopwatch_thread)
+            if self.processing_started:
+                # Workers read frames from the ring, they are stopped before
+                # it's released.
+                self.process_worker.cancel_processor()
+                self.process_worker.image_process_threadpool.waitForDone()
+                self.kill_active_threads(self.process_thead)
             if self.capture_thead:
                 self.capture_worker.cancel_capture()
                 self.kill_active_threads(self.capture_thead)
+                self.capture_worker.release_frame_ring()
+            if self.upload_thread:
+                # The staged clip is kept if the upload is not finished.
+                self.upload_worker.cancel_upload()
+                self.kill_active_threads(self.upload_thread)
 
             clean_cache_folder()
         except AttributeError as e:
@@ -1092,6 +1425,9 @@ def open_window():
 
 
 if __name__ == "__main__":
+    # Needed for the processing worker processes in a frozen executable.
+    multiprocessing.freeze_support()
+
     # Enable console logger to show errors only.
     set_console_logger(level_input=20)
     enable_output_logger(level_input=20)